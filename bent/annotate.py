@@ -1,9 +1,12 @@
 #!/usr/bin/env python
+import multiprocessing
 import os
 import random
+import shutil
 import string
 from pathlib import Path
 import spacy
+import torch
 from tqdm import tqdm
 import bent.src.utils as utils
 from bent.src.ner import ner
@@ -15,6 +18,119 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.showwarning = utils.ignore_spacy_warning
 
+# Default number of documents whose sentences are inputted together to the
+# NER models when a 'batch_size' is defined (see '_recognize')
+WINDOW_SIZE = 16
+
+# Models loaded by each NER worker process (see '_init_recognize_worker')
+_worker_lang_model = None
+_worker_recognizer = None
+
+
+def _recognize_files(filenames, recognizer, lang_model):
+    """Recognize the entities in the given text files.
+
+    :param filenames: paths of the text files
+    :type filenames: list
+    :param recognizer: the loaded NER pipeline
+    :type recognizer: ner
+    :param lang_model: the loaded spaCy language model
+    :type lang_model: spacy.language.Language
+    :return: doc_objs including the annotated documents, in the same order as
+        'filenames'
+    :rtype: list
+    """
+
+    doc_objs = []
+
+    for filename in filenames:
+        doc_id = Path(filename).stem
+        text = ""
+
+        with open(filename, "r", encoding="utf-8") as input_file:
+            text = input_file.read()
+            input_file.close()
+
+        # Sentence segmentation
+        doc_sentences = utils._sentence_splitter(text, lang_model)
+
+        # Objectify input
+        doc_obj = utils._objectify_ner_input(doc_id, text, doc_sentences)
+        doc_objs.append(doc_obj)
+
+    # Apply NER models to input texts
+    return recognizer.apply_multi(doc_objs)
+
+
+def _init_recognize_worker(ner_model, entity_types, batch_size, num_threads):
+    """Load the spaCy language model and the NER models in a worker process.
+
+    :param num_threads: number of threads used by torch in the worker
+    :type num_threads: int
+    """
+
+    global _worker_lang_model
+    global _worker_recognizer
+
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    torch.set_num_threads(num_threads)
+
+    _worker_lang_model = spacy.load("en_core_sci_lg")
+    _worker_recognizer = ner(
+        ner_model,
+        entity_types,
+        _worker_lang_model.Defaults.stop_words,
+        batch_size=batch_size,
+    )
+
+
+def _recognize_files_worker(filenames):
+    """Recognize the entities in the given text files with the models loaded
+    by the current worker process."""
+
+    return _recognize_files(filenames, _worker_recognizer, _worker_lang_model)
+
+
+def _recognize_texts_worker(texts):
+    """Recognize the entities in the given texts, tuples (doc_id, text), with
+    the models loaded by the current worker process."""
+
+    doc_objs = []
+
+    for doc_id, text in texts:
+        doc_sentences = utils._sentence_splitter(text, _worker_lang_model)
+        doc_objs.append(
+            utils._objectify_ner_input(str(doc_id), text, doc_sentences)
+        )
+
+    return _worker_recognizer.apply_multi(doc_objs)
+
+
+def _create_recognize_pool(ner_model, entity_types, batch_size, num_workers):
+    """Create a pool of worker processes that load the spaCy language model
+    and the NER models once, when they are started, and recognize entities
+    until the pool is closed. The torch threads are split among the workers.
+
+    :param num_workers: number of worker processes
+    :type num_workers: int
+    :return: the pool
+    :rtype: multiprocessing.pool.Pool
+    """
+
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    return multiprocessing.get_context("spawn").Pool(
+        num_workers,
+        initializer=_init_recognize_worker,
+        initargs=(
+            ner_model,
+            list(entity_types),
+            batch_size,
+            num_threads,
+        ),
+    )
+
+
 def _recognize(
     in_dir,
     entity_types,
@@ -22,6 +138,12 @@ def _recognize(
     ner_model,
     return_dataset=False,
     input_tmp=False,
+    batch_size=None,
+    window_size=None,
+    recognizer=None,
+    lang_model=None,
+    num_workers=None,
+    pool=None,
 ):
     """Pipeline to perform Named Entity Recognition. For each input
     document/text it outputs either an annotations file (BRAT format) or a
@@ -33,14 +155,36 @@ def _recognize(
     :param types: the entity types that will be recognized
         :type types: list
     :param out_dir: path to directory where the output of the pipeline will be
-        located, optional. If 'out_dir' == None (deafult) a Dataset object
-        including all documents and respective annotations will be returned
-    :type out_dir: str, defaults to None
+        located. If 'out_dir' == None no annotation files are written (use it
+        along with 'return_dataset')
+    :type out_dir: str
     :param ner_model: the Named Entity Recognition model that will be used,
         defaults to 'pubmedbert'
     :type ner_model: str, optional
     :param input_tmp: indicates if the input is composed of temporary text files.
     :type input_tmp: bool
+    :param batch_size: maximum number of sentences inputted together to each
+        NER model. Defaults to None (each sentence is inputted separately)
+    :type batch_size: int, optional
+    :param window_size: number of documents whose sentences are batched
+        together when a 'batch_size' is defined, which bounds the number of
+        sentences kept in memory. Defaults to None ('WINDOW_SIZE' documents)
+    :type window_size: int, optional
+    :param recognizer: previously loaded NER pipeline. If None (default), the
+        NER models are loaded in this call
+    :type recognizer: ner, optional
+    :param lang_model: previously loaded spaCy language model. If None
+        (default), it is loaded in this call
+    :type lang_model: spacy.language.Language, optional
+    :param num_workers: number of worker processes among which the documents
+        are distributed. Each worker loads its own language model and NER
+        models. Defaults to None (the documents are annotated in the current
+        process)
+    :type num_workers: int, optional
+    :param pool: pool of worker processes with the NER models already loaded
+        (see '_create_recognize_pool'), which is used instead of creating a
+        new one and is not closed. Defaults to None
+    :type pool: multiprocessing.pool.Pool, optional
     :return: dataset (an object including all the input texts along with the
         annotations) if 'out_dir' is None; an annotation file for each inputed
         text if 'out_dir' is different that None
@@ -50,70 +194,111 @@ def _recognize(
     # Disable printing of annoying messages
     os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-    # Spacy language model to segment the inputed texts into sentences
-    lang_model = spacy.load("en_core_sci_lg")
-    stopwords = lang_model.Defaults.stop_words
+    if ner_model != "pubmedbert" and recognizer is None:
+        raise ValueError("Model not implemented!")
 
-    # Load the NER models that will be used
-    recognizer = ner(ner_model, entity_types, stopwords)
+    if recognizer is not None:
+        # The workers use the same configuration as the given recognizer
+        ner_model = recognizer.name
+        batch_size = recognizer.batch_size
 
     # Whether the input is a directory with text files or not
     dataset = Dataset()
 
     assert in_dir is not None, 'Invalid "in_dir"!'
 
-    if recognizer.model_type == "bert":
-        input_files = [
-            f"{in_dir}{filename}" for filename in os.listdir(in_dir)
-        ]
+    input_files = [
+        f"{in_dir}{filename}"
+        for filename in os.listdir(in_dir)
+        if os.path.isfile(f"{in_dir}{filename}")
+    ]
+
+    # Documents are annotated in windows so that the sentences of several
+    # documents are batched together when a 'batch_size' is defined
+    if batch_size is None:
+        window_size = 1
+
+    elif window_size is None:
+        window_size = WINDOW_SIZE
+
+    windows = [
+        input_files[window_start : window_start + window_size]
+        for window_start in range(0, len(input_files), window_size)
+    ]
+
+    own_pool = None
+
+    if pool is None and num_workers is not None and num_workers > 1:
+        # Each worker loads its own models
+        own_pool = _create_recognize_pool(
+            ner_model, entity_types, batch_size, num_workers
+        )
+        pool = own_pool
+
+    if pool is not None:
+        # The windows are returned in the input order
+        windows_docs = pool.imap(_recognize_files_worker, windows)
+
+    else:
+        # Spacy language model to segment the inputed texts into sentences
+        if lang_model is None:
+            lang_model = spacy.load("en_core_sci_lg")
+
+        # Load the NER models that will be used
+        if recognizer is None:
+            recognizer = ner(
+                ner_model,
+                entity_types,
+                lang_model.Defaults.stop_words,
+                batch_size=batch_size,
+            )
 
-        # Recognize entities in each document
-        pbar = tqdm(
-            total=len(input_files),
-            colour="green",
-            desc="Recognizing entities (documents)",
+        windows_docs = (
+            _recognize_files(window_files, recognizer, lang_model)
+            for window_files in windows
         )
 
-        for filename in input_files:
-            doc_id = Path(filename).stem
-            text = ""
-
-            with open(filename, "r", encoding="utf-8") as input_file:
-                text = input_file.read()
-                input_file.close()
-
-            # Sentence segmentation
-            doc_sentences = utils._sentence_splitter(text, lang_model)
-
-            # Objectify input
-            doc_obj = utils._objectify_ner_input(doc_id, text, doc_sentences)
-
-            # Apply NER models to input text
-            doc_entities = recognizer.apply(doc_obj)
-            
-            # Output recognized entities to a file
-            # Prepare output string with annotations
-            doc_annots = utils._prepare_output_from_objects(doc_entities, only_ner=True)
-            
-            out_filename = f"{out_dir}{doc_id}.ann"
-            
-            with open(out_filename, "w", encoding="utf-8") as out_file:
-                out_file.write(doc_annots[:-1])
-                out_file.close()
-
-            del doc_annots
-            del text
-            del doc_sentences
-            del doc_obj
-            del doc_entities
+    # Recognize entities in each document
+    pbar = tqdm(
+        total=len(input_files),
+        colour="green",
+        desc="Recognizing entities (documents)",
+    )
+
+    for docs_entities in windows_docs:
+
+        for doc_entities in docs_entities:
+
+            if out_dir is not None:
+                # Output recognized entities to a file
+                # Prepare output string with annotations
+                doc_annots = utils._prepare_output_from_objects(
+                    doc_entities, only_ner=True
+                )
+
+                out_filename = f"{out_dir}{doc_entities.id}.ann"
+
+                with open(out_filename, "w", encoding="utf-8") as out_file:
+                    out_file.write(doc_annots[:-1])
+                    out_file.close()
+
+                del doc_annots
+
+            if return_dataset:
+                dataset.add_doc(doc_entities)
 
             pbar.update(1)
 
-        pbar.close()
+        del docs_entities
+
+    pbar.close()
+
+    if own_pool is not None:
+        own_pool.close()
+        own_pool.join()
 
     del recognizer
     del lang_model
-    del stopwords
 
     if return_dataset:
         return dataset
@@ -128,6 +313,9 @@ def _link(
     out_dir=None,
     dataset=None,
     return_dataset=False,
+    linker=None,
+    in_memory=False,
+    num_workers=None,
 ):
     """Pipeline to perform Named Entity Linking. For each input
     annotation files with recognized entities it outputs an updated
@@ -164,6 +352,19 @@ def _link(
     :param dataset: dataset (an object including all the input texts along with
         the annotations from the NER stage), defaults to None
     :type dataset: Dataset, optional
+    :param linker: previously loaded NEL pipeline. If None (default), a new
+        one is created and the knowledge base dictionaries are loaded in this
+        call
+    :type linker: nel, optional
+    :param in_memory: if True, the entities in 'dataset' are linked directly,
+        without reading the annotation files in 'ner_dir'. The annotation
+        files (NER+NEL) are only written if 'out_dir' is not None. Defaults to
+        False
+    :type in_memory: bool, optional
+    :param num_workers: number of worker processes that link the entities to
+        the different target knowledge bases concurrently, defaults to None
+        (the knowledge bases are processed sequentially)
+    :type num_workers: int, optional
     :raises ValueError: if 'ner_dir'==None and recognize==False, which means
         that if the NER stage was not performed it is necessary nevertheless
         indicate the directory containing annotation files corresponding to
@@ -171,7 +372,14 @@ def _link(
     """
 
     # Link the recognized/inputted entities to the specified KBs
-    linker = nel(nel_model, run_id)
+    own_linker = linker is None
+
+    if own_linker:
+        linker = nel(nel_model, run_id, num_workers=num_workers)
+
+    else:
+        linker.run_id = run_id
+
     target_kbs = {}
 
     for ent_type in types.keys():
@@ -179,6 +387,22 @@ def _link(
         if types[ent_type] != "":
             target_kbs[ent_type] = types[ent_type]
 
+    if in_memory:
+        linker.apply(target_kbs, documents=dataset.documents)
+
+        if own_linker:
+            linker.close()
+
+        del linker
+
+        if out_dir is not None:
+            utils._write_brat_output(dataset, out_dir)
+
+        if return_dataset:
+            return dataset
+
+        return
+
     if recognize:
         ner_dir = out_dir
 
@@ -192,6 +416,9 @@ def _link(
 
     nel_run_ids = linker.apply(target_kbs, ner_dir=ner_dir)
 
+    if own_linker:
+        linker.close()
+
     del linker
 
     if return_dataset:
@@ -213,6 +440,10 @@ def annotate(
     out_dir=None,
     ner_model="pubmedbert",
     nel_model="reel_nilinker",
+    batch_size=None,
+    window_size=None,
+    in_memory=False,
+    num_workers=None,
 ):
     """Pipeline to annotate text(s) with recognized entities (Named Entity and
     Recognition) to link them to knowledge base concepts (Named Entity Linking).
@@ -264,6 +495,24 @@ def annotate(
     :param nel_model: the Named Entity Linking model that will be used,
         defaults to 'reel_nilinker'
     :type nel_model: str, optional
+    :param batch_size: maximum number of sentences that are inputted together
+        to each NER model in a single forward pass, defaults to None (each
+        sentence is inputted separately)
+    :type batch_size: int, optional
+    :param window_size: number of documents whose sentences are batched
+        together in the NER stage when a 'batch_size' is defined, defaults to
+        None ('WINDOW_SIZE' documents)
+    :type window_size: int, optional
+    :param in_memory: if True and both 'recognize' and 'link' are True, the
+        recognized entities are passed from the NER module to the NEL module
+        in memory, without intermediate annotation files. The annotation files
+        are only written if 'out_dir' is not None. Defaults to False
+    :type in_memory: bool, optional
+    :param num_workers: number of worker processes among which the documents
+        are distributed in the NER stage, each one with its own loaded models,
+        and that link the entities to the different target knowledge bases
+        concurrently in the NEL stage. Defaults to None (a single process)
+    :type num_workers: int, optional
     :raises ValueError: if both 'input_text' and 'in_dir' are None
     :raises ValueError: if both 'recognize' and 'link' are None
     :return: dataset (an object including all the input texts along with the
@@ -332,9 +581,31 @@ def annotate(
     if recognize:
         entity_types = types.keys()
 
-        if out_dir is not None:
+        if in_memory and link:
+            # The recognized entities are kept in the dataset object, which
+            # is passed to the NEL module
+            dataset = _recognize(
+                in_dir,
+                entity_types,
+                None,
+                ner_model,
+                return_dataset=True,
+                input_tmp=input_tmp,
+                batch_size=batch_size,
+                window_size=window_size,
+                num_workers=num_workers,
+            )
+
+        elif out_dir is not None:
             _recognize(
-                in_dir, entity_types, out_dir, ner_model, run_id, input_tmp=input_tmp
+                in_dir,
+                entity_types,
+                out_dir,
+                ner_model,
+                input_tmp=input_tmp,
+                batch_size=batch_size,
+                window_size=window_size,
+                num_workers=num_workers,
             )
 
         else:
@@ -352,6 +623,9 @@ def annotate(
                 ner_model,
                 return_dataset=True,
                 input_tmp=input_tmp,
+                batch_size=batch_size,
+                window_size=window_size,
+                num_workers=num_workers,
             )
 
             if link:
@@ -364,7 +638,25 @@ def annotate(
     # --------------------------------------------------------------------------
     if link:
 
-        if out_dir is not None:
+        if in_memory and recognize:
+            # Annotation files with NER+NEL output will be created in 'out_dir'
+            # only if it is specified
+            dataset = _link(
+                recognize,
+                types,
+                nel_model,
+                run_id,
+                out_dir=out_dir,
+                dataset=dataset,
+                return_dataset=True,
+                in_memory=True,
+                num_workers=num_workers,
+            )
+
+            if out_dir is None:
+                return dataset
+
+        elif out_dir is not None:
             # Annotation files with NER+NEL output will be created in 'out_dir'
             _link(
                 recognize,
@@ -373,6 +665,7 @@ def annotate(
                 run_id,
                 ner_dir=in_dir,
                 out_dir=out_dir,
+                num_workers=num_workers,
             )
 
         else:
@@ -386,6 +679,361 @@ def annotate(
                 dataset=dataset,
                 out_dir=tmp_out_dir,
                 return_dataset=True,
+                num_workers=num_workers,
             )
 
             return dataset
+
+    elif recognize and out_dir is None:
+        return dataset
+
+
+class Annotator:
+    """Long-lived annotation pipeline that loads the language model, the NER
+    models and the knowledge base dictionaries only once, when it is created,
+    and reuses them in every call of 'annotate'. Use it instead of the
+    function 'annotate' when several texts/batches of texts are annotated by
+    the same process (e.g. a web service).
+
+    :param types: types of entities to be recognized along with the respective
+        target knowledge bases (see the function 'annotate')
+    :type types: dict
+    :param link: specifies wether the recognized entities are linked to the
+        target knowledge bases, defaults to False
+    :type link: bool, optional
+    :param ner_model: the Named Entity Recognition model that will be used,
+        defaults to 'pubmedbert'
+    :type ner_model: str, optional
+    :param nel_model: the Named Entity Linking model that will be used,
+        defaults to 'reel_nilinker'
+    :type nel_model: str, optional
+    :param batch_size: maximum number of sentences that are inputted together
+        to each NER model in a single forward pass, defaults to None
+    :type batch_size: int, optional
+    :param in_memory: whether the recognized entities are passed to the NEL
+        module in memory, without intermediate annotation files, defaults to
+        False
+    :type in_memory: bool, optional
+    :param num_workers: number of worker processes that recognize the
+        entities. The workers load the NER models once and are reused in
+        every call until 'close' is called. Defaults to None (the entities
+        are recognized in the current process)
+    :type num_workers: int, optional
+    """
+
+    __slots__ = [
+        "types",
+        "link",
+        "in_memory",
+        "ner_model",
+        "nel_model",
+        "batch_size",
+        "lang_model",
+        "recognizer",
+        "linker",
+        "num_workers",
+        "pool",
+    ]
+
+    def __init__(
+        self,
+        types,
+        link=False,
+        ner_model="pubmedbert",
+        nel_model="reel_nilinker",
+        batch_size=None,
+        in_memory=False,
+        num_workers=None,
+    ):
+        # Disable printing of annoying messages
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+        self.types = types
+        self.link = link
+        self.in_memory = in_memory
+        self.ner_model = ner_model
+        self.nel_model = nel_model
+        self.batch_size = batch_size
+
+        # Spacy language model to segment the inputed texts into sentences
+        self.lang_model = spacy.load("en_core_sci_lg")
+
+        self.num_workers = num_workers
+        self.pool = None
+        self.recognizer = None
+
+        if num_workers is not None and num_workers > 1:
+            # The NER models are only loaded by the workers
+            self.pool = _create_recognize_pool(
+                ner_model, types.keys(), batch_size, num_workers
+            )
+
+        else:
+            # Load the NER models that will be used
+            self.recognizer = ner(
+                ner_model,
+                types.keys(),
+                self.lang_model.Defaults.stop_words,
+                batch_size=batch_size,
+            )
+
+        # Load the dictionaries of the target knowledge bases
+        self.linker = None
+
+        if link:
+            target_kbs = {
+                ent_type: kb for ent_type, kb in types.items() if kb != ""
+            }
+            self.linker = nel(nel_model, None)
+            self.linker.load_kbs(target_kbs)
+
+    def annotate(self, input_text, out_dir=None, window_size=None):
+        """Recognize (and optionally link) the entities in the given text(s)
+        using the models loaded by the annotator.
+
+        :param input_text: text string or list of text strings (each element
+            represinting a different document) to be annotated
+        :type input_text: str or list
+        :param out_dir: path to directory where the output of the pipeline
+            will be located, optional. If 'out_dir' == None (deafult) a Dataset
+            object including all documents and respective annotations will be
+            returned
+        :type out_dir: str, optional
+        :param window_size: number of documents whose sentences are batched
+            together when a 'batch_size' is defined, defaults to None
+            ('WINDOW_SIZE' documents)
+        :type window_size: int, optional
+        :return: dataset (an object including all the input texts along with
+            the annotations, in the input order) if 'out_dir' is None; an
+            annotation file for each inputed text if 'out_dir' is different
+            than None
+        :rtype: Dataset object, text file(s)
+        """
+
+        if out_dir is not None:
+            assert (
+                out_dir[-1:] == "/"
+            ), 'Invalid argument "out_dir": the last character in the directory path must be "/"'
+            os.makedirs(out_dir, exist_ok=True)
+
+        run_id = "".join(
+            random.choices(string.ascii_uppercase + string.digits, k=15)
+        )
+        run_dir = f"{cfg.tmp_dir}{run_id}/"
+        in_dir = f"{run_dir}txt/"
+        os.makedirs(in_dir, exist_ok=True)
+
+        doc_ids = utils._convert_input_files(in_dir=in_dir, input_text=input_text)
+
+        ner_dir = out_dir
+
+        if self.in_memory:
+
+            if self.linker is not None:
+                # The annotation files are only written after the NEL stage
+                ner_dir = None
+
+        elif out_dir is None:
+            ner_dir = f"{run_dir}ann/"
+            os.makedirs(ner_dir, exist_ok=True)
+
+        # ----------------------------------------------------------------------
+        #                           NER
+        # ----------------------------------------------------------------------
+        dataset = _recognize(
+            in_dir,
+            self.types.keys(),
+            ner_dir,
+            self.ner_model,
+            return_dataset=True,
+            input_tmp=True,
+            batch_size=self.batch_size,
+            window_size=window_size,
+            recognizer=self.recognizer,
+            lang_model=self.lang_model,
+            pool=self.pool,
+        )
+
+        # ----------------------------------------------------------------------
+        #                           NEL
+        # ----------------------------------------------------------------------
+        if self.linker is not None:
+            dataset = _link(
+                True,
+                self.types,
+                self.nel_model,
+                run_id,
+                ner_dir=ner_dir,
+                out_dir=out_dir if self.in_memory else ner_dir,
+                dataset=dataset,
+                return_dataset=out_dir is None or self.in_memory,
+                linker=self.linker,
+                in_memory=self.in_memory,
+            )
+
+        # The temporary files of the run are no longer necessary
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+        if out_dir is None:
+            # Keep the order of the input texts
+            ordered_dataset = Dataset()
+            ordered_dataset.add_multi_doc(
+                [
+                    dataset.documents[dataset.doc_index[doc_id]]
+                    for doc_id in doc_ids
+                    if doc_id in dataset.doc_index
+                ]
+            )
+
+            return ordered_dataset
+
+    def _annotate_window(self, window, target_kbs):
+        """Recognize (and optionally link) the entities in a window of
+        documents.
+
+        :param window: tuples (doc_id, text)
+        :type window: list
+        :param target_kbs: the entity types and the respective knowledge bases
+            to where the recognized entities will be linked
+        :type target_kbs: dict
+        :return: doc_objs including the annotated documents
+        :rtype: list
+        """
+
+        doc_objs = []
+
+        if self.pool is not None:
+            # The window is split among the workers, keeping the input order
+            chunk_size = -(-len(window) // self.num_workers)
+            chunks = [
+                window[chunk_start : chunk_start + chunk_size]
+                for chunk_start in range(0, len(window), chunk_size)
+            ]
+
+            for chunk_docs in self.pool.map(_recognize_texts_worker, chunks):
+                doc_objs.extend(chunk_docs)
+
+        else:
+
+            for doc_id, text in window:
+                doc_sentences = utils._sentence_splitter(text, self.lang_model)
+                doc_objs.append(
+                    utils._objectify_ner_input(str(doc_id), text, doc_sentences)
+                )
+
+            doc_objs = self.recognizer.apply_multi(doc_objs)
+
+        if self.linker is not None and target_kbs != {}:
+            run_id = "".join(
+                random.choices(string.ascii_uppercase + string.digits, k=15)
+            )
+            self.linker.run_id = run_id
+            self.linker.apply(target_kbs, documents=doc_objs)
+
+            # The temporary files of the run are no longer necessary
+            shutil.rmtree(f"{cfg.tmp_dir}{run_id}/", ignore_errors=True)
+
+        return doc_objs
+
+    def annotate_stream(self, documents, window_size=100):
+        """Recognize (and optionally link) the entities in the documents of
+        the given iterable, yielding each annotated document as soon as its
+        window is processed. Only a window of documents is kept in memory at
+        any time and no input/output files are written, so it can be used to
+        annotate corpora of arbitrary size.
+
+        :param documents: iterable (e.g. a generator) of tuples
+            (doc_id, text)
+        :type documents: iterable
+        :param window_size: number of documents that are annotated together,
+            defaults to 100
+        :type window_size: int, optional
+        :return: the annotated documents, in the input order
+        :rtype: generator of Document objects
+        """
+
+        target_kbs = {
+            ent_type: kb for ent_type, kb in self.types.items() if kb != ""
+        }
+        window = []
+
+        for doc_id, text in documents:
+            window.append((doc_id, text))
+
+            if len(window) == window_size:
+                yield from self._annotate_window(window, target_kbs)
+
+                window = []
+
+        if window != []:
+            yield from self._annotate_window(window, target_kbs)
+
+    def close(self):
+        """Stop the worker processes of the annotator, if any."""
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        if self.linker is not None:
+            self.linker.close()
+
+
+def annotate_stream(
+    documents,
+    types,
+    link=False,
+    ner_model="pubmedbert",
+    nel_model="reel_nilinker",
+    batch_size=None,
+    window_size=100,
+    num_workers=None,
+):
+    """Pipeline to annotate the documents of an iterable, yielding each
+    annotated document incrementally. The models are loaded once and the
+    memory usage is bounded by 'window_size', regardless of the corpus size.
+
+    :param documents: iterable (e.g. a generator) of tuples (doc_id, text)
+    :type documents: iterable
+    :param types: types of entities to be recognized along with the respective
+        target knowledge bases (see the function 'annotate')
+    :type types: dict
+    :param link: specifies wether the recognized entities are linked to the
+        target knowledge bases, defaults to False
+    :type link: bool, optional
+    :param ner_model: the Named Entity Recognition model that will be used,
+        defaults to 'pubmedbert'
+    :type ner_model: str, optional
+    :param nel_model: the Named Entity Linking model that will be used,
+        defaults to 'reel_nilinker'
+    :type nel_model: str, optional
+    :param batch_size: maximum number of sentences that are inputted together
+        to each NER model in a single forward pass, defaults to None
+    :type batch_size: int, optional
+    :param window_size: number of documents that are annotated together,
+        defaults to 100
+    :type window_size: int, optional
+    :param num_workers: number of worker processes that recognize the
+        entities, defaults to None (the entities are recognized in the
+        current process)
+    :type num_workers: int, optional
+    :return: the annotated documents, in the input order
+    :rtype: generator of Document objects
+    """
+
+    annotator = Annotator(
+        types,
+        link=link,
+        ner_model=ner_model,
+        nel_model=nel_model,
+        batch_size=batch_size,
+        in_memory=True,
+        num_workers=num_workers,
+    )
+
+    try:
+        yield from annotator.annotate_stream(documents, window_size=window_size)
+
+    finally:
+        annotator.close()
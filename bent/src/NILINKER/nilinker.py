@@ -2,7 +2,13 @@
 
 import numpy as np
 import tensorflow as tf
-from bent.src.NILINKER.utils import get_candidates_4_word, get_words_ids_4_entity
+from bent.src.NILINKER.utils import (
+    BATCH_SIZE,
+    get_candidates_4_word,
+    get_input_entity,
+    pad_candidates,
+)
+from bent.src.NILINKER.vocabulary_resolver import load_vocabulary_resolvers
 
 
 class Words2embed(tf.keras.layers.Layer):
@@ -103,6 +109,31 @@ class Attention(tf.keras.layers.Layer):
 
         return attention
 
+    def batch_attention(self, embed_word, embed_opposite_candidates, mask):
+        """Same as 'determine_attention' for a batch of entities, whose
+        candidates are padded to the same length.
+
+        :param embed_word: embeddings of the words, batch_size * dim
+        :type embed_word: tf.Tensor
+        :param embed_opposite_candidates: embeddings of the candidates of the
+            opposite words, batch_size * max_candidates * dim
+        :type embed_opposite_candidates: tf.Tensor
+        :param mask: False for the padding candidates,
+            batch_size * max_candidates
+        :type mask: tf.Tensor
+        :return: attention, batch_size * dim
+        :rtype: tf.Tensor
+        """
+
+        embed_word_align = tf.nn.tanh(tf.matmul(embed_word, self.W_a) + self.b_a)
+        scores = tf.einsum("bkd,bd->bk", embed_opposite_candidates, embed_word_align)
+        scores = tf.where(mask, scores, -1e9 * tf.ones_like(scores))
+        # Words without candidates get a null attention, as in
+        # 'determine_attention'
+        attention = tf.nn.softmax(scores, axis=1) * tf.cast(mask, tf.float32)
+
+        return tf.reduce_sum(attention[:, :, None] * embed_opposite_candidates, axis=1)
+
     def call(self, embed_word_l, embed_word_r, embed_candidates_l, embed_candidates_r):
 
         embed_aggre_word_l = Attention.determine_attention(
@@ -203,6 +234,11 @@ class Nilinker(tf.keras.Model):
         self.embeds_word2id = embeds_words2id
         self.id_to_name = kb_id_to_name
         self.top_k = params[2]
+        self.word_candidates = {}
+        self.partition = wc.partition
+        # Loaded in the first prediction
+        self.wc_resolver = None
+        self.embeds_resolver = None
 
     def call(self, input):
 
@@ -231,9 +267,7 @@ class Nilinker(tf.keras.Model):
             y_pred_ent = tf.nn.softmax(output)
             y_pred_list.append(y_pred_ent)
 
-            candidates_rank = tf.nn.top_k(
-                y_pred_ent, k=self.candidate_num
-            )  # sorted=True)
+            candidates_rank = tf.nn.top_k(y_pred_ent, k=self.top_k)
 
             ent_candidates = list()
 
@@ -271,39 +305,189 @@ class Nilinker(tf.keras.Model):
 
         return output
 
-    def prediction(self, entity_str):
-        """Wrapper function to preprocess the given entity and to input it to
-        the NILINKER model. It returns the top k KB candidates (names and KB
-        ids).
+    @tf.function(
+        input_signature=[
+            tf.TensorSpec(shape=[None], dtype=tf.int32),
+            tf.TensorSpec(shape=[None], dtype=tf.int32),
+            tf.TensorSpec(shape=[None, None], dtype=tf.int32),
+            tf.TensorSpec(shape=[None, None], dtype=tf.bool),
+            tf.TensorSpec(shape=[None, None], dtype=tf.int32),
+            tf.TensorSpec(shape=[None, None], dtype=tf.bool),
+        ]
+    )
+    def batch_call(
+        self, word_l, word_r, candidates_l, mask_l, candidates_r, mask_r
+    ):
+        """Graph-mode forward pass for a batch of entities (same layers as
+        'call'). Returns the ids of the top k candidates of each entity.
         """
 
-        # The first stept is the pre-processing of the inputed entity.
-        # The string has to be converted into the following format:
-        #
-        #              [wc_word_l_id, wc_word_r_id,
-        #               embeds_word_l_id, embeds_word_r_id,
-        #               gold_label_id]
+        # 1st layer: word and candidate embeddings
+        embed_word_l = tf.nn.embedding_lookup(params=self.word_embeds, ids=word_l)
+        embed_word_r = tf.nn.embedding_lookup(params=self.word_embeds, ids=word_r)
+        embed_candidates_l = tf.nn.embedding_lookup(
+            params=self.candidate_embeds, ids=candidates_l
+        )
+        embed_candidates_r = tf.nn.embedding_lookup(
+            params=self.candidate_embeds, ids=candidates_r
+        )
 
-        wc_word_l_id, wc_word_r_id = get_words_ids_4_entity(
-            entity_str, wc_word2id=self.wc_word2id, mode="wc"
+        # 2nd layer: attention
+        embed_aggre_word_l = self.attention_layer.batch_attention(
+            embed_word_l, embed_candidates_r, mask_r
+        )
+        embed_aggre_word_r = self.attention_layer.batch_attention(
+            embed_word_r, embed_candidates_l, mask_l
         )
 
-        embeds_word_l_id, embeds_word_r_id = get_words_ids_4_entity(
-            entity_str, embeds_word2id=self.embeds_word2id, mode="embeds"
+        # 3rd layer: concatenation of word + candidate embeddings
+        phrase_vec = self.phrase_layer(
+            embed_word_r, embed_word_l, embed_aggre_word_r, embed_aggre_word_l
         )
 
-        input_entity = (wc_word_l_id, wc_word_r_id, embeds_word_l_id, embeds_word_r_id)
+        # 4th layer: logits output layer
+        output = self.output_layer(phrase_vec)
 
-        # Now apply NILINKER to predict relevant KB concepts
-        top_candidates = self.predict([input_entity], verbose=0)
+        # 5th layer: the candidates are ranked after the softmax, as in
+        # 'call', since the probabilities rounded to the same value are
+        # ranked by candidate id
+        y_pred = tf.nn.softmax(output)
 
-        output = []
+        return tf.nn.top_k(y_pred, k=min(self.top_k, self.candidate_num)).indices
+
+    def get_input_entity(self, entity_str):
+        """Pre-process the given entity into the input format of NILINKER.
+
+        :param entity_str: the entity text
+        :type entity_str: str
+        :return: input_entity with format (wc_word_l_id, wc_word_r_id,
+            embeds_word_l_id, embeds_word_r_id)
+        :rtype: tuple
+        """
+
+        if self.wc_resolver is None:
+            self.wc_resolver, self.embeds_resolver = load_vocabulary_resolvers(
+                self.partition, self.wc_word2id, self.embeds_word2id
+            )
+
+        return get_input_entity(
+            entity_str,
+            self.wc_word2id,
+            self.embeds_word2id,
+            wc_resolver=self.wc_resolver,
+            embeds_resolver=self.embeds_resolver,
+        )
+
+    def get_padded_candidates(self, wc_word_ids):
+        """Get the candidates of the given WC words padded to the same length.
 
-        for tmp in top_candidates:
+        :param wc_word_ids: the WC word ids
+        :type wc_word_ids: numpy.ndarray
+        :return: candidates and mask (False for the padding), both with shape
+            num_words * max_candidates
+        :rtype: tuple with numpy.ndarray, numpy.ndarray
+        """
+
+        words_candidates = []
+
+        for wc_word_id in wc_word_ids:
+            wc_word_id = int(wc_word_id)
+
+            if wc_word_id not in self.word_candidates:
+                self.word_candidates[wc_word_id] = get_candidates_4_word(
+                    self.first_layer.id2word,
+                    self.first_layer.word2candidates,
+                    wc_word_id=wc_word_id,
+                )
+
+            words_candidates.append(self.word_candidates[wc_word_id])
+
+        return pad_candidates(words_candidates)
+
+    def get_top_candidate_ids(self, entity_strs, batch_size=BATCH_SIZE):
+        """Get the int ids of the top k candidates of each of the given
+        entities with 'batch_call', scoring 'batch_size' entities at a time.
+
+        :param entity_strs: the entity texts
+        :type entity_strs: list
+        :param batch_size: number of entities in each batch, defaults to
+            BATCH_SIZE
+        :type batch_size: int, optional
+        :return: the candidate ids of each entity
+        :rtype: list
+        """
+
+        top_candidate_ids = []
+        num_words = self.word_embeds.shape[0]
+
+        for start in range(0, len(entity_strs), batch_size):
+            input_entities = np.array(
+                [
+                    self.get_input_entity(entity_str)
+                    for entity_str in entity_strs[start : start + batch_size]
+                ],
+                dtype=np.int64,
+            )
+            candidates_l, mask_l = self.get_padded_candidates(input_entities[:, 0])
+            candidates_r, mask_r = self.get_padded_candidates(input_entities[:, 1])
+            # Words outside the embeddings vocabulary get the first embedding
+            embeds_word_ids = input_entities[:, 2:]
+            embeds_word_ids[(embeds_word_ids < 0) | (embeds_word_ids >= num_words)] = 0
+            embeds_word_ids = embeds_word_ids.astype(np.int32)
+
+            top_candidates = self.batch_call(
+                embeds_word_ids[:, 0],
+                embeds_word_ids[:, 1],
+                candidates_l,
+                mask_l,
+                candidates_r,
+                mask_r,
+            ).numpy()
+            top_candidate_ids.extend(top_candidates.tolist())
+
+        return top_candidate_ids
+
+    def batch_prediction(self, entity_strs, batch_size=BATCH_SIZE):
+        """Predict the top k KB candidates (KB ids and names) for each of the
+        given entities, scoring 'batch_size' entities at a time.
+
+        :param entity_strs: the entity texts
+        :type entity_strs: list
+        :param batch_size: number of entities in each batch, defaults to
+            BATCH_SIZE
+        :type batch_size: int, optional
+        :return: output with format [[(kb_id, name)]], with the candidates of
+            each entity
+        :rtype: list
+        """
 
-            for cand in tmp:
-                kb_id = cand[0].decode("utf-8")
-                cand_name = cand[1].decode("utf-8")
-                output.append((kb_id, cand_name))
+        output = []
+
+        for entity_candidates in self.get_top_candidate_ids(
+            entity_strs, batch_size=batch_size
+        ):
+            kb_ids = [self.id2candidate[candidate] for candidate in entity_candidates]
+            output.append(
+                [
+                    (kb_id, self.id_to_name[kb_id])
+                    for kb_id in kb_ids
+                    if kb_id in self.id_to_name
+                ]
+            )
 
         return output
+
+    def prediction(self, entity_str):
+        """Wrapper function to preprocess the given entity and to input it to
+        the NILINKER model. It returns the top k KB candidates (names and KB
+        ids).
+        """
+
+        # The entity string is converted into the following format:
+        #
+        #              [wc_word_l_id, wc_word_r_id,
+        #               embeds_word_l_id, embeds_word_r_id]
+        #
+        # and NILINKER predicts the relevant KB concepts (see
+        # 'batch_prediction')
+        return self.batch_prediction([entity_str])[0]
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+
+import os
+import numpy as np
+from bent.src.NILINKER.utils import (
+    BATCH_SIZE,
+    get_candidates_4_word,
+    get_input_entity,
+    pad_candidates,
+)
+from bent.src.NILINKER.vocabulary_resolver import load_vocabulary_resolvers
+
+# Names of the arrays in the file with the exported weights (see
+# 'predict_nilinker.export_model'). The candidate embeddings are exported to a
+# separate .npy file (see 'get_candidate_embeds_filepath'), which is
+# memory-mapped, but files exported by previous versions include them
+WEIGHT_NAMES = ["W_a", "b_a", "W_c", "b_c", "word_embeds", "candidate_embeds"]
+
+# Number of candidates scored at a time in the output layer, so the memory
+# used by the logits depends on the batch size and not on the number of
+# candidates of the partition
+SCORE_CHUNK_SIZE = 16384
+
+
+def quantize_embeds(embeds, quantization=None):
+    """Convert the candidate embeddings to a smaller type.
+
+    :param embeds: the embeddings
+    :type embeds: numpy.ndarray
+    :param quantization: None (float32), 'float16' or 'int8' (rounded to
+        [-127, 127], with a scale for each embedding), defaults to None
+    :type quantization: str, optional
+    :raises ValueError: if the quantization is not valid
+    :return: quantized embeddings and scales (None if not 'int8')
+    :rtype: tuple with numpy.ndarray, numpy.ndarray
+    """
+
+    if quantization is None:
+        return embeds.astype(np.float32, copy=False), None
+
+    elif quantization == "float16":
+        return embeds.astype(np.float16), None
+
+    elif quantization == "int8":
+        scales = np.abs(embeds).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        quantized = np.rint(embeds / scales[:, None]).astype(np.int8)
+
+        return quantized, scales.astype(np.float32)
+
+    raise ValueError(
+        f"Invalid quantization '{quantization}', must be None, 'float16' or 'int8'"
+    )
+
+
+def get_candidate_embeds_filepath(weights_filepath):
+    """Get the path of the .npy file with the exported candidate embeddings
+    of the model with the given weights file.
+
+    :param weights_filepath: path to the .npz file with the exported weights
+    :type weights_filepath: str
+    :return: path to the .npy file
+    :rtype: str
+    """
+
+    return f"{os.path.splitext(weights_filepath)[0]}_candidate_embeds.npy"
+
+
+def select_top_k(scores, ids, k):
+    """Select the k highest scores of each row, the ties are broken by the
+    lowest id (as 'tf.nn.top_k').
+
+    :param scores: scores with shape num_rows * num_candidates
+    :type scores: numpy.ndarray
+    :param ids: ids of the candidates, with the same shape of 'scores'
+    :type ids: numpy.ndarray
+    :param k: the number of selected candidates
+    :type k: int
+    :return: scores and ids of the selected candidates, sorted by score
+    :rtype: tuple with numpy.ndarray, numpy.ndarray
+    """
+
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        threshold = top_scores.min(axis=1, keepdims=True)
+        num_ties = (scores == threshold).sum(axis=1)
+        num_needed = k - (scores > threshold).sum(axis=1)
+
+        # Rows where argpartition chose between candidates with the same
+        # score
+        for row in np.flatnonzero(num_ties > num_needed):
+            above = np.flatnonzero(scores[row] > threshold[row])
+            ties = np.flatnonzero(scores[row] == threshold[row])
+            ties = ties[np.argsort(ids[row, ties], kind="stable")]
+            top[row] = np.concatenate([above, ties[: num_needed[row]]])
+
+        scores = np.take_along_axis(scores, top, axis=1)
+        ids = np.take_along_axis(ids, top, axis=1)
+
+    order = np.lexsort((ids, -scores), axis=1)
+
+    return (
+        np.take_along_axis(scores, order, axis=1),
+        np.take_along_axis(ids, order, axis=1),
+    )
+
+
+class NumpyNilinker:
+    """Inference-only version of the NILINKER model implemented with NumPy,
+    which uses the weights exported from the trained TensorFlow model. It
+    reproduces the forward pass of 'Nilinker' (attention, phrase vector and
+    output layers) without importing TensorFlow.
+
+    :param weights: the arrays with the names in WEIGHT_NAMES
+    :type weights: dict
+    :param wc: the Word-Concept dictionary of the partition
+    :type wc: WordConcept
+    :param id_to_name: mappings between the KB ids and the concept names
+    :type id_to_name: dict
+    :param embeds_word2id: mappings between the words of the embeddings
+        vocabulary and the respective int ids
+    :type embeds_word2id: dict
+    :param top_k: the number of candidates returned for each entity,
+        defaults to 1
+    :type top_k: int, optional
+    :param quantization: type of the stored candidate embeddings (see
+        'quantize_embeds'), defaults to None
+    :type quantization: str, optional
+    """
+
+    __slots__ = [
+        "W_a",
+        "b_a",
+        "W_c",
+        "b_c",
+        "word_embeds",
+        "candidate_embeds",
+        "candidate_scales",
+        "wc",
+        "id_to_name",
+        "embeds_word2id",
+        "top_k",
+        "word_candidates",
+        "wc_resolver",
+        "embeds_resolver",
+    ]
+
+    def __init__(
+        self, weights, wc, id_to_name, embeds_word2id, top_k=1, quantization=None
+    ):
+
+        self.W_a = weights["W_a"]
+        self.b_a = weights["b_a"]
+        self.W_c = weights["W_c"]
+        self.b_c = weights["b_c"]
+        self.word_embeds = weights["word_embeds"]
+        self.candidate_embeds, self.candidate_scales = quantize_embeds(
+            weights["candidate_embeds"], quantization
+        )
+        self.wc = wc
+        self.id_to_name = id_to_name
+        self.embeds_word2id = embeds_word2id
+        self.top_k = top_k
+        self.word_candidates = {}
+        # Loaded in the first prediction
+        self.wc_resolver = None
+        self.embeds_resolver = None
+
+    @classmethod
+    def load(
+        cls,
+        weights_filepath,
+        wc,
+        id_to_name,
+        embeds_word2id,
+        top_k=1,
+        word_embeds=None,
+        quantization=None,
+    ):
+        """Load the model from the file with the exported weights. The
+        candidate embeddings are memory-mapped from their .npy file (see
+        'get_candidate_embeds_filepath'), so the pages are shared between
+        processes, unless they are quantized.
+
+        :param weights_filepath: path to the .npz file
+        :type weights_filepath: str
+        :param word_embeds: the normalized word embeddings (see
+            'utils.load_word_embeds'), which are not trained. If None
+            (default), the exported ones are used
+        :type word_embeds: numpy.ndarray, optional
+        :return: the model
+        :rtype: NumpyNilinker
+        """
+
+        with np.load(weights_filepath) as weights_file:
+            weights = {
+                name: weights_file[name].astype(np.float32)
+                for name in WEIGHT_NAMES
+                if name in weights_file.files
+                and (name != "word_embeds" or word_embeds is None)
+            }
+
+        if "candidate_embeds" not in weights:
+            weights["candidate_embeds"] = np.load(
+                get_candidate_embeds_filepath(weights_filepath),
+                mmap_mode="r" if quantization is None else None,
+            )
+
+        if word_embeds is not None:
+            # Memory-mapped, so the pages are shared between processes
+            weights["word_embeds"] = word_embeds
+
+        return cls(
+            weights,
+            wc,
+            id_to_name,
+            embeds_word2id,
+            top_k=top_k,
+            quantization=quantization,
+        )
+
+    def get_candidate_embeds(self, candidate_ids):
+        """Get the float32 embeddings of the given candidates.
+
+        :param candidate_ids: the candidate int ids (any shape)
+        :type candidate_ids: numpy.ndarray
+        :return: embeddings with shape candidate_ids.shape * dim
+        :rtype: numpy.ndarray
+        """
+
+        embeds = self.candidate_embeds[candidate_ids].astype(np.float32)
+
+        if self.candidate_scales is not None:
+            embeds *= self.candidate_scales[candidate_ids][..., None]
+
+        return embeds
+
+    def attention(self, embed_word, embed_opposite_candidates, mask):
+        """Same as 'Attention.determine_attention' for a batch of entities,
+        whose candidates are padded to the same length.
+
+        :param embed_word: embeddings of the words, batch_size * dim
+        :type embed_word: numpy.ndarray
+        :param embed_opposite_candidates: embeddings of the candidates of the
+            opposite words, batch_size * max_candidates * dim
+        :type embed_opposite_candidates: numpy.ndarray
+        :param mask: False for the padding candidates,
+            batch_size * max_candidates
+        :type mask: numpy.ndarray
+        :return: attention, batch_size * dim
+        :rtype: numpy.ndarray
+        """
+
+        embed_word_align = np.tanh(embed_word @ self.W_a + self.b_a)
+        scores = np.einsum("bkd,bd->bk", embed_opposite_candidates, embed_word_align)
+        scores = np.where(mask, scores, -np.inf)
+        # Softmax over the candidates of each entity. Words without candidates
+        # get a null attention
+        max_scores = scores.max(axis=1, keepdims=True)
+        max_scores[~np.isfinite(max_scores)] = 0.0
+        attention = np.exp(scores - max_scores)
+        totals = attention.sum(axis=1, keepdims=True)
+        attention /= np.where(totals > 0, totals, 1.0)
+
+        return np.einsum("bk,bkd->bd", attention, embed_opposite_candidates)
+
+    def get_phrase_vec(
+        self, word_l, word_r, candidates_l, mask_l, candidates_r, mask_r
+    ):
+        """First 3 layers of the forward pass for a batch of entities (see
+        'Nilinker.batch_call').
+
+        :return: phrase vectors with shape batch_size * dim
+        :rtype: numpy.ndarray
+        """
+
+        # 1st layer: word and candidate embeddings
+        embed_word_l = self.word_embeds[word_l]
+        embed_word_r = self.word_embeds[word_r]
+        embed_candidates_l = self.get_candidate_embeds(candidates_l)
+        embed_candidates_r = self.get_candidate_embeds(candidates_r)
+
+        # 2nd layer: attention
+        embed_aggre_word_l = self.attention(embed_word_l, embed_candidates_r, mask_r)
+        embed_aggre_word_r = self.attention(embed_word_r, embed_candidates_l, mask_l)
+
+        # 3rd layer: concatenation of word + candidate embeddings
+        embed_words_whole = embed_word_r + embed_word_l
+        embed_candidates_whole = embed_aggre_word_r + embed_aggre_word_l
+        return np.tanh(
+            np.concatenate([embed_words_whole, embed_candidates_whole], axis=1)
+            @ self.W_c
+            + self.b_c
+        )
+
+    def get_top_candidates(self, phrase_vec, top_k):
+        """4th layer (logits output layer) of the forward pass, scoring
+        'SCORE_CHUNK_SIZE' candidates at a time and keeping the top k of each
+        entity.
+
+        :param phrase_vec: phrase vectors with shape batch_size * dim
+        :type phrase_vec: numpy.ndarray
+        :param top_k: the number of candidates
+        :type top_k: int
+        :return: ids of the top k candidates of each entity, sorted by score
+        :rtype: numpy.ndarray
+        """
+
+        num_entities = phrase_vec.shape[0]
+        top_scores = np.zeros((num_entities, 0), dtype=np.float32)
+        top_ids = np.zeros((num_entities, 0), dtype=np.int64)
+
+        for start in range(0, self.candidate_embeds.shape[0], SCORE_CHUNK_SIZE):
+            end = min(start + SCORE_CHUNK_SIZE, self.candidate_embeds.shape[0])
+            scores = phrase_vec @ self.candidate_embeds[start:end].T.astype(
+                np.float32, copy=False
+            )
+
+            if self.candidate_scales is not None:
+                scores *= self.candidate_scales[start:end]
+
+            top_scores, top_ids = select_top_k(
+                np.concatenate([top_scores, scores], axis=1),
+                np.concatenate(
+                    [top_ids, np.broadcast_to(np.arange(start, end), scores.shape)],
+                    axis=1,
+                ),
+                top_k,
+            )
+
+        return top_ids
+
+    def get_input_entity(self, entity_str):
+        """Pre-process the given entity into the input format of NILINKER
+        (see 'Nilinker.get_input_entity').
+        """
+
+        if self.wc_resolver is None:
+            self.wc_resolver, self.embeds_resolver = load_vocabulary_resolvers(
+                self.wc.partition, self.wc.word2id, self.embeds_word2id
+            )
+
+        return get_input_entity(
+            entity_str,
+            self.wc.word2id,
+            self.embeds_word2id,
+            wc_resolver=self.wc_resolver,
+            embeds_resolver=self.embeds_resolver,
+        )
+
+    def get_padded_candidates(self, wc_word_ids):
+        """Get the candidates of the given WC words padded to the same length
+        (see 'Nilinker.get_padded_candidates').
+        """
+
+        words_candidates = []
+
+        for wc_word_id in wc_word_ids:
+            wc_word_id = int(wc_word_id)
+
+            if wc_word_id not in self.word_candidates:
+                self.word_candidates[wc_word_id] = get_candidates_4_word(
+                    self.wc.id2word, self.wc.word2candidates, wc_word_id=wc_word_id
+                )
+
+            words_candidates.append(self.word_candidates[wc_word_id])
+
+        return pad_candidates(words_candidates)
+
+    def batch_prediction(self, entity_strs, batch_size=BATCH_SIZE):
+        """Predict the top k KB candidates (KB ids and names) for each of the
+        given entities (see 'Nilinker.batch_prediction').
+
+        :param entity_strs: the entity texts
+        :type entity_strs: list
+        :param batch_size: number of entities in each batch, defaults to
+            BATCH_SIZE
+        :type batch_size: int, optional
+        :return: output with format [[(kb_id, name)]], with the candidates of
+            each entity
+        :rtype: list
+        """
+
+        output = []
+        num_words = self.word_embeds.shape[0]
+        top_k = min(self.top_k, self.candidate_embeds.shape[0])
+
+        for start in range(0, len(entity_strs), batch_size):
+            input_entities = np.array(
+                [
+                    self.get_input_entity(entity_str)
+                    for entity_str in entity_strs[start : start + batch_size]
+                ],
+                dtype=np.int64,
+            )
+            candidates_l, mask_l = self.get_padded_candidates(input_entities[:, 0])
+            candidates_r, mask_r = self.get_padded_candidates(input_entities[:, 1])
+            # Words outside the embeddings vocabulary get the first embedding
+            embeds_word_ids = input_entities[:, 2:]
+            embeds_word_ids[(embeds_word_ids < 0) | (embeds_word_ids >= num_words)] = 0
+
+            phrase_vec = self.get_phrase_vec(
+                embeds_word_ids[:, 0],
+                embeds_word_ids[:, 1],
+                candidates_l,
+                mask_l,
+                candidates_r,
+                mask_r,
+            )
+
+            for entity_top in self.get_top_candidates(phrase_vec, top_k).tolist():
+                kb_ids = [self.wc.id2candidate[candidate] for candidate in entity_top]
+                output.append(
+                    [
+                        (kb_id, self.id_to_name[kb_id])
+                        for kb_id in kb_ids
+                        if kb_id in self.id_to_name
+                    ]
+                )
+
+        return output
+
+    def prediction(self, entity_str):
+        """Predict the top k KB candidates (KB ids and names) for the given
+        entity.
+
+        :param entity_str: the entity text
+        :type entity_str: str
+        :return: output with format [(kb_id, name)]
+        :rtype: list
+        """
+
+        return self.batch_prediction([entity_str])[0]
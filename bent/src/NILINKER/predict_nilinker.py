@@ -1,12 +1,31 @@
 #!/usr/bin/env python
 
+import os
+import numpy as np
 import bent.src.cfg as cfg
-from bent.src.NILINKER.nilinker import Nilinker
-from bent.src.NILINKER.utils import get_wc_embeds, get_kb_data
+from bent.src.NILINKER.numpy_nilinker import (
+    NumpyNilinker,
+    get_candidate_embeds_filepath,
+)
+from bent.src.NILINKER.utils import (
+    WordConcept,
+    get_kb_data,
+    get_wc_embeds,
+    load_word_embeds,
+)
 
+# Type of the candidate embeddings stored by the NumPy version of NILINKER:
+# None (float32), 'float16' or 'int8' (see 'numpy_nilinker.quantize_embeds').
+# Only applies to the NumPy version, 'load_tf_model' ignores it
+candidate_quantization = None
 
-def load_model(partition, top_k=1):
-    """Prepare the model for later prediction when requested.
+
+def get_model_dir(partition):
+    return f"{cfg.root_path}/data/NILINKER/nilinker_files/{partition}/train/"
+
+
+def load_tf_model(partition, top_k=1):
+    """Prepare the TensorFlow model for later prediction when requested.
 
     :param partition: has value 'medic', 'ctd_chem', 'hp', 'chebi',
         "go_bp", "ctd_anatomy"
@@ -15,11 +34,14 @@ def load_model(partition, top_k=1):
     :rtype: tf.keras.Model() object
     """
 
+    # TensorFlow is only imported if the model is loaded with it
+    from bent.src.NILINKER.nilinker import Nilinker
+
     word_embeds, candidate_embeds, wc, embeds_word2id = get_wc_embeds(partition)
     params = [200, wc.candidate_num, top_k]
     id_to_name = get_kb_data(partition)
 
-    model_dir = f"{cfg.root_path}/data/NILINKER/nilinker_files/{partition}/train/"
+    model_dir = get_model_dir(partition)
 
     model = Nilinker(
         word_embeds, candidate_embeds, params, wc, id_to_name, embeds_word2id
@@ -29,3 +51,88 @@ def load_model(partition, top_k=1):
     model.load_weights(model_dir + "best.h5")
 
     return model
+
+
+def load_model(partition, top_k=1):
+    """Prepare the model for later prediction when requested. If the weights
+    of the model were exported to NumPy (see 'export_model') after the last
+    training, the NumPy version of the model is loaded and TensorFlow is not
+    imported.
+
+    :param partition: has value 'medic', 'ctd_chem', 'hp', 'chebi',
+        "go_bp", "ctd_anatomy"
+    :type partition: str
+    :return: loaded NILINKER model for the specified partition
+    :rtype: NumpyNilinker or tf.keras.Model() object
+    """
+
+    model_dir = get_model_dir(partition)
+    weights_filepath = f"{model_dir}best.npz"
+
+    if os.path.exists(weights_filepath) and (
+        not os.path.exists(f"{model_dir}best.h5")
+        or os.path.getmtime(f"{model_dir}best.h5")
+        <= os.path.getmtime(weights_filepath)
+    ):
+        wc = WordConcept(partition)
+        wc.build()
+        word_embeds, embeds_word2id = load_word_embeds(
+            f"{cfg.root_path}/data/NILINKER/embeddings/{partition}/"
+        )
+
+        return NumpyNilinker.load(
+            weights_filepath,
+            wc,
+            get_kb_data(partition),
+            embeds_word2id,
+            top_k=top_k,
+            word_embeds=word_embeds,
+            quantization=candidate_quantization,
+        )
+
+    return load_tf_model(partition, top_k=top_k)
+
+
+def export_model(partition):
+    """Export the weights of the trained TensorFlow model of the given
+    partition to the file 'best.npz' in the model directory, which is used
+    by 'NumpyNilinker'. The candidate embeddings are exported to the file
+    'best_candidate_embeds.npy', which is memory-mapped.
+
+    :param partition: has value 'medic', 'ctd_chem', 'hp', 'chebi',
+        "go_bp", "ctd_anatomy"
+    :type partition: str
+    """
+
+    model = load_tf_model(partition)
+    weights_filepath = f"{get_model_dir(partition)}best.npz"
+    embeds_filepath = get_candidate_embeds_filepath(weights_filepath)
+
+    # Written to temporary files first, so incomplete files are not loaded
+    with open(f"{embeds_filepath}.tmp", "wb") as embeds_file:
+        np.save(embeds_file, model.candidate_embeds.numpy().astype(np.float32))
+
+    with open(f"{weights_filepath}.tmp", "wb") as weights_file:
+        np.savez(
+            weights_file,
+            W_a=model.attention_layer.W_a.numpy(),
+            b_a=model.attention_layer.b_a.numpy(),
+            W_c=model.phrase_layer.W_c.numpy(),
+            b_c=model.phrase_layer.b_c.numpy(),
+            word_embeds=model.word_embeds.numpy(),
+        )
+
+    os.replace(f"{embeds_filepath}.tmp", embeds_filepath)
+    os.replace(f"{weights_filepath}.tmp", weights_filepath)
+
+
+if __name__ == "__main__":
+    # Export the NILINKER models of the given partitions, e.g.:
+    # python -m bent.src.NILINKER.predict_nilinker medic chebi
+    import sys
+
+    partitions = sys.argv[1:] or ["chebi", "medic", "go_bp", "hp"]
+
+    for partition in partitions:
+        print(f"Exporting {partition} NILINKER model...")
+        export_model(partition)
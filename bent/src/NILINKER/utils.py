@@ -3,7 +3,12 @@
 import bent.src.cfg as cfg
 import orjson as json
 import numpy as np
+import os
 from rapidfuzz import process, fuzz
+from bent.src.dicts.kb.binary_dicts import BinaryDict
+
+# Number of entities scored together in the batched predictions of NILINKER
+BATCH_SIZE = 256
 
 
 class WordConcept:
@@ -117,44 +122,148 @@ class WordConcept:
         self.root_concept_int = root_concept_int
 
 
-def load_word_embeds(embeds_dir):
-    """Load word embeddings from file into a Numpy array and generate dicts
-    with information about each word and respective int ID.
+def parse_embeds_file(embeds_filepath):
+    """Parse a text file with an embedding in each line (a label followed by
+    the components, separated by whitespace).
 
-    :param embeds_filepath: path for the file containing word embeddings
+    :param embeds_filepath: path for the file containing the embeddings
     :type embeds_filepath: str
-    :return: embeds, word2id, id2word
-    :rtype: Numpy array, dict, dict
+    :return: labels, embeds
+    :rtype: list, Numpy array
     """
 
-    embeds, vocabulary = [], []
+    with open(embeds_filepath, "r", encoding="utf-8") as embed_file:
+        lines = [line for line in embed_file.read().splitlines() if line.strip()]
 
-    with open(f"{embeds_dir}word_embeddings.txt", "r", encoding="utf-8") as embed_file:
+    if len(lines) > 1 and len(lines[0].split()) == 2 and len(lines[1].split()) > 2:
+        # Header with the number of embeddings and the dimension
+        lines = lines[1:]
 
-        for line in embed_file.readlines():
-            word = line.split()[0]
-            embed = [float(item) for item in line.split()[1:]]
-            embeds.append(embed)
-            vocabulary.append(word)
+    labels, components = [], []
 
-        embed_file.close()
+    for line in lines:
+        label, embed = line.split(maxsplit=1)
+        labels.append(label)
+        components.append(embed)
 
-    assert len(embeds) == len(vocabulary)
+    # The components of all the embeddings are converted at once
+    embeds = np.fromstring(" ".join(components), sep=" ")
+    embeds = embeds.reshape(len(labels), -1)
 
-    embeds_word2id = {}
+    return labels, embeds
 
-    with open(f"{embeds_dir}word2id.json", "r") as word2id_file:
-        embeds_word2id = json.loads(word2id_file.read())
-        word2id_file.close()
 
-    embeds = np.array(embeds)  # s.astype('float32')
+def normalize_embeds(embeds):
+    """Normalize the embeddings to unit length and convert them to float32,
+    the type used by the model.
+
+    :param embeds: the embeddings
+    :type embeds: Numpy array
+    :return: embeds
+    :rtype: Numpy array
+    """
+
     embeds = embeds / np.sqrt(np.sum(embeds * embeds, axis=1, keepdims=True))
 
+    return embeds.astype(np.float32)
+
+
+def load_converted_embeds(npy_filepath, embeds_filepath):
+    """Load the embeddings converted to the .npy format (see
+    'save_converted_embeds') as a memory-mapped array, so that the pages are
+    shared between processes.
+
+    :param npy_filepath: path for the .npy file
+    :type npy_filepath: str
+    :param embeds_filepath: path for the text file with the embeddings
+    :type embeds_filepath: str
+    :return: embeds or None if the embeddings were not converted or the text
+        file changed after the conversion
+    :rtype: Numpy array
+    """
+
+    if not os.path.exists(npy_filepath) or (
+        os.path.exists(embeds_filepath)
+        and os.path.getmtime(embeds_filepath) > os.path.getmtime(npy_filepath)
+    ):
+        return None
+
+    return np.load(npy_filepath, mmap_mode="r")
+
+
+def save_converted_embeds(embeds, npy_filepath):
+    """Store the embeddings in the .npy format, which is loaded instead of
+    the text file in the next runs.
+
+    :param embeds: the normalized embeddings
+    :type embeds: Numpy array
+    :param npy_filepath: path for the .npy file
+    :type npy_filepath: str
+    """
+
+    try:
+        # Written to a temporary file first, so an incomplete file is not
+        # loaded
+        with open(f"{npy_filepath}.tmp", "wb") as npy_file:
+            np.save(npy_file, embeds)
+
+        os.replace(f"{npy_filepath}.tmp", npy_filepath)
+
+    except OSError:
+        # The embeddings are still used in the current run
+        pass
+
+
+def load_word_embeds(embeds_dir):
+    """Load word embeddings from file into a Numpy array and generate dicts
+    with information about each word and respective int ID. The first time,
+    the embeddings are converted from the text file 'word_embeddings.txt' to
+    'word_embeddings.npy' (normalized, float32), which is memory-mapped in the
+    next runs.
+
+    :param embeds_dir: path to the directory of the word embeddings
+    :type embeds_dir: str
+    :return: embeds, embeds_word2id
+    :rtype: Numpy array, dict
+    """
+
+    npy_filepath = f"{embeds_dir}word_embeddings.npy"
+    embeds_filepath = f"{embeds_dir}word_embeddings.txt"
+    embeds = load_converted_embeds(npy_filepath, embeds_filepath)
+
+    if embeds is None:
+        # The rows follow the order of the file, as the ids in 'word2id.json'
+        _, embeds = parse_embeds_file(embeds_filepath)
+        embeds = normalize_embeds(embeds)
+        save_converted_embeds(embeds, npy_filepath)
+
+    embeds_word2id = load_embeds_word2id(embeds_dir)
+
     return embeds, embeds_word2id
 
 
+def load_embeds_word2id(embeds_dir):
+    """Load the mappings between the words of the embeddings vocabulary and
+    the respective int ids.
+
+    :param embeds_dir: path to the directory of the word embeddings
+    :type embeds_dir: str
+    :return: embeds_word2id
+    :rtype: dict
+    """
+
+    with open(f"{embeds_dir}word2id.json", "r") as word2id_file:
+        embeds_word2id = json.loads(word2id_file.read())
+        word2id_file.close()
+
+    return embeds_word2id
+
+
 def load_candidate_embeds(embeds_filepath, candidate2id):
-    """Load candidate embeddings from file into a Numpy array.
+    """Load candidate embeddings from file into a Numpy array. The first
+    time, the embeddings are converted from the text file to a .npy file with
+    the same name (normalized, float32, a row for each candidate int id),
+    which is memory-mapped in the next runs.
 
     :param embeds_filepath: path for the file containing candidate
         (i.e. KB concepts) embeddings
@@ -165,25 +274,27 @@ def load_candidate_embeds(embeds_filepath, candidate2id):
     :rtype: Numpy array
     """
 
-    embed_dict = {}
+    npy_filepath = f"{os.path.splitext(embeds_filepath)[0]}.npy"
+    embeds = load_converted_embeds(npy_filepath, embeds_filepath)
 
-    with open(embeds_filepath, "r", encoding="utf-8") as embed_file:
-
-        for line in embed_file.readlines():
-            word = line.split()[0]
-            embedding = [float(item) for item in line.split()[1:]]
-            embed_dict[word] = embedding
-
-    embeds = []
+    if embeds is None:
+        # The embeddings are labelled with the candidate int ids
+        labels, embeds = parse_embeds_file(embeds_filepath)
+        labels = np.array(labels, dtype=np.int64)
+        embeds_by_id = np.zeros((labels.max() + 1, embeds.shape[1]), dtype=np.float32)
+        embeds_by_id[labels] = normalize_embeds(embeds)
+        embeds = embeds_by_id
+        save_converted_embeds(embeds, npy_filepath)
 
-    for candidate in candidate2id.keys():
-        candidate_id = candidate2id[candidate]
-        embeds.append(embed_dict[str(candidate_id)])
+    candidate_ids = np.fromiter(
+        candidate2id.values(), dtype=np.int64, count=len(candidate2id)
+    )
 
-    embeds = np.array(embeds)
-    embeds = embeds / np.sqrt(np.sum(embeds * embeds, axis=1, keepdims=True))
+    if np.array_equal(candidate_ids, np.arange(len(embeds))):
+        # Usual case, the candidates are sorted by int id
+        return embeds
 
-    return embeds
+    return embeds[candidate_ids]
 
 
 def get_candidates_4_word(wc_2idword, word2candidates, word_str="", wc_word_id=-1):
@@ -296,7 +407,9 @@ def get_tokens_4_entity(entity_str):
     return tokens
 
 
-def get_words_ids_4_entity(entity_str, wc_word2id={}, embeds_word2id={}, mode=""):
+def get_words_ids_4_entity(
+    entity_str, wc_word2id={}, embeds_word2id={}, mode="", resolver=None
+):
     """Tokenize given entity string and, according with the selected mode,
     return the ids of the words that are part of the entity. If mode 'wc' it
     returns the WC word ids for left and right words, if mode 'embeds' it
@@ -312,6 +425,10 @@ def get_words_ids_4_entity(entity_str, wc_word2id={}, embeds_word2id={}, mode=""
     :param embeds_word2id: mappings between each word in the embeddings
         vocabulary and the respective int ids
     :type embeds_word2id: dict
+    :param resolver: resolver over the vocabulary of the given mode, used to
+        find the most similar words (see 'VocabularyResolver'), defaults to
+        None
+    :type resolver: VocabularyResolver, optional
     :raise ValueError: if the given mode is invalid, mode must be either 'wc'
         or 'embeds'
     :return: word_l_id and word_r_id including the word ids of the left and
@@ -360,6 +477,14 @@ def get_words_ids_4_entity(entity_str, wc_word2id={}, embeds_word2id={}, mode=""
             elif token_count == 2:
                 word_r_id = ids[token]
 
+        elif resolver is not None:
+
+            if token_count == 1:
+                word_l_id = resolver.get_id(token)
+
+            elif token_count == 2:
+                word_r_id = resolver.get_id(token)
+
         else:
             top_match = process.extract(
                 token, ids.keys(), scorer=fuzz.token_sort_ratio, limit=1
@@ -378,6 +503,64 @@ def get_words_ids_4_entity(entity_str, wc_word2id={}, embeds_word2id={}, mode=""
     return word_l_id, word_r_id
 
 
+def get_input_entity(
+    entity_str, wc_word2id, embeds_word2id, wc_resolver=None, embeds_resolver=None
+):
+    """Pre-process the given entity into the input format of NILINKER.
+
+    :param entity_str: the entity text
+    :type entity_str: str
+    :param wc_word2id: mappings between each word in the WC and the
+        respective int ids
+    :type wc_word2id: dict
+    :param embeds_word2id: mappings between each word in the embeddings
+        vocabulary and the respective int ids
+    :type embeds_word2id: dict
+    :param wc_resolver: resolver over the WC words, defaults to None
+    :type wc_resolver: VocabularyResolver, optional
+    :param embeds_resolver: resolver over the words of the embeddings
+        vocabulary, defaults to None
+    :type embeds_resolver: VocabularyResolver, optional
+    :return: input_entity with format (wc_word_l_id, wc_word_r_id,
+        embeds_word_l_id, embeds_word_r_id)
+    :rtype: tuple
+    """
+
+    wc_word_l_id, wc_word_r_id = get_words_ids_4_entity(
+        entity_str, wc_word2id=wc_word2id, mode="wc", resolver=wc_resolver
+    )
+
+    embeds_word_l_id, embeds_word_r_id = get_words_ids_4_entity(
+        entity_str,
+        embeds_word2id=embeds_word2id,
+        mode="embeds",
+        resolver=embeds_resolver,
+    )
+
+    return (wc_word_l_id, wc_word_r_id, embeds_word_l_id, embeds_word_r_id)
+
+
+def pad_candidates(words_candidates):
+    """Pad the candidates of several words to the same length.
+
+    :param words_candidates: the candidates ids of each word
+    :type words_candidates: list
+    :return: candidates and mask (False for the padding), both with shape
+        num_words * max_candidates
+    :rtype: tuple with numpy.ndarray, numpy.ndarray
+    """
+
+    max_candidates = max([len(candidates) for candidates in words_candidates] + [1])
+    candidates = np.zeros((len(words_candidates), max_candidates), dtype=np.int32)
+    mask = np.zeros((len(words_candidates), max_candidates), dtype=bool)
+
+    for pos, word_candidates in enumerate(words_candidates):
+        candidates[pos, : len(word_candidates)] = word_candidates
+        mask[pos, : len(word_candidates)] = True
+
+    return candidates, mask
+
+
 def get_kb_data(partition):
     """Load KB data (concept names, synonyms, IDs, etc) associated with given
     partition into a KnowledgeBase object.
@@ -396,6 +579,16 @@ def get_kb_data(partition):
             f"{cfg.root_path}/data/kbs/dicts/chebi/id_to_name_nilinker.json"
         )
 
+    binary_dir = f"{cfg.root_path}/data/kbs/dicts/{partition}/nilinker_id_to_name_bin"
+
+    if os.path.exists(f"{binary_dir}/meta.json") and (
+        not os.path.exists(source_filename)
+        or os.path.getmtime(source_filename)
+        <= os.path.getmtime(f"{binary_dir}/meta.json")
+    ):
+        # Memory-mapped dictionary with the identifiers already formatted
+        return BinaryDict.load(binary_dir)
+
     with open(source_filename, "r") as in_file:
         id_to_name = json.loads(in_file.read())
         in_file.close()
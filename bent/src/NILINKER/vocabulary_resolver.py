@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import bent.src.cfg as cfg
+from rapidfuzz import process, fuzz
+from bent.src.REEL.candidate_index import load_candidate_index, prepare_string
+
+
+class VocabularyResolver:
+    """Finds the words of a vocabulary (e.g. the Word-Concept dictionary or
+    the embeddings vocabulary) for the tokens of the entities. Tokens outside
+    the vocabulary are resolved to the most similar word, as with
+    'process.extract(token, vocabulary.keys(), scorer=fuzz.token_sort_ratio,
+    limit=1)', but the words are only normalized once (or searched through a
+    'CandidateIndex' for large vocabularies) and each token is only resolved
+    once.
+
+    :param vocabulary: mappings between the words and the respective int ids
+    :type vocabulary: dict
+    :param candidate_index: index over the words of the vocabulary, defaults
+        to None
+    :type candidate_index: CandidateIndex, optional
+    """
+
+    __slots__ = ["vocabulary", "words", "prepared", "candidate_index", "matches"]
+
+    def __init__(self, vocabulary, candidate_index=None):
+
+        self.vocabulary = vocabulary
+        self.words = list(vocabulary.keys())
+        self.prepared = None
+        self.candidate_index = candidate_index
+        self.matches = {}
+
+    @classmethod
+    def load(cls, vocabulary, index_dir, name):
+        """Create the resolver for the given vocabulary, loading (or building
+        and storing) the index over its words if the vocabulary is large.
+
+        :param vocabulary: mappings between the words and the respective int
+            ids
+        :type vocabulary: dict
+        :param index_dir: path to the directory where the index is stored
+        :type index_dir: str
+        :param name: the name of the vocabulary, the index is stored in
+            '<index_dir><name>_index'
+        :type name: str
+        :return: the resolver
+        :rtype: VocabularyResolver
+        """
+
+        resolver = cls(vocabulary)
+        resolver.candidate_index = load_candidate_index(
+            index_dir, name, resolver.words
+        )
+
+        return resolver
+
+    def get_most_similar_word(self, token):
+        """Get the word of the vocabulary most similar to the given token
+        according to 'fuzz.token_sort_ratio'.
+
+        :param token: the token
+        :type token: str
+        :return: the most similar word
+        :rtype: str
+        """
+
+        if self.candidate_index is not None:
+            return self.candidate_index.extract(token, limit=1, exact=True)[0][0]
+
+        token_prepared = prepare_string(token)
+
+        if token_prepared == "":
+            return process.extract(
+                token, self.words, scorer=fuzz.token_sort_ratio, limit=1
+            )[0][0]
+
+        if self.prepared is None:
+            # 'fuzz.token_sort_ratio' compares the normalized strings
+            self.prepared = [prepare_string(word) for word in self.words]
+
+        top_match = process.extractOne(
+            token_prepared, self.prepared, scorer=fuzz.ratio, processor=None
+        )
+
+        return self.words[top_match[2]]
+
+    def resolve(self, token):
+        """Get the given token, if it belongs to the vocabulary, or the most
+        similar word of the vocabulary.
+
+        :param token: the token
+        :type token: str
+        :return: the word of the vocabulary
+        :rtype: str
+        """
+
+        if token in self.vocabulary:
+            return token
+
+        if token not in self.matches:
+            self.matches[token] = self.get_most_similar_word(token)
+
+        return self.matches[token]
+
+    def get_id(self, token):
+        """Get the int id of the word of the vocabulary for the given token
+        (see 'resolve').
+
+        :param token: the token
+        :type token: str
+        :return: the int id
+        :rtype: int
+        """
+
+        return self.vocabulary[self.resolve(token)]
+
+
+def load_vocabulary_resolvers(partition, wc_word2id, embeds_word2id):
+    """Create the resolvers for the Word-Concept (WC) dictionary and for the
+    embeddings vocabulary of a NILINKER partition. The indexes over the
+    vocabularies are stored next to the respective files.
+
+    :param partition: has value 'medic', 'ctd_chem', 'hp', 'chebi', 'go_bp',
+        'ctd_anat'
+    :type partition: str
+    :param wc_word2id: mappings between each word in the WC and the
+        respective int ids
+    :type wc_word2id: dict
+    :param embeds_word2id: mappings between each word in the embeddings
+        vocabulary and the respective int ids
+    :type embeds_word2id: dict
+    :return: wc_resolver, embeds_resolver
+    :rtype: tuple with 2 VocabularyResolver
+    """
+
+    wc_resolver = VocabularyResolver.load(
+        wc_word2id, f"{cfg.root_path}/data/NILINKER/word_concept/", f"wc_{partition}"
+    )
+    embeds_resolver = VocabularyResolver.load(
+        embeds_word2id,
+        f"{cfg.root_path}/data/NILINKER/embeddings/{partition}/",
+        "word2id",
+    )
+
+    return wc_resolver, embeds_resolver
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+import orjson as json
+import sqlite3
+import time
+
+# Maximum number of entries (of all the knowledge bases) stored in the cache.
+# When it is exceeded, the least recently used entries are evicted
+MAX_ENTRIES = 1000000
+
+# Number of new entries kept in memory before being written to the database
+FLUSH_SIZE = 1000
+
+
+class CandidateCache:
+    """Persistent cache of the best matches (candidates) retrieved for the
+    entity texts in a given knowledge base. The entries of all the knowledge
+    bases are stored in a SQLite database (in WAL mode, so several runs can
+    read and write it concurrently) and they are read and written
+    incrementally, one entity text at a time. Inside a run, it is used as
+    the dict {entity_text: candidates} of the given knowledge base.
+
+    :param kb: the knowledge base of the entries
+    :type kb: str
+    :param db_filepath: path to the database file, created if it does not
+        exist
+    :type db_filepath: str
+    :param max_entries: maximum number of entries stored in the database,
+        defaults to MAX_ENTRIES
+    :type max_entries: int, optional
+    """
+
+    __slots__ = [
+        "kb",
+        "max_entries",
+        "connection",
+        "entries",
+        "pending",
+        "used",
+        "missing",
+        "counted",
+        "hits",
+        "misses",
+    ]
+
+    def __init__(self, kb, db_filepath, max_entries=MAX_ENTRIES):
+
+        self.kb = kb
+        self.max_entries = max_entries
+        # Concurrent writers wait for each other instead of failing
+        self.connection = sqlite3.connect(db_filepath, timeout=300)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS candidates ("
+                "kb TEXT NOT NULL, mention TEXT NOT NULL, "
+                "candidates BLOB NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (kb, mention)) WITHOUT ROWID"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS candidates_last_used "
+                "ON candidates (last_used)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "kb TEXT PRIMARY KEY, hits INTEGER NOT NULL, "
+                "misses INTEGER NOT NULL)"
+            )
+
+        # Entries read or added in the current run, new entries that were not
+        # written yet and read entries whose last use was not updated yet
+        self.entries = {}
+        self.pending = {}
+        self.used = set()
+        # Entity texts not found in the database in the current run and
+        # entity texts already counted as a hit or a miss in the current run
+        self.missing = set()
+        self.counted = set()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, mention):
+        """Get the candidates of the given entity text, reading them from the
+        database if they were not used in the current run. Each entity text
+        is counted once per run, as a hit or as a miss, and it is only
+        searched once in the database.
+
+        :param mention: the entity text
+        :type mention: str
+        :return: the candidates or None if the entity text is not cached
+        :rtype: list
+        """
+
+        if mention in self.entries:
+            if mention not in self.counted:
+                self.counted.add(mention)
+                self.hits += 1
+
+            return self.entries[mention]
+
+        if mention in self.missing:
+            return None
+
+        row = self.connection.execute(
+            "SELECT candidates FROM candidates WHERE kb = ? AND mention = ?",
+            (self.kb, mention),
+        ).fetchone()
+        self.counted.add(mention)
+
+        if row is None:
+            self.missing.add(mention)
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+        candidates = json.loads(row[0])
+        self.entries[mention] = candidates
+        self.used.add(mention)
+
+        return candidates
+
+    def __contains__(self, mention):
+        return self.lookup(mention) is not None
+
+    def __getitem__(self, mention):
+        candidates = self.lookup(mention)
+
+        if candidates is None:
+            raise KeyError(mention)
+
+        return candidates
+
+    def __setitem__(self, mention, candidates):
+        self.entries[mention] = candidates
+        self.pending[mention] = candidates
+        self.missing.discard(mention)
+
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def get(self, mention, default=None):
+        candidates = self.lookup(mention)
+
+        if candidates is None:
+            return default
+
+        return candidates
+
+    def flush(self):
+        """Write the new entries and the last use of the read entries to the
+        database and evict the least recently used entries if the cache
+        exceeds the maximum number of entries."""
+
+        now = time.time()
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?)",
+                [
+                    (self.kb, mention, json.dumps(candidates), now)
+                    for mention, candidates in self.pending.items()
+                ],
+            )
+            self.connection.executemany(
+                "UPDATE candidates SET last_used = ? WHERE kb = ? AND mention = ?",
+                [
+                    (now, self.kb, mention)
+                    for mention in self.used
+                    if mention not in self.pending
+                ],
+            )
+            self.connection.execute(
+                "INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT(kb) DO UPDATE "
+                "SET hits = hits + excluded.hits, "
+                "misses = misses + excluded.misses",
+                (self.kb, self.hits, self.misses),
+            )
+
+            excess = (
+                self.connection.execute("SELECT COUNT(*) FROM candidates").fetchone()[0]
+                - self.max_entries
+            )
+
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM candidates WHERE (kb, mention) IN "
+                    "(SELECT kb, mention FROM candidates "
+                    "ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+        self.pending = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def import_json(self, cache_filepath):
+        """Import the entries of a JSON candidates cache of the given knowledge
+        base (format of previous versions). Entries already in the database
+        are kept.
+
+        :param cache_filepath: path to the JSON file
+        :type cache_filepath: str
+        """
+
+        with open(cache_filepath, "rb") as cache_file:
+            kb_cache = json.loads(cache_file.read())
+            cache_file.close()
+
+        with self.connection:
+            # Imported entries are the first candidates for eviction
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO candidates VALUES (?, ?, ?, 0)",
+                [
+                    (self.kb, mention, json.dumps(candidates))
+                    for mention, candidates in kb_cache.items()
+                ],
+            )
+
+    def stats(self):
+        """Get the number of entries of the knowledge base and the number of
+        cache hits and misses of all the runs.
+
+        :return: stats with format {'entries': <int>, 'hits': <int>,
+            'misses': <int>}
+        :rtype: dict
+        """
+
+        entries = self.connection.execute(
+            "SELECT COUNT(*) FROM candidates WHERE kb = ?", (self.kb,)
+        ).fetchone()[0]
+        row = self.connection.execute(
+            "SELECT hits, misses FROM stats WHERE kb = ?", (self.kb,)
+        ).fetchone()
+
+        if row is None:
+            row = (0, 0)
+
+        return {
+            "entries": entries,
+            "hits": row[0] + self.hits,
+            "misses": row[1] + self.misses,
+        }
+
+    def close(self):
+        """Write the pending changes and close the database."""
+
+        self.flush()
+        self.connection.close()
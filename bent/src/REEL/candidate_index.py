@@ -0,0 +1,525 @@
+#!/usr/bin/env python
+import os
+import zlib
+from array import array
+from collections.abc import Sequence
+import numpy as np
+from rapidfuzz import process, fuzz
+from rapidfuzz.utils import default_process
+from bent.src.dicts.kb.binary_dicts import StringArray
+
+# Minimum number of strings of a knowledge base dictionary for which the
+# index is used in the candidate generation (below it, the strings are
+# directly compared with the entity text)
+MIN_INDEX_SIZE = 50000
+
+# Number of strings in the shortlist relative to the requested number of
+# matches (the shortlist includes at least 'MIN_SHORTLIST_SIZE' strings)
+SHORTLIST_FACTOR = 50
+MIN_SHORTLIST_SIZE = 100
+
+# Trigrams included in more than this fraction of the strings are not used to
+# build the shortlist
+MAX_POSTING_FRACTION = 0.1
+
+# Maximum number of occurrences of a trigram in a string stored in the index
+MAX_GRAM_COUNT = np.iinfo(np.uint16).max
+
+
+def prepare_string(text):
+    """Normalize a string in the same way that 'process.extract' (with the
+    default processor) and 'fuzz.token_sort_ratio' do before comparing
+    strings: lowercase, non-alphanumeric characters replaced by whitespace
+    and sorted tokens.
+
+    :param text: the string to normalize
+    :type text: str
+    :return: the normalized string
+    :rtype: str
+    """
+
+    return " ".join(sorted(default_process(text).split()))
+
+
+def get_trigram_counts(prepared):
+    """Count the (hashed) character trigrams of a normalized string, padded
+    with a whitespace in each side. A string with length l has l trigrams.
+
+    :param prepared: normalized string (see 'prepare_string')
+    :type prepared: str
+    :return: the number of occurrences of each trigram hash
+    :rtype: dict
+    """
+
+    padded = f" {prepared} "
+    counts = {}
+
+    for i in range(len(padded) - 2):
+        gram = zlib.crc32(padded[i : i + 3].encode("utf-8"))
+        counts[gram] = counts.get(gram, 0) + 1
+
+    return counts
+
+
+def get_max_scores(query_len, lengths, common):
+    """Get an upper bound of the 'fuzz.ratio' score between a normalized
+    query and normalized strings, given an upper bound of the number of
+    trigrams (counted with repetitions) that each string shares with the
+    query.
+
+    The score between two strings with lengths l1 and l2 is
+    200 * lcs / (l1 + l2), where lcs is the length of their longest common
+    subsequence, and turning one string into the other takes l1 - lcs
+    deletions and l2 - lcs insertions. A deletion changes at most 3 trigrams
+    of the string and an insertion at most 2, so at least
+    l1 - 3 * (l1 - lcs) - 2 * (l2 - lcs) trigrams are shared, i.e.
+    lcs <= (2 * (l1 + l2) + c) / 5 for strings sharing c trigrams.
+
+    :param query_len: length of the normalized query
+    :type query_len: int
+    :param lengths: lengths of the normalized strings
+    :type lengths: numpy.ndarray
+    :param common: upper bound of the trigrams shared by each string and the
+        query
+    :type common: numpy.ndarray
+    :return: the upper bounds of the scores
+    :rtype: numpy.ndarray
+    """
+
+    lengths = np.asarray(lengths, dtype=np.float64)
+    total = lengths + query_len
+    max_lcs = np.minimum(
+        np.minimum(lengths, query_len), np.floor((2 * total + common) / 5)
+    )
+
+    return 200 * max_lcs / total
+
+
+def get_fingerprint(choices):
+    """Get a fingerprint of the given strings to check if a stored index
+    corresponds to them.
+
+    :param choices: the indexed strings
+    :type choices: list or StringArray
+    :return: fingerprint with the number of strings and the CRC32 checksum
+    :rtype: numpy.ndarray
+    """
+
+    checksum = 0
+
+    if isinstance(choices, StringArray):
+        # The buffer already includes each string followed by a newline
+        checksum = zlib.crc32(choices.blob)
+
+    else:
+
+        for choice in choices:
+            checksum = zlib.crc32(choice.encode("utf-8") + b"\n", checksum)
+
+    return np.array([len(choices), checksum], dtype=np.int64)
+
+
+class CandidateIndex:
+    """Character trigram index over the strings (concept names or synonyms)
+    of a knowledge base, retrieving the top matches of a query according to
+    'fuzz.token_sort_ratio' without comparing it with every string. Only the
+    shortlist of strings sharing more trigrams with the query is scored. In
+    the exact mode, the k-th best score of the shortlist is also a threshold
+    and the remaining strings whose number of shared trigrams and length
+    allow them to reach it (see 'get_max_scores') are scored, so the matches
+    are the same of 'process.extract'."""
+
+    __slots__ = [
+        "choices",
+        "strings",
+        "lengths",
+        "order",
+        "gram_keys",
+        "gram_indptr",
+        "gram_indices",
+        "gram_counts",
+        "max_posting",
+        "length_values",
+        "length_starts",
+        "decoded",
+    ]
+
+    def __init__(
+        self,
+        choices,
+        strings,
+        lengths,
+        order,
+        gram_keys,
+        gram_indptr,
+        gram_indices,
+        gram_counts,
+    ):
+        # 'choices' are the original strings. The remaining attributes refer
+        # to the normalized strings sorted by length: 'order' maps each
+        # position to the position of the original string in 'choices'.
+        # The strings may be lists or (memory-mapped) StringArrays
+        self.choices = choices
+        self.strings = strings
+        self.lengths = lengths
+        self.order = order
+        self.gram_keys = gram_keys
+        self.gram_indptr = gram_indptr
+        self.gram_indices = gram_indices
+        self.gram_counts = gram_counts
+        self.max_posting = max(1, int(len(strings) * MAX_POSTING_FRACTION))
+        # Positions where each string length starts
+        self.length_values, self.length_starts = np.unique(
+            lengths, return_index=True
+        )
+        self.length_starts = np.append(self.length_starts, len(lengths))
+        # The normalized strings decoded from a StringArray, only decoded
+        # once (see 'get_strings')
+        self.decoded = None
+
+    @classmethod
+    def build(cls, choices):
+        """Build the index for the given strings.
+
+        :param choices: the strings to index
+        :type choices: list or StringArray
+        :return: the index
+        :rtype: CandidateIndex
+        """
+
+        if not isinstance(choices, Sequence):
+            choices = list(choices)
+
+        prepared = [prepare_string(choice) for choice in choices]
+        prepared_lengths = np.array([len(text) for text in prepared], dtype=np.int32)
+        order = np.argsort(prepared_lengths, kind="stable").astype(np.int32)
+        strings = [prepared[pos] for pos in order]
+        lengths = prepared_lengths[order]
+
+        del prepared
+
+        # Inverted index (CSR) between the trigrams and the positions of the
+        # strings including them, with the number of occurrences of the
+        # trigram in each string
+        gram_rows = array("q")
+        gram_cols = array("i")
+        gram_counts = array("i")
+
+        for pos, text in enumerate(strings):
+            grams = get_trigram_counts(text)
+            gram_rows.extend(grams.keys())
+            gram_cols.extend([pos] * len(grams))
+            gram_counts.extend(grams.values())
+
+        gram_rows = np.frombuffer(gram_rows, dtype=np.int64)
+        gram_cols = np.frombuffer(gram_cols, dtype=np.int32)
+        gram_counts = np.frombuffer(gram_counts, dtype=np.int32)
+        sort_order = np.lexsort((gram_cols, gram_rows))
+        gram_rows = gram_rows[sort_order]
+        gram_indices = gram_cols[sort_order]
+        gram_counts = np.minimum(gram_counts[sort_order], MAX_GRAM_COUNT).astype(
+            np.uint16
+        )
+        gram_keys, gram_starts = np.unique(gram_rows, return_index=True)
+        gram_indptr = np.append(gram_starts, len(gram_rows)).astype(np.int64)
+
+        return cls(
+            choices,
+            strings,
+            lengths,
+            order,
+            gram_keys,
+            gram_indptr,
+            gram_indices,
+            gram_counts,
+        )
+
+    def save(self, index_dir):
+        """Store the index in the given directory.
+
+        :param index_dir: path to the directory
+        :type index_dir: str
+        """
+
+        os.makedirs(index_dir, exist_ok=True)
+
+        strings = self.strings
+
+        if not isinstance(strings, StringArray):
+            strings = StringArray.from_strings(strings)
+
+        strings.save(index_dir, "strings")
+
+        np.save(f"{index_dir}/lengths.npy", self.lengths)
+        np.save(f"{index_dir}/order.npy", self.order)
+        np.save(f"{index_dir}/gram_keys.npy", self.gram_keys)
+        np.save(f"{index_dir}/gram_indptr.npy", self.gram_indptr)
+        np.save(f"{index_dir}/gram_indices.npy", self.gram_indices)
+        np.save(f"{index_dir}/gram_counts.npy", self.gram_counts)
+        # Written last, so an incomplete index is not considered valid
+        np.save(f"{index_dir}/fingerprint.npy", get_fingerprint(self.choices))
+
+    @classmethod
+    def load(cls, index_dir, choices):
+        """Load the index stored in the given directory if it corresponds to
+        the given strings.
+
+        :param index_dir: path to the directory
+        :type index_dir: str
+        :param choices: the strings that should be indexed
+        :type choices: list or StringArray
+        :return: the index or None if there is no valid index for the strings
+        :rtype: CandidateIndex
+        """
+
+        fingerprint_filepath = f"{index_dir}/fingerprint.npy"
+
+        if not os.path.exists(fingerprint_filepath) or not os.path.exists(
+            f"{index_dir}/gram_counts.npy"
+        ):
+            # Indexes stored by previous versions do not include the counts
+            return None
+
+        if not isinstance(choices, Sequence):
+            choices = list(choices)
+
+        if not np.array_equal(np.load(fingerprint_filepath), get_fingerprint(choices)):
+            return None
+
+        return cls(
+            choices,
+            StringArray.load(index_dir, "strings"),
+            np.load(f"{index_dir}/lengths.npy"),
+            np.load(f"{index_dir}/order.npy"),
+            np.load(f"{index_dir}/gram_keys.npy", mmap_mode="r"),
+            np.load(f"{index_dir}/gram_indptr.npy", mmap_mode="r"),
+            np.load(f"{index_dir}/gram_indices.npy", mmap_mode="r"),
+            np.load(f"{index_dir}/gram_counts.npy", mmap_mode="r"),
+        )
+
+    def get_strings(self):
+        """Get the normalized strings as an array of str objects, which is
+        decoded from the StringArray in the first call and then reused in
+        every query.
+
+        :return: the normalized strings
+        :rtype: numpy.ndarray
+        """
+
+        if self.decoded is None:
+            self.decoded = np.empty(len(self.strings), dtype=object)
+            self.decoded[:] = list(self.strings)
+
+        return self.decoded
+
+    def get_common_trigrams(self, query_prepared):
+        """Count the trigrams (with repetitions) that each string shares with
+        the normalized query. The trigrams included in more than
+        'max_posting' strings are not counted, they are added to the upper
+        bound of every string instead.
+
+        :param query_prepared: normalized query
+        :type query_prepared: str
+        :return: positions of the strings sharing counted trigrams with the
+            query, the counts for these strings and the number of trigrams of
+            the query that were not counted
+        :rtype: tuple with numpy.ndarray, numpy.ndarray, int
+        """
+
+        query_counts = get_trigram_counts(query_prepared)
+        query_grams = np.array(sorted(query_counts), dtype=np.int64)
+        key_pos = np.searchsorted(self.gram_keys, query_grams)
+        found = key_pos < len(self.gram_keys)
+        found[found] = self.gram_keys[key_pos[found]] == query_grams[found]
+        postings = []
+        posting_counts = []
+        not_counted = 0
+
+        for gram, pos in zip(query_grams[found].tolist(), key_pos[found].tolist()):
+            start = self.gram_indptr[pos]
+            end = self.gram_indptr[pos + 1]
+
+            if end - start <= self.max_posting:
+                postings.append(self.gram_indices[start:end])
+                posting_counts.append(
+                    np.minimum(self.gram_counts[start:end], query_counts[gram])
+                )
+
+            else:
+                not_counted += query_counts[gram]
+
+        if len(postings) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), not_counted
+
+        common = np.bincount(
+            np.concatenate(postings), weights=np.concatenate(posting_counts)
+        )
+        positions = np.flatnonzero(common)
+
+        return positions, common[positions], not_counted
+
+    def get_candidates(self, query_len, positions, common, not_counted, threshold):
+        """Get the positions of the strings that may reach the given score
+        threshold (see 'get_max_scores').
+
+        :param query_len: length of the normalized query
+        :type query_len: int
+        :param positions: positions of the strings sharing counted trigrams
+            with the query
+        :type positions: numpy.ndarray
+        :param common: number of counted trigrams shared by these strings
+        :type common: numpy.ndarray
+        :param not_counted: number of trigrams of the query that were not
+            counted
+        :type not_counted: int
+        :param threshold: the score threshold
+        :type threshold: float
+        :return: the positions of the strings
+        :rtype: numpy.ndarray
+        """
+
+        # The remaining strings can only share the trigrams that were not
+        # counted, so their bound only depends on their length
+        length_scores = get_max_scores(query_len, self.length_values, not_counted)
+        length_selected = length_scores >= threshold
+        candidates = [
+            np.arange(self.length_starts[i], self.length_starts[i + 1])
+            for i in np.flatnonzero(length_selected).tolist()
+        ]
+
+        # The strings in the selected lengths are already candidates
+        length_ids = np.searchsorted(self.length_starts, positions, side="right") - 1
+        positions = positions[~length_selected[length_ids]]
+        common = common[~length_selected[length_ids]]
+        max_scores = get_max_scores(
+            query_len, self.lengths[positions], common + not_counted
+        )
+        candidates.append(positions[max_scores >= threshold])
+
+        return np.concatenate(candidates)
+
+    def score(self, query_prepared, positions, threshold=0.0):
+        """Score the strings in the given positions with 'fuzz.ratio'.
+
+        :param query_prepared: normalized query
+        :type query_prepared: str
+        :param positions: positions of the strings
+        :type positions: numpy.ndarray
+        :param threshold: the strings with lower score are not returned,
+            defaults to 0.0
+        :type threshold: float, optional
+        :return: scores with format {position: score}
+        :rtype: dict
+        """
+
+        # 'process.cdist' releases the GIL while scoring, so several queries
+        # can be scored concurrently in threads (see 'get_batch_top_matches')
+        scores = process.cdist(
+            [query_prepared],
+            self.get_strings()[positions].tolist(),
+            scorer=fuzz.ratio,
+            processor=None,
+            dtype=np.float64,
+            # rapidfuzz converts the cutoff into a distance, which may exclude
+            # strings scoring exactly the threshold due to rounding
+            score_cutoff=max(0.0, threshold - 1e-6),
+        )[0]
+        keep = np.flatnonzero(scores >= threshold - 1e-6)
+
+        return dict(zip(positions[keep].tolist(), scores[keep].tolist()))
+
+    def extract(self, query, limit=5, exact=True):
+        """Get the strings most similar to the query according to
+        'fuzz.token_sort_ratio'. In the exact mode (default), the output is
+        equal to the output of 'process.extract(query, choices, limit=limit,
+        scorer=fuzz.token_sort_ratio)', with the strings with the same score
+        ordered by their position in the choices. Otherwise, only the strings
+        sharing more trigrams with the query are scored, which may miss weak
+        matches, whose scores are close to the scores of unrelated strings.
+
+        :param query: the entity text
+        :type query: str
+        :param limit: the number of matches, defaults to 5
+        :type limit: int, optional
+        :param exact: if False, only the shortlist of the strings sharing
+            more trigrams with the query is scored, defaults to True
+        :type exact: bool, optional
+        :return: matches with format [(choice, score, index)]
+        :rtype: list
+        """
+
+        if limit <= 0:
+            return []
+
+        query_prepared = prepare_string(query)
+        query_len = len(query_prepared)
+
+        if query_len == 0 or len(self.strings) <= limit:
+            return process.extract(
+                query, self.choices, scorer=fuzz.token_sort_ratio, limit=limit
+            )
+
+        positions, common, not_counted = self.get_common_trigrams(query_prepared)
+        size = max(limit * SHORTLIST_FACTOR, MIN_SHORTLIST_SIZE)
+        shortlist = positions
+
+        if len(positions) > size:
+            shortlist = positions[np.argpartition(-common, size - 1)[:size]]
+
+        scores = self.score(query_prepared, shortlist)
+
+        if exact or len(scores) < limit:
+            # The k-th best score of the shortlist is a lower bound of the
+            # k-th best score among all the strings, so only the strings that
+            # may reach it are scored
+            threshold = 0.0
+
+            if len(scores) >= limit:
+                threshold = sorted(scores.values(), reverse=True)[limit - 1]
+
+            candidates = self.get_candidates(
+                query_len, positions, common, not_counted, threshold - 1e-6
+            )
+            scores.update(self.score(query_prepared, candidates, threshold))
+
+        top = sorted(
+            [(score, int(self.order[pos])) for pos, score in scores.items()],
+            key=lambda match: (-match[0], match[1]),
+        )[:limit]
+
+        return [(self.choices[index], score, index) for score, index in top]
+
+
+def load_candidate_index(kb_dicts_dir, dict_name, choices):
+    """Load the candidate index of the given knowledge base dictionary,
+    building and storing it if it does not exist or is outdated. Returns None
+    for dictionaries with less than 'MIN_INDEX_SIZE' strings.
+
+    :param kb_dicts_dir: path to the directory of the knowledge base
+        dictionaries
+    :type kb_dicts_dir: str
+    :param dict_name: the name of the dictionary (e.g. 'name_to_id')
+    :type dict_name: str
+    :param choices: the strings of the dictionary
+    :type choices: list or StringArray
+    :return: the index or None
+    :rtype: CandidateIndex
+    """
+
+    if len(choices) < MIN_INDEX_SIZE:
+        return None
+
+    index_dir = f"{kb_dicts_dir}{dict_name}_index"
+    candidate_index = CandidateIndex.load(index_dir, choices)
+
+    if candidate_index is None:
+        candidate_index = CandidateIndex.build(choices)
+
+        try:
+            candidate_index.save(index_dir)
+
+        except OSError:
+            # The index is still used in the current run
+            pass
+
+    return candidate_index
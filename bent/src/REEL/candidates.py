@@ -1,9 +1,263 @@
 #!/usr/bin/env python
 
+import os
 import random
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from rapidfuzz import process, fuzz
+from rapidfuzz.utils import default_process
 from bent.src.REEL.utils import CANDIDATE_STR
 
+# Maximum number of scores computed at once in the batch matching (the
+# entity texts are split in chunks to limit the size of the score matrix)
+BATCH_MAX_SCORES = 10000000
+
+
+def get_top_matches(entity_text, strings, limit, candidate_index=None):
+    """Get the strings most similar to the entity text according to
+    'fuzz.token_sort_ratio'.
+
+    :param entity_text: the surface form of given entity
+    :type entity_text: str
+    :param strings: the strings (concept names or synonyms) to compare
+    :type strings: set
+    :param limit: the number of matches
+    :type limit: int
+    :param candidate_index: index over the strings (see 'CandidateIndex'),
+        defaults to None. If None, every string is compared with the entity
+        text
+    :type candidate_index: CandidateIndex, optional
+    :return: matches with format [(string, score, index)]
+    :rtype: list
+    """
+
+    if candidate_index is not None:
+        return candidate_index.extract(entity_text, limit=limit, exact=True)
+
+    if limit <= 0 or len(strings) == 0:
+        return []
+
+    if limit == 1:
+        return [process.extractOne(entity_text, strings, scorer=fuzz.token_sort_ratio)]
+
+    return process.extract(
+        entity_text, strings, limit=limit, scorer=fuzz.token_sort_ratio
+    )
+
+
+def get_index_top_matches(entity_texts, candidate_index, limit):
+    """Get the strings most similar to each one of the entity texts from the
+    given index (see 'CandidateIndex.extract').
+
+    :param entity_texts: the surface forms of the entities
+    :type entity_texts: list
+    :param candidate_index: index over the strings
+    :type candidate_index: CandidateIndex
+    :param limit: the number of matches for each entity text
+    :type limit: int
+    :return: the matches of each entity text with format
+        [[(string, score, index)]]
+    :rtype: list
+    """
+
+    return [
+        candidate_index.extract(entity_text, limit=limit, exact=True)
+        for entity_text in entity_texts
+    ]
+
+
+def get_batch_top_matches(entity_texts, strings, limit, candidate_index=None):
+    """Get the strings most similar to each one of the entity texts according
+    to 'fuzz.token_sort_ratio'. The scores between the entity texts and the
+    strings are computed in parallel, using all the available cores. The
+    matches with the same score are ordered by their position in the
+    strings, as in 'process.extract'.
+
+    :param entity_texts: the surface forms of the entities
+    :type entity_texts: list
+    :param strings: the strings (concept names or synonyms) to compare
+    :type strings: set
+    :param limit: the number of matches for each entity text
+    :type limit: int
+    :param candidate_index: index over the strings (see 'CandidateIndex'),
+        defaults to None. If not None, it is queried with each entity text
+    :type candidate_index: CandidateIndex, optional
+    :return: the matches of each entity text with format
+        [[(string, score, index)]]
+    :rtype: list
+    """
+
+    if candidate_index is not None:
+        num_workers = min(os.cpu_count() or 1, len(entity_texts))
+
+        if num_workers <= 1:
+            return get_index_top_matches(entity_texts, candidate_index, limit)
+
+        # The index is shared by threads instead of being copied to worker
+        # processes, as the scores are computed without holding the GIL.
+        # The normalized strings are decoded before starting the threads
+        candidate_index.get_strings()
+        chunk_size = -(-len(entity_texts) // num_workers)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            chunk_matches = executor.map(
+                get_index_top_matches,
+                [
+                    entity_texts[start : start + chunk_size]
+                    for start in range(0, len(entity_texts), chunk_size)
+                ],
+                [candidate_index] * num_workers,
+                [limit] * num_workers,
+            )
+
+            return [matches for chunk in chunk_matches for matches in chunk]
+
+    choices = list(strings)
+    limit = min(limit, len(choices))
+
+    if limit <= 0:
+        return [[] for _ in entity_texts]
+
+    chunk_size = max(1, BATCH_MAX_SCORES // len(choices))
+    batch_matches = []
+
+    for start in range(0, len(entity_texts), chunk_size):
+        chunk = entity_texts[start : start + chunk_size]
+        # Double precision scores, the same of 'process.extract'
+        scores = process.cdist(
+            chunk,
+            choices,
+            scorer=fuzz.token_sort_ratio,
+            processor=default_process,
+            dtype=np.float64,
+            workers=-1,
+        )
+        # Every string tied with the k-th best score is kept, so the ties are
+        # broken by position and not by the order of 'np.partition'
+        min_scores = -np.partition(-scores, limit - 1, axis=1)[:, limit - 1]
+
+        for row, min_score in zip(scores, min_scores):
+            indexes = np.flatnonzero(row >= min_score)
+            indexes = indexes[np.lexsort((indexes, -row[indexes]))[:limit]]
+            batch_matches.append(
+                [
+                    (choices[i], score, i)
+                    for i, score in zip(indexes.tolist(), row[indexes].tolist())
+                ]
+            )
+
+        del scores
+
+    return batch_matches
+
+
+def add_synonym_matches(top_concepts, top_synonyms):
+    """Add the best synonyms to the best concept names matching an entity.
+
+    :param top_concepts: the best concept names with format
+        [(name, score, index)]
+    :type top_concepts: list
+    :param top_synonyms: the best synonyms with format
+        [(synonym, score, index)]
+    :type top_synonyms: list
+    :return: top_concepts including the synonyms with format
+        (synonym, score, index, 'syn')
+    :rtype: list
+    """
+
+    for synonym in top_synonyms:
+
+        if synonym[1] == 100:
+            synoynm_up = (synonym[0], synonym[1], synonym[2], "syn")
+            top_concepts = [synoynm_up]
+
+        else:
+
+            if len(top_concepts) == 0 or synonym[1] >= top_concepts[-1][1]:
+                synoynm_up = (synonym[0], synonym[1], synonym[2], "syn")
+                top_concepts.append(synoynm_up)
+
+    return top_concepts
+
+
+def batch_map_to_kb(
+    entity_texts,
+    names,
+    synonyms,
+    kb,
+    kb_cache,
+    names_index=None,
+    synonyms_index=None,
+):
+    """Retrieve the best knowledge base matches for several entity texts at
+    once and store them in the candidates cache, so that the following calls
+    to 'map_to_kb' with the same entity texts do not compute any score.
+
+    :param entity_texts: the surface forms of the entities (already
+        replaced by the long forms, if they are abbreviations)
+    :type entity_texts: list
+    :param names: the strings of all the concepts included in the given
+        knowledge base
+    :type names: set
+    :synonyms: the strings of all the synonyms of the concepts included in the
+        given knowledge base
+    :type synonyms: set
+    :param kb: target knowledge base
+    :type kb: str
+    :param kb_cache: candidates cache for the given kb, updated in place
+    :type kb_cache: dict
+    :param names_index: index over the concept names, defaults to None
+    :type names_index: CandidateIndex, optional
+    :param synonyms_index: index over the synonyms, defaults to None
+    :type synonyms_index: CandidateIndex, optional
+    :return: changed_cache indicating wether the candidates cache was updated
+    :rtype: bool
+    """
+
+    # Exact matches are found by 'map_to_kb' without computing any score
+    entity_texts = [
+        entity_text
+        for entity_text in dict.fromkeys(entity_texts)
+        if entity_text not in kb_cache
+        and entity_text not in names
+        and entity_text not in synonyms
+    ]
+
+    if len(entity_texts) == 0:
+        return False
+
+    limit = 5
+
+    if kb in ("ncbi_gene", "ctd_gene"):
+        limit = 1
+
+    batch_top_concepts = get_batch_top_matches(
+        entity_texts, names, limit, candidate_index=names_index
+    )
+    synonym_texts = []
+
+    for entity_text, top_concepts in zip(entity_texts, batch_top_concepts):
+
+        if len(top_concepts) > 0 and top_concepts[0][1] == 100:
+            # There is an exact match for this entity
+            kb_cache[entity_text] = [top_concepts[0]]
+
+        else:
+            kb_cache[entity_text] = top_concepts
+            synonym_texts.append(entity_text)
+
+    # Check for synonyms to the remaining entities
+    batch_top_synonyms = get_batch_top_matches(
+        synonym_texts, synonyms, limit, candidate_index=synonyms_index
+    )
+
+    for entity_text, top_synonyms in zip(synonym_texts, batch_top_synonyms):
+        kb_cache[entity_text] = add_synonym_matches(
+            kb_cache[entity_text], top_synonyms
+        )
+
+    return True
+
 
 def map_to_kb(
     entity_text,
@@ -14,6 +268,8 @@ def map_to_kb(
     kb,
     kb_cache,
     doc_abbreviations,
+    names_index=None,
+    synonyms_index=None,
 ):
     """
     Retrieve best knowledge base matches for entity text according to
@@ -37,6 +293,12 @@ def map_to_kb(
     :type kb: str
     :param kb_cache: candidates cache for the given kb
     :type kb_cache: dict
+    :param names_index: index over the concept names used to retrieve the
+        most similar names, defaults to None
+    :type names_index: CandidateIndex, optional
+    :param synonyms_index: index over the synonyms used to retrieve the most
+        similar synonyms, defaults to None
+    :type synonyms_index: CandidateIndex, optional
 
     :return: matches (list) with format
         [{'kb_id': <kb_id>, 'name': <name>, 'match_score': (...)}],
@@ -74,51 +336,25 @@ def map_to_kb(
         else:
             # Get first ten KB candidates according to lexical similarity
             # with entity_text
-            top_concepts = None
+            limit = 5
 
             if kb in ("ncbi_gene", "ctd_gene"):
-                top_concept = process.extractOne(
-                    entity_text, names, scorer=fuzz.token_sort_ratio
-                )
-
-                top_concepts = [top_concept]
+                limit = 1
 
-            else:
-                top_concepts = process.extract(
-                    entity_text, names, limit=5, scorer=fuzz.token_sort_ratio
-                )
+            top_concepts = get_top_matches(
+                entity_text, names, limit, candidate_index=names_index
+            )
 
-            if top_concepts[0][1] == 100:
+            if len(top_concepts) > 0 and top_concepts[0][1] == 100:
                 # There is an exact match for this entity
                 top_concepts = [top_concepts[0]]
 
-            elif top_concepts[0][1] < 100:
+            else:
                 # Check for synonyms to this entity
-                top_synonyms = None
-
-                if kb in ("ncbi_gene", "ctd_gene"):
-                    top_synonym = process.extractOne(
-                        entity_text, synonyms, scorer=fuzz.token_sort_ratio
-                    )
-
-                    top_synonyms = [top_synonym]
-
-                else:
-                    top_synonyms = process.extract(
-                        entity_text, synonyms, limit=5, scorer=fuzz.token_sort_ratio
-                    )
-
-                for synonym in top_synonyms:
-
-                    if synonym[1] == 100:
-                        synoynm_up = (synonym[0], synonym[1], synonym[2], "syn")
-                        top_concepts = [synoynm_up]
-
-                    else:
-
-                        if synonym[1] >= top_concepts[-1][1]:
-                            synoynm_up = (synonym[0], synonym[1], synonym[2], "syn")
-                            top_concepts.append(synoynm_up)
+                top_synonyms = get_top_matches(
+                    entity_text, synonyms, limit, candidate_index=synonyms_index
+                )
+                top_concepts = add_synonym_matches(top_concepts, top_synonyms)
 
             kb_cache[entity_text] = top_concepts
             changed_cache = True
@@ -211,6 +447,8 @@ def generate_candidates_list(
     doc_abbreviations,
     kb_id_2_id,
     nil_candidates=None,
+    names_index=None,
+    synonyms_index=None,
 ):
     """
     Build a structured candidates list for given entity text.
@@ -244,6 +482,10 @@ def generate_candidates_list(
     :param nil_candidates: in cases where the candidates outputed from the
         'NILINKER' model need to be structured
     :type nil_candidates: list
+    :param names_index: index over the concept names, defaults to None
+    :type names_index: CandidateIndex, optional
+    :param synonyms_index: index over the synonyms, defaults to None
+    :type synonyms_index: CandidateIndex, optional
     :return: candidates_list including all the structured candidates for given
         entity, changed_cache indicating weter the candidates cache was updated
         in the performed mapping or if it remains inaltered, kb_cache_up
@@ -269,6 +511,8 @@ def generate_candidates_list(
             kb,
             kb_cache,
             doc_abbreviations,
+            names_index=names_index,
+            synonyms_index=synonyms_index,
         )
         changed_cache = True
 
@@ -365,6 +609,112 @@ def check_if_related(c1_url, link_mode, extracted_relations, kb_edges, c2_url):
     return related
 
 
+def get_related_urls(doc_urls, link_mode, extracted_relations, kb_edges):
+    """
+    Find the pairs of candidates of a document that are linked according to
+    the criterium defined by link_mode (see 'check_if_related'), using set
+    intersections instead of checking every pair of candidates.
+
+    :param doc_urls: the KB ids (urls) of all the candidates in the document
+    :type doc_urls: set
+    :param link_mode: how the edges are added to the disambiguation graph ('kb',
+    'corpus', 'kb_corpus')
+    :type link_mode: str
+    :param extracted_relations: relations extracted from target corpus
+    :type extracted_relations: dict
+    :param kb_edges: relations described in the knowledge base
+    :type kb_edges: dict
+
+    :return: related_urls with format {c1_url: {c2_url, ...}}, including the
+        urls c2_url for which 'check_if_related(c1_url, ..., c2_url)' is True
+    :rtype: dict
+    """
+
+    related_urls = {url: set() for url in doc_urls}
+
+    for url in doc_urls:
+
+        if link_mode != "corpus":
+            related_urls[url].add(url)
+
+            # KB links in both directions
+            for url2 in doc_urls.intersection(kb_edges.get(url, ())):
+                related_urls[url].add(url2)
+                related_urls[url2].add(url)
+
+        if link_mode in ("corpus", "kb_corpus"):
+            related_urls[url].update(
+                doc_urls.intersection(extracted_relations.get(url, ()))
+            )
+
+    return related_urls
+
+
+def add_candidate_links(
+    kb, doc_entities_candidates, link_mode, extracted_relations, kb_edges
+):
+    """Link each candidate of the given document to the related candidates of
+    the remaining entities in the same document, filling the 'links' field
+    of the candidates with the ids of the related candidates separated by ';'.
+
+    :param kb: target knowledge base
+    :type kb: str
+    :param doc_entities_candidates: includes entities of the given document
+        and respective candidates with format [(entity_str, candidates_list)]
+    :type doc_entities_candidates: list
+    :param link_mode: specifies the way the edges are built in the
+        disambiguation graphs that are the input of the PPR algorithm
+        ('corpus' - extracted relations from an external corpus,
+        'kb' - relations described in the knowledge base,
+        'kb_corpus' - extracted relations from an external corpus and relations
+        described in the knowledge base,
+    :type link_mode: str
+    :param extracted_relations: includes extracted relations from external
+        dictionary or is empty if link_mode=kb
+    :type extracted_relations: list
+    :param kb_edges: includes the edges between knowledge base concepts in the
+        format: (concept_1_id, concept_2_id)
+    :type kb_edges: list
+    """
+
+    related_urls = {}
+    url_to_candidates = {}
+
+    if kb not in ("ncbi_gene", "ctd_gene"):
+        # Find links between the candidates in the current document: the
+        # candidates of each KB id (url), with the entity they belong to,
+        # and the related urls
+        for annotation in doc_entities_candidates:
+
+            for candidate in annotation[1]:
+                url_to_candidates.setdefault(candidate["url"], []).append(
+                    (annotation[0], str(candidate["id"]))
+                )
+
+        related_urls = get_related_urls(
+            set(url_to_candidates.keys()), link_mode, extracted_relations, kb_edges
+        )
+
+    for annotation1 in doc_entities_candidates:
+        entity_str = annotation1[0]
+
+        for c1 in annotation1[1]:
+            c1["links"] = ""
+
+            if kb not in ("ncbi_gene", "ctd_gene"):
+                # Link the current candidate to the related candidates of the
+                # remaining entities in the same document. The ids of the
+                # candidates are needed instead of the KB ids
+                id_links = {
+                    c2_id
+                    for c2_url in related_urls[c1["url"]]
+                    for entity_str2, c2_id in url_to_candidates[c2_url]
+                    if entity_str2 != entity_str
+                }
+
+                c1["links"] = ";".join(sorted(id_links))
+
+
 def write_candidates_file(
     kb,
     doc_entities_candidates,
@@ -403,6 +753,10 @@ def write_candidates_file(
     :type extracted_relations: list
     """
 
+    add_candidate_links(
+        kb, doc_entities_candidates, link_mode, extracted_relations, kb_edges
+    )
+
     candidates_filename = f"{candidates_dir}{doc_id}"
     candidates_file = open(candidates_filename, "w", encoding="utf-8")
 
@@ -411,33 +765,6 @@ def write_candidates_file(
         candidates_file.write(entity_str)
 
         for c1 in annotation1[1]:
-            c1["links"] = ""
-
-            if kb not in ("ncbi_gene", "ctd_gene"):
-                # Find links between the candidates in the current document
-
-                # Get all the candidates for the remaining entities in the
-                # same document
-                other_candidates = [
-                    (c2["url"], c2["id"])
-                    for annotation2 in doc_entities_candidates
-                    if annotation1[0] != annotation2[0]
-                    for c2 in annotation2[1]
-                ]
-
-                # Check if there is a relation between current candidate and each
-                # of the candidates for the remaining entities
-                id_links = [
-                    str(c2[1])
-                    for c2 in other_candidates
-                    if check_if_related(
-                        c1["url"], link_mode, extracted_relations, kb_edges, c2[0]
-                    )
-                ]
-
-                # The ids of the candidates are needed instead of the KB ids
-                c1["links"] = ";".join(set(id_links))
-
             candidates_file.write(
                 CANDIDATE_STR.format(
                     c1["id"],
@@ -1,7 +1,165 @@
 #!/usr/bin/env python
 
 import os
-from math import log
+import numpy as np
+from bent.src.dicts.kb.binary_dicts import BinaryDict, StringArray
+
+# Probability of the terms that are not in the knowledge base (e.g. 'NIL')
+UNKNOWN_TERM_PROBABILITY = 0.000001
+
+
+def get_information_content(term_probability):
+    """Get the information content of the terms with the given probabilities.
+
+    :param term_probability: the probability of each term
+    :type term_probability: float or numpy.ndarray
+    :return: the information content of each term
+    :rtype: float or numpy.ndarray
+    """
+
+    information_content = -np.log(term_probability) + 1
+
+    return information_content + 1
+
+
+class IntrinsicIC:
+    """Intrinsic information content of every concept of a knowledge base,
+    based on its number of descendants. It is computed once for each
+    knowledge base and stored with the KB dictionaries: the sorted concept
+    ids (StringArray) and the information content of each id (array).
+
+    :param ids: the sorted concept ids
+    :type ids: StringArray
+    :param values: the information content of each id
+    :type values: numpy.ndarray
+    """
+
+    __slots__ = ["ids", "values"]
+
+    def __init__(self, ids, values):
+
+        self.ids = ids
+        self.values = values
+
+    @classmethod
+    def build(cls, id_to_info):
+        """Compute the intrinsic information content of the concepts of the
+        given knowledge base.
+
+        :param id_to_info: mappings between KB identifiers and information
+            (outdegree, indegree, num_descendants)
+        :type id_to_info: dict or BinaryDict
+        :return: the intrinsic information content
+        :rtype: IntrinsicIC
+        """
+
+        if isinstance(id_to_info, BinaryDict) and id_to_info.kind == "tuple":
+            ids = id_to_info.keys_array
+            num_descendants = np.asarray(id_to_info.matrix[:, 2], dtype=np.float64)
+
+        else:
+            keys = sorted(id_to_info.keys(), key=lambda key: key.encode("utf-8"))
+            ids = StringArray.from_strings(keys, is_sorted=True)
+            num_descendants = np.array(
+                [id_to_info[key][2] for key in keys], dtype=np.float64
+            )
+
+        values = get_information_content((num_descendants + 1) / len(ids))
+
+        return cls(ids, values)
+
+    def save(self, ic_dir):
+        """Store the information content in the given directory.
+
+        :param ic_dir: path to the directory
+        :type ic_dir: str
+        """
+
+        os.makedirs(ic_dir, exist_ok=True)
+        self.ids.save(ic_dir, "ids")
+        # Written last, so an incomplete file is not considered valid
+        np.save(f"{ic_dir}/values.npy", self.values)
+
+    @classmethod
+    def load(cls, ic_dir):
+        """Load the information content stored in the given directory.
+
+        :param ic_dir: path to the directory
+        :type ic_dir: str
+        :return: the intrinsic information content or None if it was not
+            stored
+        :rtype: IntrinsicIC
+        """
+
+        if not os.path.exists(f"{ic_dir}/values.npy"):
+            return None
+
+        return cls(
+            StringArray.load(ic_dir, "ids", is_sorted=True),
+            np.load(f"{ic_dir}/values.npy", mmap_mode="r"),
+        )
+
+    def lookup(self, terms):
+        """Get the information content of the given terms.
+
+        :param terms: the KB ids of the terms
+        :type terms: list
+        :return: the information content of each term
+        :rtype: numpy.ndarray
+        """
+
+        positions = np.array([self.ids.find(term) for term in terms], dtype=np.int64)
+        ic_values = np.full(
+            len(terms), get_information_content(UNKNOWN_TERM_PROBABILITY)
+        )
+        found = positions != -1
+        ic_values[found] = self.values[positions[found]]
+
+        return ic_values
+
+
+def load_intrinsic_ic(kb_dicts_dir, id_to_info):
+    """Load the intrinsic information content of the given knowledge base,
+    computing and storing it if it does not exist or is outdated.
+
+    :param kb_dicts_dir: path to the directory of the knowledge base
+        dictionaries
+    :type kb_dicts_dir: str
+    :param id_to_info: mappings between KB identifiers and information
+    :type id_to_info: dict or BinaryDict
+    :return: the intrinsic information content
+    :rtype: IntrinsicIC
+    """
+
+    ic_dir = f"{kb_dicts_dir}intrinsic_ic"
+    intrinsic_ic = IntrinsicIC.load(ic_dir)
+    dict_filepaths = [
+        f"{kb_dicts_dir}id_to_info.json",
+        f"{kb_dicts_dir}id_to_info_bin/meta.json",
+    ]
+
+    if intrinsic_ic is not None and (
+        len(intrinsic_ic.ids) != len(id_to_info)
+        or any(
+            os.path.getmtime(filepath) > os.path.getmtime(f"{ic_dir}/values.npy")
+            for filepath in dict_filepaths
+            if os.path.exists(filepath)
+        )
+    ):
+        # The dictionaries were generated again after the information content
+        intrinsic_ic = None
+
+    if intrinsic_ic is None:
+        intrinsic_ic = IntrinsicIC.build(id_to_info)
+
+        try:
+            intrinsic_ic.save(ic_dir)
+
+        except OSError:
+            # The information content is still used in the current run
+            pass
+
+    return intrinsic_ic
 
 
 def build_term_counts(candidates_dir):
@@ -11,79 +169,99 @@ def build_term_counts(candidates_dir):
 
     term_counts = {}
 
-    candidates_files = os.listdir(candidates_dir)
-
     # Get the term frequency in the corpus
-    for filename in candidates_files:
+    for filename in os.listdir(candidates_dir):
 
-        lines = open(f"{candidates_dir}{filename}", "r", encoding="utf-8").readlines()
+        with open(f"{candidates_dir}{filename}", "r", encoding="utf-8") as cand_file:
 
-        for line in lines:
+            for line in cand_file:
 
-            if line[:9] == "CANDIDATE":
-                url = line.split("\t")[5].split("url:")[1]
+                if line[:9] == "CANDIDATE":
+                    url = line.split("\t")[5].split("url:")[1]
+                    term_counts[url] = term_counts.get(url, 0) + 1
 
-                if url not in term_counts:
-                    term_counts[url] = 1
+    return term_counts
 
-                else:
-                    term_counts[url] += 1
+
+def count_candidate_terms(doc_candidates):
+    """Build a dict containing the frequency of each candidate entity in the
+    candidates generated in memory during the pre-processing stage (same
+    output as 'build_term_counts').
+
+    :param doc_candidates: the entities of each document with format
+        {doc_id: [(entity_text, candidates_list)]}
+    :type doc_candidates: dict
+    :return: term_counts with format {url: frequency}
+    :rtype: dict
+    """
+
+    term_counts = {}
+
+    for doc_entities in doc_candidates.values():
+
+        for entity_text, candidates_list in doc_entities:
+
+            for candidate in candidates_list:
+                url = candidate["url"]
+                term_counts[url] = term_counts.get(url, 0) + 1
 
     return term_counts
 
 
-def build_information_content_dict(candidates_dir, id_to_info, mode=None):
+def build_information_content_dict(
+    candidates_dir, id_to_info, mode=None, term_counts=None, intrinsic_ic=None
+):
     """Generate dictionary with the information content for each candidate
     term. For more info about the definition of information content see
-    https://www.sciencedirect.com/science/article/pii/B9780128096338204019?via%3Dihub"""
+    https://www.sciencedirect.com/science/article/pii/B9780128096338204019?via%3Dihub
 
-    term_counts = build_term_counts(candidates_dir)
+    If 'term_counts' is given, the candidates files in 'candidates_dir' are
+    not read. If 'intrinsic_ic' (see 'load_intrinsic_ic') is given, the
+    intrinsic information content is not computed from 'id_to_info'."""
 
-    ic = {}
-    total_terms = 0
+    if term_counts is None:
+        term_counts = build_term_counts(candidates_dir)
 
-    if mode == "intrinsic":
-        total_terms = len(id_to_info.keys())
+    terms = list(term_counts.keys())
 
-    for term_id in term_counts:
+    if mode == "extrinsic":
+        term_frequency = np.array(list(term_counts.values()), dtype=np.float64)
+        # Frequency of the most frequent term in dataset
+        max_freq = term_frequency.max(initial=0.0)
+        ic_values = get_information_content((term_frequency + 1) / (max_freq + 1))
 
-        term_probability = float()
+    elif mode == "intrinsic":
 
-        if mode == "extrinsic":
-            # Frequency of the most frequent term in dataset
-            max_freq = max(term_counts.values())
-            term_frequency = term_counts[term_id]
-            term_probability = (term_frequency + 1) / (max_freq + 1)
+        if intrinsic_ic is not None:
+            ic_values = intrinsic_ic.lookup(terms)
 
-        elif mode == "intrinsic":
+        else:
+            term_probability = np.full(len(terms), UNKNOWN_TERM_PROBABILITY)
 
-            try:
-                num_descendants = id_to_info[term_id][2]
-                term_probability = (num_descendants + 1) / total_terms
+            for pos, term in enumerate(terms):
+                term_info = id_to_info.get(term)
 
-            except:
-                term_probability = 0.000001
+                if term_info is not None:
+                    term_probability[pos] = (term_info[2] + 1) / len(id_to_info)
 
-        else:
-            raise ValueError("Invalid mode!")
+            ic_values = get_information_content(term_probability)
 
-        information_content = -log(term_probability) + 1
-        ic[term_id] = information_content + 1
+    else:
+        raise ValueError("Invalid mode!")
 
-    return ic
+    return dict(zip(terms, ic_values.tolist()))
 
 
-def generate_ic_file(run_id, candidates_dir, id_to_info):
+def generate_ic_file(run_id, candidates_dir, id_to_info, intrinsic_ic=None):
     """Generate file with information content of all entities present in the
     candidates files."""
 
-    ic = build_information_content_dict(candidates_dir, id_to_info, mode="intrinsic")
+    ic = build_information_content_dict(
+        candidates_dir, id_to_info, mode="intrinsic", intrinsic_ic=intrinsic_ic
+    )
 
     # Build output string
-    out_string = str()
-
-    for term in ic:
-        out_string += f"{term}\t{str(ic[term])}\n"
+    out_string = "".join([f"{term}\t{str(ic[term])}\n" for term in ic])
 
     # Create file ontology_pop with information content for all entities
     # in candidates file
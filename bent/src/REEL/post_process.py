@@ -5,11 +5,39 @@ import orjson as json
 import os
 
 
-def process_results(run_id, entity_type, kb):
+def process_results(run_id, entity_type, kb, write_results=True, ppr_results=None):
     """Process the results after the application of the PPR-IC model and
-    output a JSON file in the directory 'tmp/REEL/results/<run_id>/."""
+    output a JSON file in the directory 'tmp/REEL/results/<run_id>/.
+
+    :param run_id: representing the identifier of the current run of REEL
+    :type run_id: str
+    :param entity_type: the type of the entities that were linked
+    :type entity_type: str
+    :param kb: target knowledge base
+    :type kb: str
+    :param write_results: whether the JSON files with the results are
+        written, defaults to True
+    :type write_results: bool, optional
+    :param ppr_results: the output of the in-process PPR implementation, a
+        structured array with the fields 'doc_id', 'entity_text' and 'url'
+        (see 'ppr.disambiguate_documents'). If None (default), the output
+        file of the Java implementation is read
+    :type ppr_results: numpy.ndarray, optional
+    :return: linked_entities with format
+        {'doc_id': {'entity_text': ('kb_id', 'entity_type')}}
+    :rtype: dict
+    """
+
+    if kb not in ("ncbi_gene", "ctd_gene") and ppr_results is not None:
+        linked_entities = {}
+
+        for doc_id, entity, url in ppr_results.tolist():
+            linked_entities.setdefault(doc_id, {})[entity] = (
+                url.replace("_", ":"),
+                entity_type,
+            )
 
-    if kb not in ("ncbi_gene", "ctd_gene"):
+    elif kb not in ("ncbi_gene", "ctd_gene"):
         results_filepath = f"{cfg.tmp_dir}{run_id}/REEL/results/candidate_scores"
 
         # Import PPR output
@@ -77,11 +105,14 @@ def process_results(run_id, entity_type, kb):
                             search_key = f"{entity}"
                             found_entity = True
 
-    out_dir = f"{cfg.tmp_dir}{run_id}/REEL/results/"
+    if write_results:
+        out_dir = f"{cfg.tmp_dir}{run_id}/REEL/results/"
+
+        for doc, doc_results in linked_entities.items():
+            out_json = json.dumps(doc_results)
 
-    for doc, doc_results in linked_entities.items():
-        out_json = json.dumps(doc_results)
+            with open(f"{out_dir}{doc}.json", "wb") as out_file:
+                out_file.write(out_json)
+                out_file.close()
 
-        with open(f"{out_dir}{doc}.json", "wb") as out_file:
-            out_file.write(out_json)
-            out_file.close()
+    return linked_entities
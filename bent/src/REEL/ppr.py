@@ -0,0 +1,891 @@
+#!/usr/bin/env python
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# -----------------------------------------------------------------------------
+#   Personalized PageRank (PPR) for entity disambiguation, adapted from
+#   https://github.com/masha-p/PPRforNED (see 'ppr_for_ned_all.java'), with
+#   the same parameters and constraints ('secondconst') of the Java version
+# -----------------------------------------------------------------------------
+
+# Number of random walks starting in each node
+WALKERS = 10000
+
+# Probability of finishing a walk after each step
+TELEPORT = 0.8
+
+# Number of steps of the walks. The walks finished after the first step are
+# not considered
+ITERATIONS = 5
+
+# If the difference between the two best scores of an entity is below this
+# value, the candidate with the highest inCount is selected
+GAP_LOWER_BOUND = 0.1
+
+# Seed of the random generator, used in each document
+SEED = 5
+
+# Power iteration (exact mode): the iterations stop when the walks finished
+# in the last step are below this fraction of the walks of each node or
+# after MAX_ITERATIONS steps
+TOLERANCE = 1e-6
+
+MAX_ITERATIONS = 100
+
+# Minimum number of nodes of a batch of documents for which the documents are
+# scored in parallel (below it, starting the worker processes costs more)
+MIN_PARALLEL_NODES = 20000
+
+# Number of chunks of documents per worker process
+CHUNKS_PER_WORKER = 4
+
+
+class DisambiguationGraph:
+    """Graph built from the candidates of the entities of a document. Each
+    node is a pair (entity, candidate), nodes of different entities are
+    linked if their candidates are linked and nodes with the same candidate
+    are always linked."""
+
+    __slots__ = [
+        "entity_texts",
+        "node_entity",
+        "node_url",
+        "node_incount",
+        "indptr",
+        "indices",
+    ]
+
+    def __init__(self, entity_texts, node_entity, node_url, node_incount, indptr, indices):
+
+        self.entity_texts = entity_texts
+        self.node_entity = node_entity
+        self.node_url = node_url
+        self.node_incount = node_incount
+        # Adjacency lists in CSR format: the neighbors of the node i are
+        # indices[indptr[i]:indptr[i + 1]]
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_candidates(cls, doc_entities):
+        """Build the graph of a document.
+
+        :param doc_entities: the entities of the document with format
+            [(entity_text, candidates_list)], where each candidate is a dict
+            with the keys 'id', 'url', 'incount' and 'links' (see
+            'add_candidate_links')
+        :type doc_entities: list
+        :return: the graph
+        :rtype: DisambiguationGraph
+        """
+
+        entity_texts = []
+        node_entity = []
+        node_url = []
+        node_incount = []
+        # Nodes of each candidate id and links between the candidate ids
+        id_to_nodes = {}
+        id_links = {}
+
+        for entity_text, candidates_list in doc_entities:
+            entity_nodes = {}
+
+            for candidate in candidates_list:
+                cand_id = int(candidate["id"])
+
+                if cand_id not in entity_nodes:
+                    entity_nodes[cand_id] = len(node_url)
+                    node_entity.append(len(entity_texts))
+                    node_url.append(candidate["url"])
+                    node_incount.append(int(candidate["incount"]))
+                    id_to_nodes.setdefault(cand_id, []).append(entity_nodes[cand_id])
+
+                id_links.setdefault(cand_id, set())
+
+                for link in candidate["links"].split(";"):
+
+                    if link != "":
+                        id_links[cand_id].add(int(link))
+                        id_links.setdefault(int(link), set()).add(cand_id)
+
+            if len(entity_nodes) > 0:
+                entity_texts.append(entity_text)
+
+        adjacency = [set() for _ in node_url]
+
+        for cand_id, linked_ids in id_links.items():
+
+            for node in id_to_nodes.get(cand_id, ()):
+
+                for linked_id in linked_ids:
+
+                    for linked_node in id_to_nodes.get(linked_id, ()):
+                        # Competing candidates for the same entity are not
+                        # linked
+                        if node_entity[node] != node_entity[linked_node]:
+                            adjacency[node].add(linked_node)
+                            adjacency[linked_node].add(node)
+
+        for nodes in id_to_nodes.values():
+
+            for node in nodes:
+                adjacency[node].update(
+                    linked_node for linked_node in nodes if linked_node != node
+                )
+
+        indptr = np.zeros(len(adjacency) + 1, dtype=np.int64)
+        np.cumsum([len(neighbors) for neighbors in adjacency], out=indptr[1:])
+        indices = np.array(
+            [neighbor for neighbors in adjacency for neighbor in sorted(neighbors)],
+            dtype=np.int64,
+        )
+
+        return cls(
+            entity_texts,
+            np.array(node_entity, dtype=np.int64),
+            node_url,
+            np.array(node_incount, dtype=np.int64),
+            indptr,
+            indices,
+        )
+
+    def __len__(self):
+        return len(self.node_url)
+
+
+def sum_walks(num_nodes, sources, nodes, walks, by_source=True):
+    """Sum the walks of the repeated pairs (source, node) of a sparse matrix
+    in coordinate format and drop the pairs without walks.
+
+    :param num_nodes: the number of nodes of the graph
+    :type num_nodes: int
+    :param sources: the node where each walk started
+    :type sources: numpy.ndarray
+    :param nodes: the node where each walk is
+    :type nodes: numpy.ndarray
+    :param walks: the number of walks of each pair
+    :type walks: numpy.ndarray
+    :param by_source: if True (default), the pairs are sorted by source and
+        then by node, otherwise by node and then by source
+    :type by_source: bool, optional
+    :return: sources, nodes and walks of the distinct pairs
+    :rtype: tuple with 3 numpy.ndarray
+    """
+
+    if by_source:
+        keys = sources * num_nodes + nodes
+
+    else:
+        keys = nodes * num_nodes + sources
+
+    keys, inverse = np.unique(keys, return_inverse=True)
+    walks = np.bincount(inverse, weights=walks, minlength=len(keys)).astype(
+        walks.dtype
+    )
+    keep = walks > 0
+    keys = keys[keep]
+
+    if by_source:
+        return keys // num_nodes, keys % num_nodes, walks[keep]
+
+    return keys % num_nodes, keys // num_nodes, walks[keep]
+
+
+def personalized_pagerank(graph, rng):
+    """Run the random walks of the Monte Carlo approximation of PPR,
+    starting in every node of the graph. In each step, each walk moves to a
+    random neighbor (or stays in an isolated node) and finishes there with
+    probability TELEPORT. Only the pairs of nodes reached by some walk are
+    stored, so the memory grows with the neighborhoods of the nodes instead
+    of the square of the number of nodes.
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :param rng: the random generator
+    :type rng: numpy.random.Generator
+    :return: finished with format (sources, nodes, walks), including the
+        number of walks starting in each node (sources) that finished in each
+        node (nodes) after the first step, sorted by source and node
+    :rtype: tuple with 3 numpy.ndarray
+    """
+
+    num_nodes = len(graph)
+    empty = np.zeros(0, dtype=np.int64)
+    unfinished = (np.arange(num_nodes), np.arange(num_nodes))
+    unfinished_walks = np.full(num_nodes, WALKERS, dtype=np.int64)
+    finished = ([empty], [empty], [empty])
+
+    for iteration in range(ITERATIONS):
+        next_unfinished = ([empty], [empty], [empty])
+        sources, nodes = unfinished
+        # The walks of each node are moved at once, as the draws of the
+        # generator for each node follow the order of the sources
+        node_starts = np.flatnonzero(np.diff(nodes, prepend=-1))
+        node_ends = np.append(node_starts[1:], len(nodes))
+
+        for start, end in zip(node_starts.tolist(), node_ends.tolist()):
+            node = nodes[start]
+            walks = unfinished_walks[start:end]
+            neighbors = graph.indices[graph.indptr[node] : graph.indptr[node + 1]]
+
+            if len(neighbors) == 0:
+                neighbors = np.array([node])
+                moved = walks[:, None]
+
+            else:
+                moved = rng.multinomial(
+                    walks, np.full(len(neighbors), 1.0 / len(neighbors))
+                )
+
+            ended = rng.binomial(moved, TELEPORT)
+            walk_sources = np.repeat(sources[start:end], len(neighbors))
+            walk_nodes = np.tile(neighbors, end - start)
+            next_unfinished[0].append(walk_sources)
+            next_unfinished[1].append(walk_nodes)
+            next_unfinished[2].append((moved - ended).ravel())
+
+            if iteration > 0:
+                finished[0].append(walk_sources)
+                finished[1].append(walk_nodes)
+                finished[2].append(ended.ravel())
+
+        sources, nodes, unfinished_walks = sum_walks(
+            num_nodes, *map(np.concatenate, next_unfinished), by_source=False
+        )
+        unfinished = (sources, nodes)
+
+    return sum_walks(num_nodes, *map(np.concatenate, finished))
+
+
+def get_transition_matrix(graph):
+    """Get the transition probabilities between the nodes of the graph. Each
+    walk moves to a neighbor with uniform probability, or stays in the same
+    node if it has no neighbors.
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :return: transitions in CSR format (indptr, indices, probabilities): the
+        walks in the node i move to the nodes indices[indptr[i]:indptr[i + 1]]
+    :rtype: tuple with 3 numpy.ndarray
+    """
+
+    num_nodes = len(graph)
+    degrees = np.diff(graph.indptr)
+    isolated = degrees == 0
+    # The isolated nodes are linked to themselves
+    num_links = np.maximum(degrees, 1)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(num_links, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int64)
+    linked = np.repeat(~isolated, num_links)
+    indices[linked] = graph.indices
+    indices[~linked] = np.flatnonzero(isolated)
+    probabilities = np.repeat(1.0 / num_links, num_links)
+
+    return indptr, indices, probabilities
+
+
+def personalized_pagerank_exact(
+    graph, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS
+):
+    """Compute the expected number of walks (see 'personalized_pagerank')
+    starting in each node that finish in each node by power iteration,
+    instead of simulating them. The output is deterministic and it does not
+    stop after ITERATIONS steps, but when the walks that are still
+    unfinished are negligible. The walks are propagated through the sparse
+    transition matrix and only the pairs of nodes reached by some walk are
+    stored.
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :param tolerance: the iterations stop when the walks finished in the
+        last step are below this fraction of the walks of each node,
+        defaults to TOLERANCE
+    :type tolerance: float, optional
+    :param max_iterations: maximum number of steps, defaults to
+        MAX_ITERATIONS
+    :type max_iterations: int, optional
+    :return: finished with format (sources, nodes, walks), sorted by source
+        and node
+    :rtype: tuple with 3 numpy.ndarray
+    """
+
+    num_nodes = len(graph)
+    indptr, indices, probabilities = get_transition_matrix(graph)
+    sources = np.arange(num_nodes)
+    nodes = np.arange(num_nodes)
+    unfinished = np.full(num_nodes, float(WALKERS))
+    finished = ([], [], [])
+
+    for iteration in range(max_iterations):
+        # Sparse product between the unfinished walks and the transitions
+        counts = indptr[nodes + 1] - indptr[nodes]
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        edges = np.repeat(indptr[nodes], counts) + np.arange(counts.sum()) - starts
+        sources, nodes, moved = sum_walks(
+            num_nodes,
+            np.repeat(sources, counts),
+            indices[edges],
+            np.repeat(unfinished, counts) * probabilities[edges],
+        )
+        ended = moved * TELEPORT
+        unfinished = moved - ended
+
+        if iteration > 0:
+            finished[0].append(sources)
+            finished[1].append(nodes)
+            finished[2].append(ended)
+            ended_walks = np.bincount(sources, weights=ended, minlength=num_nodes)
+
+            if ended_walks.max(initial=0.0) < tolerance * WALKERS:
+                break
+
+    if len(finished[0]) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+
+        return empty, empty, np.zeros(0)
+
+    return sum_walks(num_nodes, *map(np.concatenate, finished))
+
+
+def get_node_ic(graph, ic):
+    """Get the information content of the candidate of each node.
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :param ic: information content of each candidate url
+    :type ic: dict
+    :return: node_ic with the information content of each node (0.0 if the
+        candidate is not in 'ic')
+    :rtype: numpy.ndarray
+    """
+
+    return np.array([ic.get(url, 0.0) for url in graph.node_url], dtype=np.float64)
+
+
+def get_initial_scores(graph, node_ic=None):
+    """Get the initial similarity of each node: the information content of
+    the candidate normalized by the sum for all the candidates of the
+    entity or 1.0 if the information content is not used.
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :param node_ic: information content of each node (see 'get_node_ic'),
+        defaults to None
+    :type node_ic: numpy.ndarray, optional
+    :return: the initial scores
+    :rtype: numpy.ndarray
+    """
+
+    if node_ic is None:
+        return np.ones(len(graph))
+
+    normalization = np.bincount(
+        graph.node_entity, weights=node_ic, minlength=len(graph.entity_texts)
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return node_ic / normalization[graph.node_entity]
+
+
+def score_candidates(graph, finished, initial_scores):
+    """Combine the PPR walks into the score of each node. Each node
+    receives, from each other entity, the contribution (walks * initial
+    score) of the candidate of that entity with the highest contribution,
+    and its own initial score weighted by the average number of walks.
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :param finished: finished walks with format (sources, nodes, walks) (see
+        'personalized_pagerank')
+    :type finished: tuple
+    :param initial_scores: initial scores (see 'get_initial_scores')
+    :type initial_scores: numpy.ndarray
+    :return: the scores of the nodes
+    :rtype: numpy.ndarray
+    """
+
+    num_nodes = len(graph)
+    sources, nodes, walks = finished
+
+    with np.errstate(invalid="ignore"):
+        contributions = walks * initial_scores[sources]
+        # Competing candidates (and the node itself) do not contribute and
+        # only positive contributions are considered
+        keep = (graph.node_entity[sources] != graph.node_entity[nodes]) & (
+            contributions > 0
+        )
+
+    sources = sources[keep]
+    nodes = nodes[keep]
+    walks = walks[keep]
+    contributions = contributions[keep]
+    source_entity = graph.node_entity[sources]
+    # Best contribution of each entity to each node, with the ties broken by
+    # the first source as in 'np.argmax'
+    order = np.lexsort((sources, -contributions, source_entity, nodes))
+    groups = nodes[order] * len(graph.entity_texts) + source_entity[order]
+    best = order[np.flatnonzero(np.diff(groups, prepend=-1))]
+    coherence = np.bincount(
+        nodes[best], weights=contributions[best], minlength=num_nodes
+    )
+    used_walks = walks[best].sum()
+
+    # If there are no walks (no edges), the average is 1.0
+    ppr_averaged = 1.0
+
+    if used_walks >= 1:
+        ppr_averaged = used_walks / num_nodes
+
+    return coherence + ppr_averaged * initial_scores
+
+
+def select_candidate(scores, incounts):
+    """Select the best candidate of an entity. If the gap between the two
+    best scores is below GAP_LOWER_BOUND, the candidate with the highest
+    inCount (among the candidates with the best score, if there are several)
+    is selected.
+
+    :param scores: the scores of the candidates of the entity
+    :type scores: numpy.ndarray
+    :param incounts: the inCount of the candidates of the entity
+    :type incounts: numpy.ndarray
+    :return: the position of the selected candidate
+    :rtype: int
+    """
+
+    best = 0
+    best_score = 0.0
+    max_incount = 0
+    max_incount_best = 0
+
+    for pos, score in enumerate(scores):
+
+        if score >= best_score:
+            best_score = score
+            best = pos
+
+        if incounts[pos] >= max_incount:
+            max_incount = incounts[pos]
+            max_incount_best = pos
+
+    if len(scores) == 1:
+        return best
+
+    max_scored = [pos for pos, score in enumerate(scores) if score >= best_score]
+    gap = 0.0
+
+    if len(max_scored) == 1:
+        # NaN scores are sorted as the highest ones
+        sorted_scores = sorted(scores, key=lambda score: (score != score, score))
+        gap = best_score - sorted_scores[-2]
+
+    if gap < GAP_LOWER_BOUND:
+
+        if len(max_scored) > 1:
+            max_incount = 0
+
+            for pos in max_scored:
+
+                if incounts[pos] >= max_incount:
+                    max_incount = incounts[pos]
+                    best = pos
+
+        else:
+            best = max_incount_best
+
+    return best
+
+
+def disambiguate_graph(graph, node_ic=None, seed=SEED, mode="monte_carlo"):
+    """Select the best candidate for each entity of a disambiguation graph
+    with the PPR-IC model (or PPR, if the information content is not given).
+
+    :param graph: the disambiguation graph
+    :type graph: DisambiguationGraph
+    :param node_ic: information content of each node (see 'get_node_ic'),
+        defaults to None
+    :type node_ic: numpy.ndarray, optional
+    :param seed: seed of the random generator, defaults to SEED
+    :type seed: int, optional
+    :param mode: 'monte_carlo' (default) to simulate the random walks as the
+        Java implementation or 'exact' to compute them by power iteration
+    :type mode: str, optional
+    :return: best_nodes with the selected node of each entity
+    :rtype: list
+    """
+
+    if len(graph) == 0:
+        return []
+
+    if mode == "monte_carlo":
+        finished = personalized_pagerank(graph, np.random.default_rng(seed))
+
+    elif mode == "exact":
+        finished = personalized_pagerank_exact(graph)
+
+    else:
+        raise ValueError("Invalid mode!")
+
+    scores = score_candidates(graph, finished, get_initial_scores(graph, node_ic))
+    best_nodes = []
+
+    for entity in range(len(graph.entity_texts)):
+        nodes = np.flatnonzero(graph.node_entity == entity)
+        best = select_candidate(scores[nodes], graph.node_incount[nodes])
+        best_nodes.append(int(nodes[best]))
+
+    return best_nodes
+
+
+def disambiguate(doc_entities, ic=None, seed=SEED, mode="monte_carlo"):
+    """Select the best candidate for each entity of a document with the
+    PPR-IC model (or PPR, if the information content is not given).
+
+    :param doc_entities: the entities of the document with format
+        [(entity_text, candidates_list)]
+    :type doc_entities: list
+    :param ic: information content of each candidate url, defaults to None
+    :type ic: dict, optional
+    :param seed: seed of the random generator, defaults to SEED
+    :type seed: int, optional
+    :param mode: 'monte_carlo' (default) or 'exact' (see
+        'disambiguate_graph')
+    :type mode: str, optional
+    :return: best_candidates with format {entity_text: url}
+    :rtype: dict
+    """
+
+    graph = DisambiguationGraph.from_candidates(doc_entities)
+    node_ic = None
+
+    if ic is not None:
+        node_ic = get_node_ic(graph, ic)
+
+    best_nodes = disambiguate_graph(graph, node_ic=node_ic, seed=seed, mode=mode)
+
+    return {
+        entity_text: graph.node_url[node]
+        for entity_text, node in zip(graph.entity_texts, best_nodes)
+    }
+
+
+# -----------------------------------------------------------------------------
+#                       Batches of disambiguation graphs
+# -----------------------------------------------------------------------------
+class GraphBatch:
+    """Disambiguation graphs of several documents stored in columnar format:
+    the arrays of the graphs (see 'DisambiguationGraph') are concatenated,
+    with the node and entity indices local to each document, and the
+    boundaries of each document are given by 'doc_node_ptr',
+    'doc_entity_ptr' and 'doc_edge_ptr'. The graphs are built once and
+    each document is scored from slices of the arrays.
+
+    :param doc_ids: the identifiers of the documents
+    :type doc_ids: list
+    :param doc_node_ptr: position of the first node of each document
+    :type doc_node_ptr: numpy.ndarray
+    :param doc_entity_ptr: position of the first entity of each document
+    :type doc_entity_ptr: numpy.ndarray
+    :param doc_edge_ptr: position of the first edge of each document
+    :type doc_edge_ptr: numpy.ndarray
+    :param entity_texts: the entity texts of all documents
+    :type entity_texts: list
+    :param node_entity: the entity (index in the document) of each node
+    :type node_entity: numpy.ndarray
+    :param node_url: the candidate url of each node
+    :type node_url: list
+    :param node_incount: the candidate inCount of each node
+    :type node_incount: numpy.ndarray
+    :param node_ic: the information content of each node or None
+    :type node_ic: numpy.ndarray
+    :param degrees: the number of neighbors of each node
+    :type degrees: numpy.ndarray
+    :param indices: the neighbors (index in the document) of each node
+    :type indices: numpy.ndarray
+    """
+
+    __slots__ = [
+        "doc_ids",
+        "doc_node_ptr",
+        "doc_entity_ptr",
+        "doc_edge_ptr",
+        "entity_texts",
+        "node_entity",
+        "node_url",
+        "node_incount",
+        "node_ic",
+        "degrees",
+        "indices",
+    ]
+
+    def __init__(
+        self,
+        doc_ids,
+        doc_node_ptr,
+        doc_entity_ptr,
+        doc_edge_ptr,
+        entity_texts,
+        node_entity,
+        node_url,
+        node_incount,
+        node_ic,
+        degrees,
+        indices,
+    ):
+
+        self.doc_ids = doc_ids
+        self.doc_node_ptr = doc_node_ptr
+        self.doc_entity_ptr = doc_entity_ptr
+        self.doc_edge_ptr = doc_edge_ptr
+        self.entity_texts = entity_texts
+        self.node_entity = node_entity
+        self.node_url = node_url
+        self.node_incount = node_incount
+        self.node_ic = node_ic
+        self.degrees = degrees
+        self.indices = indices
+
+    @classmethod
+    def from_documents(cls, doc_candidates, ic=None):
+        """Build the disambiguation graphs of the given documents.
+
+        :param doc_candidates: the entities of each document with format
+            {doc_id: [(entity_text, candidates_list)]}
+        :type doc_candidates: dict
+        :param ic: information content of each candidate url, defaults to
+            None
+        :type ic: dict, optional
+        :return: the batch
+        :rtype: GraphBatch
+        """
+
+        doc_ids = []
+        entity_texts = []
+        node_url = []
+        node_entity = []
+        node_incount = []
+        degrees = []
+        indices = []
+        doc_node_ptr = [0]
+        doc_entity_ptr = [0]
+        doc_edge_ptr = [0]
+
+        for doc_id, doc_entities in doc_candidates.items():
+            graph = DisambiguationGraph.from_candidates(doc_entities)
+            doc_ids.append(doc_id)
+            entity_texts.extend(graph.entity_texts)
+            node_url.extend(graph.node_url)
+            node_entity.append(graph.node_entity)
+            node_incount.append(graph.node_incount)
+            degrees.append(np.diff(graph.indptr))
+            indices.append(graph.indices)
+            doc_node_ptr.append(doc_node_ptr[-1] + len(graph))
+            doc_entity_ptr.append(doc_entity_ptr[-1] + len(graph.entity_texts))
+            doc_edge_ptr.append(doc_edge_ptr[-1] + len(graph.indices))
+
+        def concatenate(arrays):
+            if len(arrays) == 0:
+                return np.zeros(0, dtype=np.int64)
+
+            return np.concatenate(arrays)
+
+        node_ic = None
+
+        if ic is not None:
+            node_ic = np.array([ic.get(url, 0.0) for url in node_url], dtype=np.float64)
+
+        return cls(
+            doc_ids,
+            np.array(doc_node_ptr, dtype=np.int64),
+            np.array(doc_entity_ptr, dtype=np.int64),
+            np.array(doc_edge_ptr, dtype=np.int64),
+            entity_texts,
+            concatenate(node_entity),
+            node_url,
+            concatenate(node_incount),
+            node_ic,
+            concatenate(degrees),
+            concatenate(indices),
+        )
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def graph(self, pos):
+        """Get the disambiguation graph of the document in the given position.
+
+        :param pos: the position of the document
+        :type pos: int
+        :return: the graph and the information content of its nodes (or None)
+        :rtype: tuple with DisambiguationGraph, numpy.ndarray
+        """
+
+        node_start, node_end = self.doc_node_ptr[pos : pos + 2]
+        entity_start, entity_end = self.doc_entity_ptr[pos : pos + 2]
+        edge_start, edge_end = self.doc_edge_ptr[pos : pos + 2]
+        indptr = np.zeros(node_end - node_start + 1, dtype=np.int64)
+        np.cumsum(self.degrees[node_start:node_end], out=indptr[1:])
+        graph = DisambiguationGraph(
+            self.entity_texts[entity_start:entity_end],
+            self.node_entity[node_start:node_end],
+            self.node_url[node_start:node_end],
+            self.node_incount[node_start:node_end],
+            indptr,
+            self.indices[edge_start:edge_end],
+        )
+        node_ic = None
+
+        if self.node_ic is not None:
+            node_ic = self.node_ic[node_start:node_end]
+
+        return graph, node_ic
+
+    def select(self, start, end):
+        """Get the batch with the documents in the positions [start, end).
+
+        :param start: position of the first document
+        :type start: int
+        :param end: position after the last document
+        :type end: int
+        :return: the batch
+        :rtype: GraphBatch
+        """
+
+        node_start, node_end = self.doc_node_ptr[[start, end]]
+        entity_start, entity_end = self.doc_entity_ptr[[start, end]]
+        edge_start, edge_end = self.doc_edge_ptr[[start, end]]
+        node_ic = None
+
+        if self.node_ic is not None:
+            node_ic = self.node_ic[node_start:node_end]
+
+        return GraphBatch(
+            self.doc_ids[start:end],
+            self.doc_node_ptr[start : end + 1] - node_start,
+            self.doc_entity_ptr[start : end + 1] - entity_start,
+            self.doc_edge_ptr[start : end + 1] - edge_start,
+            self.entity_texts[entity_start:entity_end],
+            self.node_entity[node_start:node_end],
+            self.node_url[node_start:node_end],
+            self.node_incount[node_start:node_end],
+            node_ic,
+            self.degrees[node_start:node_end],
+            self.indices[edge_start:edge_end],
+        )
+
+
+def build_results(doc_ids, entity_texts, urls):
+    """Build the structured array with the PPR results.
+
+    :param doc_ids: the document of each entity
+    :type doc_ids: list
+    :param entity_texts: the text of each entity
+    :type entity_texts: list
+    :param urls: the selected url of each entity
+    :type urls: list
+    :return: results with the fields 'doc_id', 'entity_text' and 'url'
+    :rtype: numpy.ndarray
+    """
+
+    def width(strings):
+        return max([len(string) for string in strings], default=0) + 1
+
+    results = np.empty(
+        len(urls),
+        dtype=[
+            ("doc_id", f"U{width(doc_ids)}"),
+            ("entity_text", f"U{width(entity_texts)}"),
+            ("url", f"U{width(urls)}"),
+        ],
+    )
+    results["doc_id"] = doc_ids
+    results["entity_text"] = entity_texts
+    results["url"] = urls
+
+    return results
+
+
+def disambiguate_batch(batch, seed=SEED, mode="monte_carlo"):
+    """Select the best candidate for each entity of the documents of a batch.
+
+    :param batch: the disambiguation graphs of the documents
+    :type batch: GraphBatch
+    :param seed: seed of the random generator, defaults to SEED
+    :type seed: int, optional
+    :param mode: 'monte_carlo' (default) or 'exact' (see
+        'disambiguate_graph')
+    :type mode: str, optional
+    :return: the selected url of each entity (see 'build_results')
+    :rtype: numpy.ndarray
+    """
+
+    doc_ids = []
+    urls = []
+
+    for pos, doc_id in enumerate(batch.doc_ids):
+        graph, node_ic = batch.graph(pos)
+        best_nodes = disambiguate_graph(graph, node_ic=node_ic, seed=seed, mode=mode)
+        doc_ids.extend([doc_id] * len(best_nodes))
+        urls.extend([graph.node_url[node] for node in best_nodes])
+
+    return build_results(doc_ids, batch.entity_texts, urls)
+
+
+def disambiguate_documents(
+    doc_candidates, ic=None, mode="monte_carlo", num_workers=None
+):
+    """Select the best candidate for each entity of the given documents. The
+    documents are scored in parallel if the batch includes at least
+    MIN_PARALLEL_NODES nodes.
+
+    :param doc_candidates: the entities of each document with format
+        {doc_id: [(entity_text, candidates_list)]}
+    :type doc_candidates: dict
+    :param ic: information content of each candidate url, defaults to None
+    :type ic: dict, optional
+    :param mode: 'monte_carlo' (default) or 'exact' (see
+        'disambiguate_graph')
+    :type mode: str, optional
+    :param num_workers: number of worker processes, defaults to None (the
+        number of CPUs)
+    :type num_workers: int, optional
+    :return: ppr_results, structured array with the fields 'doc_id',
+        'entity_text' and 'url', one record per disambiguated entity
+    :rtype: numpy.ndarray
+    """
+
+    batch = GraphBatch.from_documents(doc_candidates, ic=ic)
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    if num_workers <= 1 or batch.doc_node_ptr[-1] < MIN_PARALLEL_NODES:
+        return disambiguate_batch(batch, mode=mode)
+
+    # Chunks of contiguous documents with similar cost, which grows with the
+    # square of the number of nodes of each graph
+    costs = np.cumsum(np.diff(batch.doc_node_ptr) ** 2)
+    num_chunks = min(len(batch), num_workers * CHUNKS_PER_WORKER)
+    bounds = np.searchsorted(
+        costs, np.linspace(0, costs[-1], num_chunks + 1)[1:-1], side="right"
+    )
+    bounds = np.unique(np.concatenate([[0], bounds, [len(batch)]]))
+    executor = ProcessPoolExecutor(
+        max_workers=num_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    futures = [
+        executor.submit(disambiguate_batch, batch.select(start, end), mode=mode)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    chunk_results = [future.result() for future in futures]
+    executor.shutdown()
+
+    return build_results(
+        *(
+            [string for results in chunk_results for string in results[field]]
+            for field in ("doc_id", "entity_text", "url")
+        )
+    )
@@ -4,8 +4,27 @@ import bent.src.cfg as cfg
 import orjson as json
 import os
 import sys
-from bent.src.REEL.candidates import write_candidates_file, generate_candidates_list
-from bent.src.REEL.information_content import generate_ic_file
+from bent.src.REEL.candidates import (
+    add_candidate_links,
+    write_candidates_file,
+    generate_candidates_list,
+    batch_map_to_kb,
+    map_to_kb,
+)
+from bent.src.REEL.candidate_index import load_candidate_index
+from bent.src.REEL.cache import CandidateCache
+from bent.src.dicts.kb.binary_dicts import (
+    get_dict_keys,
+    get_dict_strings,
+    get_synonyms_dict_name,
+    load_kb_dict,
+)
+from bent.src.REEL.information_content import (
+    build_information_content_dict,
+    count_candidate_terms,
+    generate_ic_file,
+    load_intrinsic_ic,
+)
 from bent.src.NILINKER.predict_nilinker import load_model
 from bent.src.REEL.utils import ENTITY_STR, check_if_candidates_dir
 from bent.src.utils import garbage_collect
@@ -13,6 +32,50 @@ from bent.src.utils import garbage_collect
 sys.path.append("./")
 
 
+def get_ner_annotations(ner_dir, documents=None):
+    """Iterate over the recognized entities of each document, either parsed
+    from the annotations files located in 'ner_dir' or retrieved from the
+    given Document objects.
+
+    :param ner_dir: path to directory where the recognized entities are
+        stored in the annotations files
+    :type ner_dir: str
+    :param documents: Document objects including the recognized entities,
+        defaults to None
+    :type documents: list, optional
+    :return: tuples (doc_id, ner_annots), where ner_annots is a list of
+        (entity_type, entity_text) tuples
+    :rtype: generator
+    """
+
+    if documents is not None:
+
+        for doc in documents:
+            ner_annots = [(entity.type, entity.text) for entity in doc.entities]
+
+            yield doc.id, ner_annots
+
+    else:
+
+        for doc in os.listdir(ner_dir):
+            doc_id = doc.strip(".ann")
+            ner_annots = []
+
+            with open(f"{ner_dir}{doc}", "r", encoding="utf-8") as ner_doc:
+
+                for line in ner_doc.readlines():
+
+                    if line != "\n":
+                        line_data = line.split("\t")
+                        annot_type = line_data[1].split(" ")[0]
+                        entity_text = line_data[2].strip("\n")
+                        ner_annots.append((annot_type, entity_text))
+
+                ner_doc.close()
+
+            yield doc_id, ner_annots
+
+
 def build_entity_candidate_dict(
     ner_dir,
     candidates_dir,
@@ -29,6 +92,11 @@ def build_entity_candidate_dict(
     min_match_score,
     nil_mode=None,
     nilinker=None,
+    documents=None,
+    names_index=None,
+    synonyms_index=None,
+    batch_matching=True,
+    doc_candidates=None,
 ):
     """Build a dictionary including the candidates for all entity mentions in
         all the input documents.
@@ -62,6 +130,22 @@ def build_entity_candidate_dict(
     :param nilinker: the loaded NILINKER model if 'nil_mode'='NILINKER,
         defaults to None
     :type nilinker: _type_, optional
+    :param documents: Document objects including the recognized entities. If
+        not None, they are used instead of the annotations files in 'ner_dir'
+    :type documents: list, optional
+    :param names_index: index over the concept names of the KB, defaults to
+        None
+    :type names_index: CandidateIndex, optional
+    :param synonyms_index: index over the synonyms of the KB, defaults to None
+    :type synonyms_index: CandidateIndex, optional
+    :param batch_matching: if True (default), the best KB matches for all the
+        entities missing in the candidates cache are retrieved at once before
+        building the candidates files
+    :type batch_matching: bool, optional
+    :param doc_candidates: if not None, the candidates of each document are
+        added to it with format {doc_id: [(entity_text, candidates_list)]}
+        instead of being written to the candidates files, defaults to None
+    :type doc_candidates: dict, optional
 
     :return: entities_candidates (dict) with format
         {doc_id':' {mention:[candidate1, ...]} }, changed_cache_final (bool)
@@ -75,18 +159,85 @@ def build_entity_candidate_dict(
     doc_count = 0
     changed_cache_final = False
     kb_cache_up = None
-    names = set(name_to_id.keys())
-    synonyms = set(synonym_to_id.keys())
-    ner_out_docs = os.listdir(ner_dir)
+    names = get_dict_strings(name_to_id)
+    synonyms = get_dict_strings(synonym_to_id)
+
+    if batch_matching:
+        # Collect the entities of all documents and score them against the KB
+        # in a single multi-threaded pass, filling the candidates cache
+        entity_texts = []
 
-    for doc in ner_out_docs:
-        ner_annots = None
-        doc_id = doc.strip(".ann")
+        for doc_id, ner_annots in get_ner_annotations(ner_dir, documents=documents):
+            doc_abbrvs = abbreviations.get(doc_id, {})
 
-        with open(f"{ner_dir}{doc}", "r", encoding="utf-8") as ner_doc:
-            ner_annots = ner_doc.readlines()
-            ner_doc.close()
+            for annot_type, entity_text in ner_annots:
 
+                if annot_type.lower() == entity_type.lower():
+                    entity_texts.append(doc_abbrvs.get(entity_text, entity_text))
+
+        if batch_map_to_kb(
+            entity_texts,
+            names,
+            synonyms,
+            kb,
+            kb_cache,
+            names_index=names_index,
+            synonyms_index=synonyms_index,
+        ):
+            changed_cache_final = True
+
+        del entity_texts
+
+    nil_predictions = {}
+
+    if nil_mode == "NILINKER":
+        # Find the entities of all documents without KB matches (NIL
+        # entities) and predict their candidates with NILINKER in batches
+        nil_texts = {}
+        checked = set()
+
+        for doc_id, ner_annots in get_ner_annotations(ner_dir, documents=documents):
+            doc_abbrvs = abbreviations.get(doc_id, {})
+
+            for annot_type, entity_text in ner_annots:
+                search_text = doc_abbrvs.get(entity_text, entity_text)
+
+                if (
+                    annot_type.lower() != entity_type.lower()
+                    or (entity_text, search_text) in checked
+                ):
+                    continue
+
+                checked.add((entity_text, search_text))
+                matches, changed_cache, kb_cache_up = map_to_kb(
+                    entity_text,
+                    names,
+                    synonyms,
+                    name_to_id,
+                    synonym_to_id,
+                    kb,
+                    kb_cache,
+                    doc_abbrvs,
+                    names_index=names_index,
+                    synonyms_index=synonyms_index,
+                )
+
+                if changed_cache:
+                    changed_cache_final = True
+
+                if not any(
+                    match["match_score"] > min_match_score and match["kb_id"] != "NIL"
+                    for match in matches or []
+                ):
+                    nil_texts[entity_text] = None
+
+        nil_texts = list(nil_texts.keys())
+        nil_predictions = dict(zip(nil_texts, nilinker.batch_prediction(nil_texts)))
+
+        del checked
+        del nil_texts
+
+    for doc_id, ner_annots in get_ner_annotations(ner_dir, documents=documents):
         doc_count += 1
         check_entity = []
         doc_entities_final = []
@@ -97,14 +248,7 @@ def build_entity_candidate_dict(
 
         kb_id_2_id = {}
 
-        for line in ner_annots:
-            annot_type = ""
-            entity_text = ""
-
-            if line != "\n":
-                line_data = line.split("\t")
-                annot_type = line_data[1].split(" ")[0]
-                entity_text = line_data[2].strip("\n")
+        for annot_type, entity_text in ner_annots:
 
             if (
                 annot_type.lower() == entity_type.lower()
@@ -130,6 +274,8 @@ def build_entity_candidate_dict(
                         min_match_score,
                         doc_abbrvs,
                         kb_id_2_id,
+                        names_index=names_index,
+                        synonyms_index=synonyms_index,
                     )
                 )
 
@@ -146,7 +292,10 @@ def build_entity_candidate_dict(
                         if nil_mode == "NILINKER":
                             # Find top-k candidates with NILINKER and include
                             # them in the candidates file
-                            top_candidates = nilinker.prediction(entity_text)
+                            top_candidates = nil_predictions.get(entity_text)
+
+                            if top_candidates is None:
+                                top_candidates = nilinker.prediction(entity_text)
 
                         for cand in top_candidates:
                             kb_id = cand[0]
@@ -205,11 +354,21 @@ def build_entity_candidate_dict(
 
                 add_entity = [entity_str, candidates_list]
 
+                if doc_candidates is not None:
+                    add_entity = [entity_text, candidates_list]
+
                 doc_entities_final.append(add_entity)
 
                 del candidates_list
 
-        if doc_entities_final != []:
+        if doc_entities_final != [] and doc_candidates is not None:
+            # In this document there is at least 1 entity
+            add_candidate_links(
+                kb, doc_entities_final, link_mode, extracted_relations, kb_edges
+            )
+            doc_candidates[doc_id] = doc_entities_final
+
+        elif doc_entities_final != []:
             # In this document there is at least 1 entity
             # ------------------------------------------------------------------
             #                        Generate candidates files
@@ -235,7 +394,112 @@ def build_entity_candidate_dict(
     return changed_cache_final, kb_cache_up
 
 
-def pre_process(run_id, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviations):
+def load_kb_data(kb, entity_type, link_mode, nil_mode):
+    """Load the dictionaries of the given knowledge base and the remaining
+    resources that are necessary to link entities to it (extracted relations,
+    NILINKER model). The returned object can be reused across several runs
+    of REEL.
+
+    :param kb: target knowledge base
+    :type kb: str
+    :param entity_type: the type of the entities that will be linked
+    :type entity_type: str
+    :param link_mode: specifies the way the edges are built in the
+        disambiguation graphs ('corpus', 'kb', 'kb_corpus')
+    :type link_mode: str
+    :param nil_mode: model to deal with the NIL entities ('none' or 'NILINKER)
+    :type nil_mode: str
+    :return: kb_data with the keys 'name_to_id', 'synonym_to_id',
+        'names_index', 'synonyms_index', 'id_to_info', 'intrinsic_ic',
+        'kb_edges', 'extracted_relations' and 'nilinker'
+    :rtype: dict
+    """
+
+    # Load preprocessed dicts (memory-mapped if they were converted to the
+    # binary format)
+    kb_dicts_dir = f"{cfg.root_path}/data/kbs/dicts/{kb}/"
+    name_to_id = load_kb_dict(kb_dicts_dir, "name_to_id")
+    synonyms_dict_name = get_synonyms_dict_name(kb_dicts_dir)
+    synonym_to_id = load_kb_dict(kb_dicts_dir, synonyms_dict_name)
+
+    # Indexes to retrieve the most similar names and synonyms without
+    # comparing each entity with every string of large dictionaries
+    names_index = load_candidate_index(
+        kb_dicts_dir, "name_to_id", get_dict_keys(name_to_id)
+    )
+    synonyms_index = load_candidate_index(
+        kb_dicts_dir, synonyms_dict_name, get_dict_keys(synonym_to_id)
+    )
+
+    id_to_info = None
+    intrinsic_ic = None
+
+    if kb not in ("ncbi_gene", "ctd_gene"):
+        id_to_info = load_kb_dict(kb_dicts_dir, "id_to_info")
+        # Precomputed information content of the KB concepts
+        intrinsic_ic = load_intrinsic_ic(kb_dicts_dir, id_to_info)
+
+    # -------------------------------------------------------------------------
+    #                            Load NILINKER
+    # -------------------------------------------------------------------------
+    if nil_mode == "NILINKER":
+        # Prepare NILINKER and get compiled model ready to predict
+        # top_k defines the number of candidates that NILINKER wil return
+        # for each given entity
+        top_k = 1
+        nilinker = load_model(kb, top_k=int(top_k))
+
+    else:
+        nilinker = None
+
+    # -------------------------------------------------------------------------
+    #            Import relations to add to the disambiguation graphs
+    # -------------------------------------------------------------------------
+    extracted_relations = {}
+
+    if link_mode == "corpus" or link_mode == "kb_corpus":
+        relations_dir = f"{cfg.root_path}/data/relations/"
+        rel_filenames = os.listdir(relations_dir)
+        rel_filename = f"{entity_type}_{kb}_relations.json"
+
+        if rel_filename in rel_filenames:
+
+            with open(f"{relations_dir}{rel_filename}", "r", encoding="utf-8") as rel_file:
+                extracted_relations = json.loads(rel_file.read())
+                rel_file.close()
+
+    kb_edges = []
+
+    if kb not in ("ncbi_gene", "ctd_gene"):
+        kb_edges = load_kb_dict(kb_dicts_dir, "node_to_node")
+
+    kb_data = {
+        "name_to_id": name_to_id,
+        "synonym_to_id": synonym_to_id,
+        "names_index": names_index,
+        "synonyms_index": synonyms_index,
+        "id_to_info": id_to_info,
+        "intrinsic_ic": intrinsic_ic,
+        "kb_edges": kb_edges,
+        "extracted_relations": extracted_relations,
+        "nilinker": nilinker,
+    }
+
+    return kb_data
+
+
+def pre_process(
+    run_id,
+    ner_dir,
+    kb,
+    entity_type,
+    link_mode,
+    nil_mode,
+    abbreviations,
+    kb_data=None,
+    documents=None,
+    in_memory=False,
+):
     """Execute all pre-processing steps that are necessary to create the
         candidate files, which will be the input for the PPR algorithm. The
         candidate files will be located in the directory
@@ -262,6 +526,22 @@ def pre_process(run_id, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviat
     param abbreviations: abbreviations with format:
         {'doc_id': {'abbv1': 'long_form'}]
     :type abbreviations: dict
+    :param kb_data: the previously loaded dictionaries and resources for the
+        given knowledge base (see 'load_kb_data'). If None (default), they
+        are loaded from disk
+    :type kb_data: dict, optional
+    :param documents: Document objects including the recognized entities. If
+        not None (default), the annotations files in 'ner_dir' are not read
+    :type documents: list, optional
+    :param in_memory: if True, the candidates and the information content are
+        returned instead of being written to the candidates files and to the
+        information content file (input of the Java PPR implementation),
+        defaults to False
+    :type in_memory: bool, optional
+    :return: if 'in_memory' is True, doc_candidates with format
+        {doc_id: [(entity_text, candidates_list)]} and ic with format
+        {url: information_content}, otherwise None
+    :rtype: tuple with dict, dict
     """
 
     # -------------------------------------------------------------------------
@@ -278,87 +558,37 @@ def pre_process(run_id, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviat
     # -------------------------------------------------------------------------
     #                            Import KB info
     # -------------------------------------------------------------------------
+    if kb_data is None:
+        kb_data = load_kb_data(kb, entity_type, link_mode, nil_mode)
 
-    # Load preprocessed dicts
-    name_to_id = {}
-    synonym_to_id = {}
-    kb_dicts_dir = f"{cfg.root_path}/data/kbs/dicts/{kb}/"
-
-    with open(f"{kb_dicts_dir}name_to_id.json", "r", encoding="utf-8") as dict_file:
-        name_to_id = json.loads(dict_file.read())
-        dict_file.close()
-
-    synonyms_filepath = f"{kb_dicts_dir}synonym_to_id_full.json"
-
-    if "synonym_to_id_full.json" not in os.listdir(kb_dicts_dir):
-        synonyms_filepath = f"{kb_dicts_dir}synonym_to_id.json"
-
-    with open(synonyms_filepath, "r", encoding="utf-8") as dict_file2:
-        synonym_to_id = json.loads(dict_file2.read())
-        dict_file2.close()
-
-    id_to_info = None
-
-    if kb not in ("ncbi_gene", "ctd_gene"):
-        id_to_info_filepath = f"{kb_dicts_dir}id_to_info.json"
-
-        with open(id_to_info_filepath, "r", encoding="utf-8") as dict_file3:
-            id_to_info = json.loads(dict_file3.read())
-            dict_file3.close()
+    name_to_id = kb_data["name_to_id"]
+    synonym_to_id = kb_data["synonym_to_id"]
+    id_to_info = kb_data["id_to_info"]
+    kb_edges = kb_data["kb_edges"]
+    extracted_relations = kb_data["extracted_relations"]
+    nilinker = kb_data["nilinker"]
 
     # -------------------------------------------------------------------------
     #                  Import cache file (if available)
     # -------------------------------------------------------------------------
-    kb_cache_filename = f"{cfg.tmp_dir}/REEL/cache/{kb}.json"
-    kb_cache = {}
+    kb_cache = CandidateCache(kb, f"{cfg.tmp_dir}REEL/cache/candidates.db")
+    legacy_cache_filename = f"{cfg.tmp_dir}REEL/cache/{kb}.json"
 
-    if os.path.exists(kb_cache_filename):
-        cache_file = open(kb_cache_filename, "r", encoding="utf-8")
-        kb_cache = json.loads(cache_file.read())
-        cache_file.close()
+    if os.path.exists(legacy_cache_filename):
+        # Candidates cache of previous versions
+        kb_cache.import_json(legacy_cache_filename)
 
-    changed_cache_final = False
+        try:
+            os.replace(legacy_cache_filename, f"{legacy_cache_filename}.imported")
 
-    # -------------------------------------------------------------------------
-    #                            Load NILINKER
-    # -------------------------------------------------------------------------
-    if nil_mode == "NILINKER":
-        # Prepare NILINKER and get compiled model ready to predict
-        # top_k defines the number of candidates that NILINKER wil return
-        # for each given entity
-        top_k = 1
-        nilinker = load_model(kb, top_k=int(top_k))
-
-    else:
-        nilinker = None
-
-    # -------------------------------------------------------------------------
-    #            Import relations to add to the disambiguation graphs
-    # -------------------------------------------------------------------------
-    extracted_relations = {}
-
-    if link_mode == "corpus" or link_mode == "kb_corpus":
-        relations_dir = f"{cfg.root_path}/data/relations/"
-        rel_filenames = os.listdir(relations_dir)
-        rel_filename = f"{entity_type}_{kb}_relations.json"
-
-        if rel_filename in rel_filenames:
+        except OSError:
+            # Already imported by a concurrent run
+            pass
 
-            with open(f"{relations_dir}{rel_filename}", "r", encoding="utf-8") as rel_file:
-                extracted_relations = json.loads(rel_file.read())
-                rel_file.close()
+    changed_cache_final = False
 
     candidates_dir = check_if_candidates_dir(run_id)
 
-    kb_edges = []
-
-    if kb not in ("ncbi_gene", "ctd_gene"):
-        edges_filepath = f"{kb_dicts_dir}node_to_node.json"
-
-        with open(edges_filepath, "r", encoding="utf-8") as dict_file4:
-            kb_edges = json.loads(dict_file4.read())
-            dict_file4.close()
-
     # -------------------------------------------------------------------------
     #                   Build candidates lists for the entities
     # -------------------------------------------------------------------------
@@ -366,6 +596,10 @@ def pre_process(run_id, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviat
     # Min lexical similarity between entity text and candidate text:
     # exclude candidates with a lexical similarity below min_match_score
     min_match_score = 0.0
+    doc_candidates = None
+
+    if in_memory:
+        doc_candidates = {}
 
     # Prepare dataset for candidate generation
     changed_cache_final, kb_cache_up = build_entity_candidate_dict(
@@ -384,20 +618,18 @@ def pre_process(run_id, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviat
         min_match_score,
         nil_mode=nil_mode,
         nilinker=nilinker,
+        documents=documents,
+        names_index=kb_data.get("names_index"),
+        synonyms_index=kb_data.get("synonyms_index"),
+        doc_candidates=doc_candidates,
     )
 
     del nilinker
     del name_to_id
     del synonym_to_id
 
-    if changed_cache_final:
-        cache_out = json.dumps(kb_cache_up)
-
-        with open(kb_cache_filename, "wb") as cache_out_file:
-            cache_out_file.write(cache_out)
-            cache_out_file.close()
-
-        del cache_out
+    # New entries are written incrementally, only the last ones are pending
+    kb_cache.close()
 
     del kb_cache_up
     del kb_cache
@@ -410,8 +642,25 @@ def pre_process(run_id, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviat
     # INTRINSIC INFORMATION CONTENT:
     # Create information content file including every KB concept appearing
     # in candidates files
-    if kb not in ("ncbi_gene", "ctd_gene"):
-        generate_ic_file(run_id, candidates_dir, id_to_info)
+    if in_memory:
+        ic = build_information_content_dict(
+            None,
+            id_to_info,
+            mode="intrinsic",
+            term_counts=count_candidate_terms(doc_candidates),
+            intrinsic_ic=kb_data.get("intrinsic_ic"),
+        )
+
+    elif kb not in ("ncbi_gene", "ctd_gene"):
+        generate_ic_file(
+            run_id,
+            candidates_dir,
+            id_to_info,
+            intrinsic_ic=kb_data.get("intrinsic_ic"),
+        )
 
     # Free up memory usage
-    del id_to_info
\ No newline at end of file
+    del id_to_info
+
+    if in_memory:
+        return doc_candidates, ic
\ No newline at end of file
@@ -1,11 +1,82 @@
 #!/usr/bin/env python
 import os
 import bent.src.cfg as cfg
-from bent.src.REEL.pre_process import pre_process
+from bent.src.REEL.pre_process import load_kb_data, pre_process
+from bent.src.REEL.ppr import disambiguate_documents
 from bent.src.REEL.post_process import process_results
 
+# Use relations extracted from external corpora and relations described in
+# the targer knowledge base
+link_mode = "kb_corpus"
 
-def run(run_id, ner_dir, kb, entity_type, abbreviations, link_nil=False):
+# Implementation of the PPR algorithm: 'python' (in-process, see 'ppr.py') or
+# 'java' (subprocess running 'ppr_for_ned_all.java', which must be compiled)
+ppr_engine = "python"
+
+# Mode of the 'python' engine: 'monte_carlo' (random walks, as the Java
+# implementation) or 'exact' (deterministic power iteration)
+ppr_mode = "monte_carlo"
+
+# Number of worker processes used to score the documents with the 'python'
+# engine (None to use all CPUs)
+ppr_workers = None
+
+
+def get_nil_mode(kb, link_nil):
+    """Get the model to deal with the NIL entities of the given knowledge
+    base.
+
+    :param kb: target knowledge base
+    :type kb: str
+    :param link_nil: True to use NILINKER if it is available for the kb
+    :type link_nil: bool
+    :return: nil_mode, 'NILINKER' or None
+    :rtype: str
+    """
+
+    nil_mode = None
+
+    if link_nil:
+        #TODO: implement efficient NILINKER-ctd_chem model
+        available_kbs_nilinker = ["chebi", "medic", "go_bp", "hp"]
+
+        if kb in available_kbs_nilinker:
+            nil_mode = "NILINKER"
+
+    return nil_mode
+
+
+def load(kb, entity_type, link_nil=False):
+    """Load the knowledge base dictionaries and models that are necessary to
+    run REEL for the given knowledge base, so they can be reused in several
+    runs.
+
+    :param kb: target knowledge base
+    :type kb: str
+    :param entity_type: the type of the entities that will be linked
+    :type entity_type: str
+    :param link_nil: True to use NILINKER if it is available for the kb
+    :type link_nil: bool
+    :return: kb_data including the loaded dictionaries and models
+    :rtype: dict
+    """
+
+    nil_mode = get_nil_mode(kb, link_nil)
+
+    return load_kb_data(kb, entity_type, link_mode, nil_mode)
+
+
+def run(
+    run_id,
+    ner_dir,
+    kb,
+    entity_type,
+    abbreviations,
+    link_nil=False,
+    kb_data=None,
+    documents=None,
+    num_workers=None,
+):
     """Apply the REEL model (preprocess, candidate scoring with PPR,
     postprocess) to the entities present in files in ner_dir.
 
@@ -19,35 +90,50 @@ def run(run_id, ner_dir, kb, entity_type, abbreviations, link_nil=False):
     :param abbreviations: abbreviations with format:
         {'doc_id': {'abbv1': 'long_form'}]
     :type abbreviations: dict
-    :return: nel_run_id representing the identifier of the current run of REEL.
-        The results of the run will be located in the directory
+    :param kb_data: dictionaries and models previously loaded with 'load'. If
+        None (default), they are loaded from disk in this run
+    :type kb_data: dict, optional
+    :param documents: Document objects including the recognized entities. If
+        not None (default), the entities are retrieved from them instead of
+        the annotations files in 'ner_dir' and the results are not written to
+        the results directory
+    :type documents: list, optional
+    :param num_workers: number of worker processes used to score the
+        documents with the 'python' PPR engine. If None (default),
+        'ppr_workers' is used
+    :type num_workers: int, optional
+    :return: nel_run_id representing the identifier of the current run of REEL
+        and linked_entities with format
+        {'doc_id': {'entity_text': ('kb_id', 'entity_type')}}. If 'documents'
+        is None, the results of the run will also be located in the directory
         'tmp/REEL/results/<run_id/>'.
-    :rtype: str
+    :rtype: tuple with str, dict
     """
 
     nel_run_name = f"{run_id}/{entity_type}"
 
-    # Use relations extracted from external corpora and relations described in
-    # the targer knowledge base
-    link_mode = "kb_corpus"
-
     # Use NILINKER model if available
-    nil_mode = None
-    
-    if link_nil:
-        #TODO: implement efficient NILINKER-ctd_chem model
-        available_kbs_nilinker = ["chebi", "medic", "go_bp", "hp"]
-        
-        if kb in available_kbs_nilinker:
-            nil_mode = "NILINKER"
+    nil_mode = get_nil_mode(kb, link_nil)
+
     # -------------------------------------------------------------------------#
     #                        REEL: PRE_PROCESSING
     #        Pre-processes the corpus to create a candidates file for each
     #        document in dataset to allow further building of the
     #        disambiguation graph.
     # -------------------------------------------------------------------------#
-    pre_process(
-        nel_run_name, ner_dir, kb, entity_type, link_mode, nil_mode, abbreviations
+    in_memory = ppr_engine == "python" and kb not in ("ncbi_gene", "ctd_gene")
+
+    pre_processed = pre_process(
+        nel_run_name,
+        ner_dir,
+        kb,
+        entity_type,
+        link_mode,
+        nil_mode,
+        abbreviations,
+        kb_data=kb_data,
+        documents=documents,
+        in_memory=in_memory,
     )
 
     # ------------------------------------------------------------------------#
@@ -58,7 +144,22 @@ def run(run_id, ner_dir, kb, entity_type, abbreviations, link_nil=False):
     #         graph is built, it runs the PPR algorithm over the graph
     #         and ranks each candidate.
     # ------------------------------------------------------------------------#
-    if kb not in ("ncbi_gene", "ctd_gene"):
+    ppr_results = None
+
+    if in_memory:
+        doc_candidates, ic = pre_processed
+
+        if num_workers is None:
+            num_workers = ppr_workers
+
+        ppr_results = disambiguate_documents(
+            doc_candidates, ic=ic, mode=ppr_mode, num_workers=num_workers
+        )
+
+        del doc_candidates
+        del ic
+
+    elif kb not in ("ncbi_gene", "ctd_gene"):
         ppr_dir = f"{cfg.root_path}/src/REEL/"
         comm = f"java -classpath :{ppr_dir} ppr_for_ned_all {nel_run_name} ppr_ic"
         os.system(comm)
@@ -66,6 +167,12 @@ def run(run_id, ner_dir, kb, entity_type, abbreviations, link_nil=False):
     # ------------------------------------------------------------------------#
     #                         REEL: Post-processing
     # ------------------------------------------------------------------------#
-    process_results(nel_run_name, entity_type, kb)
+    linked_entities = process_results(
+        nel_run_name,
+        entity_type,
+        kb,
+        write_results=documents is None,
+        ppr_results=ppr_results,
+    )
 
-    return nel_run_name
+    return nel_run_name, linked_entities
@@ -2,33 +2,38 @@
 
 import bent.src.cfg as cfg
 import os
+import subprocess
+import tempfile
 
 
-def parse_Ab3P_output(filepaths, initial_dir):
+def get_doc_id(filepath):
+    """Get the document id from the name of a text or annotation file."""
+
+    if ".txt" in filepath or ".ann" in filepath:
+        return filepath[:-4]
+
+    return filepath
+
+
+def parse_Ab3P_output(filepaths, out_dir):
     """Parse the output of the Ab3P tool from a text file into a dictionary
     for later reuse.
 
-    :param filepaths: paths of the files that were outputted by Ab3P
+    :param filepaths: paths of the files that were processed by Ab3P
     :type filepaths: list
+    :param out_dir: path to the directory with the output files of Ab3P
+    :type out_dir: str
     :return: abbreviations with format: {'doc_id': {'abbv1': 'long_form'}]
     :rtype: dict
     """
 
     abbreviations = {}
-    doc_id = ""
 
     for filepath in filepaths:
         doc_abbrvs = {}
+        doc_id = get_doc_id(filepath)
 
-        if ".txt" in filepath or ".ann" in filepath:
-            doc_id = filepath[:-4]
-
-        else:
-            doc_id = filepath
-
-        filepath_up = f"tmp/{doc_id}_abbrvs"
-
-        with open(filepath_up, "r", encoding="utf-8") as out_file:
+        with open(f"{out_dir}{doc_id}_abbrvs", "r", encoding="utf-8") as out_file:
             data = out_file.readlines()
             out_file.close()
 
@@ -43,49 +48,75 @@ def parse_Ab3P_output(filepaths, initial_dir):
                         if score >= 0.90:
                             doc_abbrvs[line_data[0].strip(" ")] = line_data[1]
 
-        # Remove the generated txt files
-        comm1 = f"rm {filepath_up}"
-        os.system(comm1)
-
         abbreviations[doc_id] = doc_abbrvs
 
-    # Return to the original dir
-    os.chdir(initial_dir)
-
     return abbreviations
 
 
-def run_Ab3P(input_dir):
-    """Apply the abbreviation detector Ab3P in the texts located in input_dir.
+def identify_abbreviations(in_filepath, out_filepath):
+    """Run Ab3P for the given text file. Ab3P is run from its directory,
+    where its data files are, without changing the directory of the current
+    process.
+
+    :param in_filepath: absolute path to the text file
+    :type in_filepath: str
+    :param out_filepath: absolute path to the file where the output of Ab3P
+        is written
+    :type out_filepath: str
+    """
+
+    with open(out_filepath, "w", encoding="utf-8") as out_file:
+        subprocess.run(
+            ["./identify_abbr", in_filepath],
+            cwd=f"{cfg.root_path}/abbreviation_detector/Ab3P/",
+            stdout=out_file,
+            stderr=subprocess.DEVNULL,
+        )
+
+
+def run_Ab3P(input_dir=None, documents=None):
+    """Apply the abbreviation detector Ab3P in the texts located in input_dir
+    or in the texts of the given documents. The files of each run are written
+    to a separate temporary directory, so concurrent runs do not interfere.
 
     :param input_dir: path to the directory including the texts of the
-        documents where the entities were recognized
-    :type input_dir: str
+        documents where the entities were recognized, defaults to None
+    :type input_dir: str, optional
+    :param documents: Document objects whose texts will be processed instead
+        of the files in 'input_dir', defaults to None
+    :type documents: list, optional
     :return: abbreviations with format: {'doc_id': {'abbv1': 'long_form'}]
     :rtype: dict
     """
 
-    filepaths = [file for file in os.listdir(input_dir)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = f"{tmp_dir}/"
 
-    # change to Ab3P directory
-    cwd = os.getcwd()
-    os.chdir(cfg.root_path + "/abbreviation_detector/Ab3P/")
-    os.makedirs("tmp/", exist_ok=True)
+        if documents is not None:
+            # Ab3P only reads from files, so the texts are written to the
+            # temporary directory
+            filepaths = []
 
-    # Run Ab3P for each text file
-    for filepath in filepaths:
-        doc_id = ""
+            for doc in documents:
+                filepath = f"{doc.id}.txt"
 
-        if ".txt" in filepath or ".ann" in filepath:
-            doc_id = filepath[:-4]
+                with open(f"{tmp_dir}{filepath}", "w", encoding="utf-8") as txt_file:
+                    txt_file.write(doc.text)
+                    txt_file.close()
 
-        else:
-            doc_id = filepath
+                identify_abbreviations(
+                    f"{tmp_dir}{filepath}", f"{tmp_dir}{doc.id}_abbrvs"
+                )
+                filepaths.append(filepath)
 
-        comm = f"./identify_abbr ../../../{input_dir}{filepath} 2> /dev/null >> tmp/{doc_id}_abbrvs"
-        os.system(comm)
+        else:
+            filepaths = [file for file in os.listdir(input_dir)]
 
-    # Return to the original dir
-    # os.chdir('../../../')
+            # Run Ab3P for each text file
+            for filepath in filepaths:
+                identify_abbreviations(
+                    os.path.abspath(f"{input_dir}{filepath}"),
+                    f"{tmp_dir}{get_doc_id(filepath)}_abbrvs",
+                )
 
-    return parse_Ab3P_output(filepaths, cwd)
+        return parse_Ab3P_output(filepaths, tmp_dir)
@@ -3,6 +3,8 @@
 Classes that are the backbone of the package.
 Logical hierarchy: Entity -> Sentence -> Document -> Dataset
 """
+from array import array
+import numpy as np
 
 
 class Entity:
@@ -56,7 +58,9 @@ class Sentence:
 
         entity_pos = int()
 
-        for i, entity in enumerate(self.entities):
+        # The last entity with the same text and span is replaced
+        for i in range(len(self.entities) - 1, -1, -1):
+            entity = self.entities[i]
 
             if (
                 entity.text == entity_to_up.text
@@ -65,34 +69,65 @@ class Sentence:
             ):
 
                 entity_pos = i
+                break
 
-        self.entities.pop(entity_pos)
-        self.entities.insert(entity_pos, entity_to_up)
+        self.entities[entity_pos] = entity_to_up
 
     def remove_entity(self, entity):
 
-        if entity in self.entities:
+        try:
             self.entities.remove(entity)
 
+        except ValueError:
+            pass
+
 
 class Document:
     """Set with 1 or more sentences."""
 
-    __slots__ = ["text", "sentences", "entities", "length", "num_sents", "id"]
+    __slots__ = [
+        "text",
+        "sentences",
+        "_entities",
+        "_entities_stale",
+        "length",
+        "num_sents",
+        "id",
+    ]
 
     def __init__(self, text):
 
         self.text = text
         self.sentences = []
-        self.entities = []
+        self._entities = []
+        # The entities of the document are only rebuilt from the sentences
+        # when they are accessed after a sentence was updated
+        self._entities_stale = False
         self.length = len(text)
         self.num_sents = 0
         self.id = None
 
+    @property
+    def entities(self):
+
+        if self._entities_stale:
+            self._entities = [
+                entity for sent in self.sentences for entity in sent.entities
+            ]
+            self._entities_stale = False
+
+        return self._entities
+
+    @entities.setter
+    def entities(self, entities):
+
+        self._entities = entities
+        self._entities_stale = False
+
     def set_id(self, doc_id):
 
         assert isinstance(doc_id, str), "Invalid type for document ID"
-        self.id = id
+        self.id = doc_id
 
     def get_sentence(self, sentence_pos):
         return self.sentences[sentence_pos]
@@ -100,7 +135,9 @@ class Document:
     def add_sentence(self, sentence):
 
         self.sentences.append(sentence)
-        self.entities.extend(sentence.entities)
+
+        if not self._entities_stale:
+            self._entities.extend(sentence.entities)
 
     def add_sentence_in_specific_pos(self, sentence, sentence_pos):
 
@@ -115,19 +152,22 @@ class Document:
 
         self.sentences.extend(sentences)
 
-        for sent in sentences:
-            self.entities.extend(sent.entities)
+        if not self._entities_stale:
+
+            for sent in sentences:
+                self._entities.extend(sent.entities)
 
     def update_sentence(self, sent_up, sent_num):
 
-        self.remove_sentence_in_specific_pos(sent_num)
-        self.add_sentence_in_specific_pos(sent_up, sent_num)
+        if sent_num < len(self.sentences):
+            self.sentences[sent_num] = sent_up
 
-        # Update the entities associated with the inputed sentence
-        self.entities = []
+        else:
+            self.add_sentence_in_specific_pos(sent_up, sent_num)
 
-        for sent in self.sentences:
-            self.entities.extend(sent.entities)
+        # The entities associated with the inputed sentence are updated in the
+        # next access to 'entities'
+        self._entities_stale = True
 
     def add_entities(self, entities2add):
         """entities2add is a list containing 1 or more Entity objects
@@ -149,13 +189,15 @@ class Document:
 class Dataset:
     """Collection of 1 or more documents."""
 
-    __slots__ = ["documents", "num_docs", "doc_ids", "name"]
+    __slots__ = ["documents", "num_docs", "doc_ids", "doc_index", "name"]
 
     def __init__(self):
 
         self.documents = []
         self.num_docs = 0
         self.doc_ids = []
+        # Position of each document ID in 'documents'
+        self.doc_index = {}
         self.name = ""
 
     def ____str__(self):
@@ -174,6 +216,7 @@ class Dataset:
     def add_doc(self, document):
         """'document' is a Document object."""
 
+        self.doc_index.setdefault(document.id, len(self.documents))
         self.documents.append(document)
         self.doc_ids.append(document.id)
         self.num_docs += 1
@@ -181,6 +224,9 @@ class Dataset:
     def add_multi_doc(self, docs):
         """'docs' is a list containing more than 1 Document objects."""
 
+        for i, doc in enumerate(docs, start=len(self.documents)):
+            self.doc_index.setdefault(doc.id, i)
+
         self.documents.extend(docs)
         doc_ids_2_add = [doc.id for doc in docs]
         self.doc_ids.extend(doc_ids_2_add)
@@ -190,9 +236,8 @@ class Dataset:
         """'doc_up' is the updated Document object that will replace the old
         Document object represented by 'doc_id'."""
 
-        old_doc_index = self.doc_ids.index(doc_id)
-        self.documents.pop(old_doc_index)
-        self.documents.insert(old_doc_index, doc_up)
+        old_doc_index = self.doc_index[doc_id]
+        self.documents[old_doc_index] = doc_up
 
     def filter_by_type(self, entity_type):
         """Filter entities in the document by their type. returns dataset
@@ -205,13 +250,297 @@ class Dataset:
             doc_up = doc
             doc_up.remove_all_entities()
 
-            for sent in doc_up.sentences:
-
-                for entity in sent.entities:
-
-                    if entity.type == entity_type:
-                        sent.add_entity(entity)
+            for i, sent in enumerate(doc_up.sentences):
+                sent.entities = [
+                    entity for entity in sent.entities if entity.type == entity_type
+                ]
+                doc_up.update_sentence(sent, i)
 
             dataset_up.add_doc(doc_up)
 
         return dataset_up
+
+    def to_entity_store(self):
+        """Convert the entities of the dataset into a columnar EntityStore."""
+
+        return EntityStore.from_documents(self.documents)
+
+
+class EntityView:
+    """Read-only view of a row of an EntityStore, with the same attributes of
+    an Entity object."""
+
+    __slots__ = ["store", "row"]
+
+    def __init__(self, store, row):
+
+        self.store = store
+        self.row = row
+
+    @property
+    def start(self):
+        start = int(self.store.start[self.row])
+
+        return None if start == -1 else start
+
+    @property
+    def end(self):
+        end = int(self.store.end[self.row])
+
+        return None if end == -1 else end
+
+    @property
+    def text(self):
+        return self.store.texts[self.store.text_codes[self.row]]
+
+    @property
+    def type(self):
+        return self.store.types[self.store.type_codes[self.row]]
+
+    @property
+    def kb_id(self):
+        return self.store.kb_ids[self.store.kb_id_codes[self.row]]
+
+    @property
+    def score(self):
+        score = float(self.store.score[self.row])
+
+        return None if np.isnan(score) else score
+
+    @property
+    def sent_num(self):
+        sent_num = int(self.store.sent_num[self.row])
+
+        return None if sent_num == -1 else sent_num
+
+    @property
+    def doc_id(self):
+        return self.store.doc_ids[self.store.doc_num[self.row]]
+
+    def to_entity(self):
+        """Convert the view into an Entity object."""
+
+        return Entity(
+            self.start,
+            self.end,
+            self.text,
+            self.type,
+            self.kb_id,
+            self.score,
+            self.sent_num,
+        )
+
+
+class EntityStore:
+    """Columnar representation of the entities of a collection of documents.
+    The numeric attributes are stored in typed arrays and the strings (types,
+    texts, knowledge base identifiers) are interned, so each row only stores
+    integer codes. Missing values are represented by -1 (integers and codes)
+    and NaN (scores). The code of each string is kept in a dict, so the
+    filters do not search the interned strings."""
+
+    __slots__ = [
+        "doc_num",
+        "sent_num",
+        "start",
+        "end",
+        "score",
+        "type_codes",
+        "text_codes",
+        "kb_id_codes",
+        "doc_ids",
+        "types",
+        "texts",
+        "kb_ids",
+        "type_to_code",
+        "text_to_code",
+        "kb_id_to_code",
+    ]
+
+    def __init__(
+        self,
+        doc_num,
+        sent_num,
+        start,
+        end,
+        score,
+        type_codes,
+        text_codes,
+        kb_id_codes,
+        doc_ids,
+        types,
+        texts,
+        kb_ids,
+        type_to_code,
+        text_to_code,
+        kb_id_to_code,
+    ):
+
+        self.doc_num = doc_num
+        self.sent_num = sent_num
+        self.start = start
+        self.end = end
+        self.score = score
+        self.type_codes = type_codes
+        self.text_codes = text_codes
+        self.kb_id_codes = kb_id_codes
+        self.doc_ids = doc_ids
+        self.types = types
+        self.texts = texts
+        # The last element is returned for the missing identifiers (code -1)
+        self.kb_ids = kb_ids
+        self.type_to_code = type_to_code
+        self.text_to_code = text_to_code
+        self.kb_id_to_code = kb_id_to_code
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Build the store from an iterable of Document objects (e.g. the
+        generator returned by 'annotate_stream'), which are not kept in
+        memory.
+
+        :param documents: Document objects
+        :type documents: iterable
+        :return: store including the entities of all the documents
+        :rtype: EntityStore
+        """
+
+        doc_num = array("i")
+        sent_num = array("i")
+        start = array("q")
+        end = array("q")
+        score = array("f")
+        type_codes = array("i")
+        text_codes = array("i")
+        kb_id_codes = array("i")
+        doc_ids = []
+        type_to_code = {}
+        text_to_code = {}
+        kb_id_to_code = {}
+
+        for doc in documents:
+            doc_code = len(doc_ids)
+            doc_ids.append(doc.id)
+
+            for entity in doc.entities:
+                doc_num.append(doc_code)
+                sent_num.append(-1 if entity.sent_num is None else entity.sent_num)
+                start.append(-1 if entity.start is None else entity.start)
+                end.append(-1 if entity.end is None else entity.end)
+                score.append(np.nan if entity.score is None else entity.score)
+                type_codes.append(
+                    type_to_code.setdefault(entity.type, len(type_to_code))
+                )
+                text_codes.append(
+                    text_to_code.setdefault(entity.text, len(text_to_code))
+                )
+
+                if entity.kb_id is None:
+                    kb_id_codes.append(-1)
+
+                else:
+                    kb_id_codes.append(
+                        kb_id_to_code.setdefault(entity.kb_id, len(kb_id_to_code))
+                    )
+
+        return cls(
+            np.frombuffer(doc_num, dtype=np.int32),
+            np.frombuffer(sent_num, dtype=np.int32),
+            np.frombuffer(start, dtype=np.int64),
+            np.frombuffer(end, dtype=np.int64),
+            np.frombuffer(score, dtype=np.float32),
+            np.frombuffer(type_codes, dtype=np.int32),
+            np.frombuffer(text_codes, dtype=np.int32),
+            np.frombuffer(kb_id_codes, dtype=np.int32),
+            doc_ids,
+            list(type_to_code),
+            list(text_to_code),
+            list(kb_id_to_code) + [None],
+            type_to_code,
+            text_to_code,
+            kb_id_to_code,
+        )
+
+    def __len__(self):
+        return len(self.doc_num)
+
+    def __getitem__(self, row):
+        return EntityView(self, row)
+
+    def __iter__(self):
+
+        for row in range(len(self)):
+            yield EntityView(self, row)
+
+    def mask_by_type(self, entity_type):
+        """Boolean mask selecting the entities of the given type."""
+
+        if entity_type not in self.type_to_code:
+            return np.zeros(len(self), dtype=bool)
+
+        return self.type_codes == self.type_to_code[entity_type]
+
+    def mask_by_text(self, text):
+        """Boolean mask selecting the entities with the given text."""
+
+        if text not in self.text_to_code:
+            return np.zeros(len(self), dtype=bool)
+
+        return self.text_codes == self.text_to_code[text]
+
+    def mask_by_kb_id(self, kb_id):
+        """Boolean mask selecting the entities linked to the given knowledge
+        base identifier (None selects the entities that are not linked)."""
+
+        if kb_id is None:
+            return self.kb_id_codes == -1
+
+        if kb_id not in self.kb_id_to_code:
+            return np.zeros(len(self), dtype=bool)
+
+        return self.kb_id_codes == self.kb_id_to_code[kb_id]
+
+    def filter(self, mask):
+        """Get a new store with the entities selected by the given boolean
+        mask (or array of row indexes). The interned strings and their codes
+        are shared with the current store.
+
+        :param mask: boolean mask or row indexes
+        :type mask: numpy.ndarray
+        :return: the filtered store
+        :rtype: EntityStore
+        """
+
+        return EntityStore(
+            self.doc_num[mask],
+            self.sent_num[mask],
+            self.start[mask],
+            self.end[mask],
+            self.score[mask],
+            self.type_codes[mask],
+            self.text_codes[mask],
+            self.kb_id_codes[mask],
+            self.doc_ids,
+            self.types,
+            self.texts,
+            self.kb_ids,
+            self.type_to_code,
+            self.text_to_code,
+            self.kb_id_to_code,
+        )
+
+    def filter_by_type(self, entity_type):
+        """Get a new store with only the entities of the given type."""
+
+        return self.filter(self.mask_by_type(entity_type))
+
+    def count_by_type(self):
+        """Get the number of entities of each type.
+
+        :return: type_counts with format {'entity_type': count}
+        :rtype: dict
+        """
+
+        counts = np.bincount(self.type_codes, minlength=len(self.types))
+
+        return {ent_type: int(count) for ent_type, count in zip(self.types, counts)}
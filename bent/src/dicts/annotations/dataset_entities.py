@@ -12,6 +12,8 @@ import bent.src.cfg as cfg
 import json
 import os
 import sys
+from bent.src.dicts.kb.binary_dicts import get_dict_keys, load_kb_dict
+from bent.src.REEL.candidate_index import load_candidate_index
 
 
 def get_annotations_from_pubtator(filename, ent_types):
@@ -345,6 +347,15 @@ def build_annotations_dict(corpora_dir, dicts_dir, kb):
         out_file.write(output)
         out_file.close()
 
+    # The linking uses this dictionary instead of synonym_to_id, so its index
+    # is built here instead of in the first linking run
+    kb_dicts_dir = f"{dicts_dir}{kb}/"
+    load_candidate_index(
+        kb_dicts_dir,
+        "synonym_to_id_full",
+        get_dict_keys(load_kb_dict(kb_dicts_dir, "synonym_to_id_full")),
+    )
+
 
 def generate_annotation_dicts():
     corpora_dir = cfg.root_path + '/data/datasets/'
@@ -0,0 +1,499 @@
+#!/usr/bin/env python
+import orjson as json
+import os
+import shutil
+from collections.abc import Mapping, Sequence
+import numpy as np
+
+# Dictionaries of each KB that are converted to the binary format
+KB_DICT_NAMES = [
+    "name_to_id",
+    "synonym_to_id",
+    "synonym_to_id_full",
+    "id_to_name",
+    "id_to_info",
+    "node_to_node",
+    "alt_id_to_id",
+]
+
+
+class StringArray(Sequence):
+    """Array of strings stored in a single UTF-8 buffer, each string followed
+    by a newline, and the offsets of the strings in the buffer. When the
+    strings are sorted (by their UTF-8 encoding), 'find' and the 'in'
+    operator use a binary search. The strings are only decoded when
+    accessed, so a memory-mapped array uses almost no memory."""
+
+    __slots__ = ["blob", "offsets", "is_sorted"]
+
+    def __init__(self, blob, offsets, is_sorted=False):
+
+        self.blob = blob
+        self.offsets = offsets
+        self.is_sorted = is_sorted
+
+    @classmethod
+    def from_strings(cls, strings, is_sorted=False):
+        """Build the array of the given strings.
+
+        :param strings: the strings in the order they are stored
+        :type strings: list
+        :param is_sorted: True if the strings are sorted by their UTF-8
+            encoding, defaults to False
+        :type is_sorted: bool, optional
+        :raises ValueError: if a string includes a newline
+        :return: the array
+        :rtype: StringArray
+        """
+
+        if any("\n" in string for string in strings):
+            raise ValueError("The strings can not include newlines")
+
+        encoded = [string.encode("utf-8") + b"\n" for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        return cls(blob, offsets, is_sorted=is_sorted)
+
+    def save(self, out_dir, name):
+        np.save(f"{out_dir}/{name}_blob.npy", self.blob)
+        np.save(f"{out_dir}/{name}_offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, in_dir, name, is_sorted=False):
+        """Memory-map the array stored in the given directory.
+
+        :param in_dir: path to the directory
+        :type in_dir: str
+        :param name: name of the array
+        :type name: str
+        :param is_sorted: True if the strings are sorted, defaults to False
+        :type is_sorted: bool, optional
+        :return: the array
+        :rtype: StringArray
+        """
+
+        return cls(
+            np.load(f"{in_dir}/{name}_blob.npy", mmap_mode="r"),
+            np.load(f"{in_dir}/{name}_offsets.npy", mmap_mode="r"),
+            is_sorted=is_sorted,
+        )
+
+    def get_bytes(self, pos):
+        return self.blob[self.offsets[pos] : self.offsets[pos + 1] - 1].tobytes()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, pos):
+
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+
+        if pos < 0:
+            pos += len(self)
+
+        if pos < 0 or pos >= len(self):
+            raise IndexError(pos)
+
+        return self.get_bytes(pos).decode("utf-8")
+
+    def __iter__(self):
+        # Decode the strings in chunks instead of one at a time
+        chunk_size = 10000
+
+        for start in range(0, len(self), chunk_size):
+            end = min(start + chunk_size, len(self))
+            chunk = self.blob[self.offsets[start] : self.offsets[end]].tobytes()
+
+            yield from chunk.decode("utf-8").split("\n")[:-1]
+
+    def find(self, string):
+        """Get the position of the given string in a sorted array.
+
+        :param string: the string to find
+        :type string: str
+        :return: the position or -1 if the string is not in the array
+        :rtype: int
+        """
+
+        target = string.encode("utf-8")
+        low = 0
+        high = len(self)
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self.get_bytes(middle) < target:
+                low = middle + 1
+
+            else:
+                high = middle
+
+        if low < len(self) and self.get_bytes(low) == target:
+            return low
+
+        return -1
+
+    def __contains__(self, string):
+
+        if not isinstance(string, str):
+            return False
+
+        if self.is_sorted:
+            return self.find(string) != -1
+
+        return super().__contains__(string)
+
+
+class BinaryDict(Mapping):
+    """Read-only dictionary with string keys stored in the binary format
+    (sorted keys in a StringArray). The values are strings ('str'), lists
+    of strings ('list') or tuples of integers with the same length
+    ('tuple'), as in the KB dictionaries generated by 'generate_dicts'.
+    'node_to_node' is stored as a CSR adjacency list."""
+
+    __slots__ = ["keys_array", "kind", "codes", "indptr", "values_array", "matrix"]
+
+    def __init__(
+        self, keys_array, kind, codes=None, indptr=None, values_array=None, matrix=None
+    ):
+
+        self.keys_array = keys_array
+        self.kind = kind
+        # 'codes' are the positions of the values in 'values_array' (for the
+        # 'list' kind, the values of the key i are codes[indptr[i]:indptr[i+1]])
+        self.codes = codes
+        self.indptr = indptr
+        self.values_array = values_array
+        self.matrix = matrix
+
+    @classmethod
+    def from_dict(cls, kb_dict):
+        """Build the binary dictionary from a dictionary loaded from JSON.
+
+        :param kb_dict: the dictionary
+        :type kb_dict: dict
+        :return: the binary dictionary or None if the values of the
+            dictionary are not supported
+        :rtype: BinaryDict
+        """
+
+        keys = sorted(kb_dict.keys(), key=lambda key: key.encode("utf-8"))
+        keys_array = StringArray.from_strings(keys, is_sorted=True)
+        values = [kb_dict[key] for key in keys]
+
+        if all(isinstance(value, str) for value in values):
+            value_to_code = {}
+            codes = np.array(
+                [value_to_code.setdefault(value, len(value_to_code)) for value in values],
+                dtype=np.int32,
+            )
+
+            return cls(
+                keys_array,
+                "str",
+                codes=codes,
+                values_array=StringArray.from_strings(list(value_to_code.keys())),
+            )
+
+        if all(
+            isinstance(value, list) and all(isinstance(item, str) for item in value)
+            for value in values
+        ):
+            value_to_code = {}
+            codes = np.array(
+                [
+                    value_to_code.setdefault(item, len(value_to_code))
+                    for value in values
+                    for item in value
+                ],
+                dtype=np.int32,
+            )
+            indptr = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in values], out=indptr[1:])
+
+            return cls(
+                keys_array,
+                "list",
+                codes=codes,
+                indptr=indptr,
+                values_array=StringArray.from_strings(list(value_to_code.keys())),
+            )
+
+        if (
+            len(values) > 0
+            and all(isinstance(value, list) for value in values)
+            and len({len(value) for value in values}) == 1
+            and all(isinstance(item, int) for value in values for item in value)
+        ):
+            return cls(keys_array, "tuple", matrix=np.array(values, dtype=np.int64))
+
+        return None
+
+    def save(self, out_dir):
+        """Store the binary dictionary in the given directory, replacing any
+        previous version.
+
+        :param out_dir: path to the directory
+        :type out_dir: str
+        """
+
+        tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.keys_array.save(tmp_dir, "keys")
+
+        if self.kind == "tuple":
+            np.save(f"{tmp_dir}/matrix.npy", self.matrix)
+
+        else:
+            np.save(f"{tmp_dir}/codes.npy", self.codes)
+            self.values_array.save(tmp_dir, "values")
+
+            if self.kind == "list":
+                np.save(f"{tmp_dir}/indptr.npy", self.indptr)
+
+        with open(f"{tmp_dir}/meta.json", "wb") as meta_file:
+            meta_file.write(json.dumps({"kind": self.kind, "size": len(self)}))
+            meta_file.close()
+
+        # The directory is replaced at once, so a reader never finds an
+        # incomplete dictionary
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+
+        os.replace(tmp_dir, out_dir)
+
+    @classmethod
+    def load(cls, in_dir):
+        """Memory-map the binary dictionary stored in the given directory.
+
+        :param in_dir: path to the directory
+        :type in_dir: str
+        :return: the binary dictionary
+        :rtype: BinaryDict
+        """
+
+        with open(f"{in_dir}/meta.json", "rb") as meta_file:
+            kind = json.loads(meta_file.read())["kind"]
+            meta_file.close()
+
+        keys_array = StringArray.load(in_dir, "keys", is_sorted=True)
+
+        if kind == "tuple":
+            return cls(
+                keys_array, kind, matrix=np.load(f"{in_dir}/matrix.npy", mmap_mode="r")
+            )
+
+        indptr = None
+
+        if kind == "list":
+            indptr = np.load(f"{in_dir}/indptr.npy", mmap_mode="r")
+
+        return cls(
+            keys_array,
+            kind,
+            codes=np.load(f"{in_dir}/codes.npy", mmap_mode="r"),
+            indptr=indptr,
+            values_array=StringArray.load(in_dir, "values"),
+        )
+
+    def get_value(self, pos):
+
+        if self.kind == "str":
+            return self.values_array[int(self.codes[pos])]
+
+        if self.kind == "list":
+            return [
+                self.values_array[int(code)]
+                for code in self.codes[self.indptr[pos] : self.indptr[pos + 1]]
+            ]
+
+        return tuple(int(item) for item in self.matrix[pos])
+
+    def __getitem__(self, key):
+        pos = -1
+
+        if isinstance(key, str):
+            pos = self.keys_array.find(key)
+
+        if pos == -1:
+            raise KeyError(key)
+
+        return self.get_value(pos)
+
+    def __contains__(self, key):
+        return key in self.keys_array
+
+    def __iter__(self):
+        return iter(self.keys_array)
+
+    def __len__(self):
+        return len(self.keys_array)
+
+
+def get_dict_keys(kb_dict):
+    """Get the keys of a KB dictionary as a sequence with a fixed order.
+
+    :param kb_dict: dictionary loaded from JSON or BinaryDict
+    :type kb_dict: dict
+    :return: the keys of the dictionary
+    :rtype: list or StringArray
+    """
+
+    if isinstance(kb_dict, BinaryDict):
+        return kb_dict.keys_array
+
+    return list(kb_dict.keys())
+
+
+def get_dict_strings(kb_dict):
+    """Get the keys of a KB dictionary as a collection supporting fast
+    membership tests.
+
+    :param kb_dict: dictionary loaded from JSON or BinaryDict
+    :type kb_dict: dict
+    :return: the keys of the dictionary
+    :rtype: set or StringArray
+    """
+
+    if isinstance(kb_dict, BinaryDict):
+        return kb_dict.keys_array
+
+    return set(kb_dict.keys())
+
+
+def convert_dict(json_filepath, out_dir, key_format=None):
+    """Convert a KB dictionary stored in a JSON file to the binary format.
+
+    :param json_filepath: path to the JSON file
+    :type json_filepath: str
+    :param out_dir: path to the directory of the binary dictionary
+    :type out_dir: str
+    :param key_format: function applied to each key before the conversion,
+        defaults to None
+    :type key_format: function, optional
+    :return: True if the dictionary was converted, False if its values are
+        not supported
+    :rtype: bool
+    """
+
+    with open(json_filepath, "rb") as json_file:
+        kb_dict = json.loads(json_file.read())
+        json_file.close()
+
+    if key_format is not None:
+        kb_dict = {key_format(key): value for key, value in kb_dict.items()}
+
+    try:
+        binary_dict = BinaryDict.from_dict(kb_dict)
+
+    except ValueError:
+        binary_dict = None
+
+    del kb_dict
+
+    if binary_dict is None:
+        # The JSON file is still used
+        return False
+
+    binary_dict.save(out_dir)
+
+    return True
+
+
+def convert_kb_dicts(kb_dicts_dir, kb):
+    """Convert the JSON dictionaries of the given knowledge base to the binary
+    format, including the dictionary used by NILINKER.
+
+    :param kb_dicts_dir: path to the directory of the knowledge base
+        dictionaries
+    :type kb_dicts_dir: str
+    :param kb: the knowledge base
+    :type kb: str
+    """
+
+    for dict_name in KB_DICT_NAMES:
+        json_filepath = f"{kb_dicts_dir}{dict_name}.json"
+
+        if os.path.exists(json_filepath):
+            convert_dict(json_filepath, f"{kb_dicts_dir}{dict_name}_bin")
+
+    # NILINKER uses the identifiers with ':' instead of '_'
+    nilinker_filepath = f"{kb_dicts_dir}id_to_name.json"
+
+    if kb == "chebi":
+        nilinker_filepath = f"{kb_dicts_dir}id_to_name_nilinker.json"
+
+    if os.path.exists(nilinker_filepath):
+        convert_dict(
+            nilinker_filepath,
+            f"{kb_dicts_dir}nilinker_id_to_name_bin",
+            key_format=lambda key: key.replace("_", ":"),
+        )
+
+
+def get_synonyms_dict_name(kb_dicts_dir):
+    """Get the name of the synonyms dictionary used in the linking: the
+    dictionary extended with the entities of the training datasets
+    ('synonym_to_id_full'), if it exists, or 'synonym_to_id'.
+
+    :param kb_dicts_dir: path to the directory of the knowledge base
+        dictionaries
+    :type kb_dicts_dir: str
+    :return: the name of the dictionary
+    :rtype: str
+    """
+
+    if os.path.exists(f"{kb_dicts_dir}synonym_to_id_full.json") or os.path.exists(
+        f"{kb_dicts_dir}synonym_to_id_full_bin"
+    ):
+        return "synonym_to_id_full"
+
+    return "synonym_to_id"
+
+
+def load_kb_dict(kb_dicts_dir, dict_name):
+    """Load a KB dictionary, memory-mapping its binary version if it exists
+    and parsing the JSON file otherwise.
+
+    :param kb_dicts_dir: path to the directory of the knowledge base
+        dictionaries
+    :type kb_dicts_dir: str
+    :param dict_name: the name of the dictionary (e.g. 'name_to_id')
+    :type dict_name: str
+    :return: the dictionary
+    :rtype: BinaryDict or dict
+    """
+
+    binary_dir = f"{kb_dicts_dir}{dict_name}_bin"
+    json_filepath = f"{kb_dicts_dir}{dict_name}.json"
+
+    if os.path.exists(f"{binary_dir}/meta.json") and (
+        not os.path.exists(json_filepath)
+        or os.path.getmtime(json_filepath) <= os.path.getmtime(f"{binary_dir}/meta.json")
+    ):
+        # The binary version is ignored if the JSON file was replaced after
+        # the conversion
+        return BinaryDict.load(binary_dir)
+
+    with open(json_filepath, "rb") as dict_file:
+        kb_dict = json.loads(dict_file.read())
+        dict_file.close()
+
+    return kb_dict
+
+
+if __name__ == "__main__":
+    # Convert the dictionaries of the given KBs (all by default), e.g.:
+    # python -m bent.src.dicts.kb.binary_dicts medic chebi
+    import sys
+    import bent.src.cfg as cfg
+
+    dicts_dir = f"{cfg.root_path}/data/kbs/dicts/"
+    kbs = sys.argv[1:] or sorted(os.listdir(dicts_dir))
+
+    for kb in kbs:
+        print(f"Converting {kb} dictionaries...")
+        convert_kb_dicts(f"{dicts_dir}{kb}/", kb)
@@ -4,6 +4,10 @@ import bent.src.cfg as cfg
 import orjson as json
 import os
 from bent.src.dicts.kb.kb import KnowledgeBase
+from bent.src.dicts.kb.binary_dicts import (
+    convert_kb_dicts, get_dict_keys, get_synonyms_dict_name, load_kb_dict)
+from bent.src.REEL.candidate_index import load_candidate_index
+from bent.src.REEL.information_content import load_intrinsic_ic
 
 dict_dir = f"{cfg.root_path}/data/kbs/dicts/"
 
@@ -78,6 +82,24 @@ def generate_dicts_4_kb(kb=None, mode='reel', terms_filename=None,
         
         del id_to_name_nilinker
 
+    # Binary version of the dicts, memory-mapped by REEL and NILINKER
+    convert_kb_dicts(f"{out_dir}/", kb)
+
+    if mode == 'reel':
+        # Build the indexes used in the candidate generation (only for large
+        # dictionaries) so that they are not built in the first linking run.
+        # The synonyms dictionary is the one selected in the linking
+        for dict_name in ('name_to_id', get_synonyms_dict_name(f"{out_dir}/")):
+            kb_dict = load_kb_dict(f"{out_dir}/", dict_name)
+            load_candidate_index(
+                f"{out_dir}/", dict_name, get_dict_keys(kb_dict))
+
+        if kb not in ('ncbi_gene', 'ctd_gene'):
+            # Intrinsic information content of the KB concepts, used to rank
+            # the candidates in each linking run
+            load_intrinsic_ic(
+                f"{out_dir}/", load_kb_dict(f"{out_dir}/", 'id_to_info'))
+
     print(f"{kb} dictinaries created in {out_dir}")
 
 
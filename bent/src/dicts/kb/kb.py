@@ -11,6 +11,206 @@ data_dir = cfg.root_path + '/data/kbs/original_files/'
 
 csv.field_size_limit(100000000)
 
+
+def count_bits(bits):
+    """Count the bits set in the given integer."""
+
+    if hasattr(bits, 'bit_count'):
+        return bits.bit_count()
+
+    return bin(bits).count('1')
+
+
+def union_bits(bits, other_bits):
+    """Get the union of two bitsets with format (offset, bits), where the
+    bit i of 'bits' represents the node with offset + i."""
+
+    offset = min(bits[0], other_bits[0])
+
+    return offset, (bits[1] << (bits[0] - offset)) | (
+        other_bits[1] << (other_bits[0] - offset))
+
+
+def condense_graph(kb_graph):
+    """Find the strongly connected components of the given graph with an
+    iterative version of Tarjan's algorithm, which finds them in DFS
+    post-order of the condensation of the graph: each component is found
+    after all the components reachable from it.
+
+    :param kb_graph: the knowledge base graph
+    :type kb_graph: networkx.DiGraph
+    :return: members with the nodes of each component and successors with
+        the positions of the components linked from each component
+    :rtype: tuple with 2 lists
+    """
+
+    index = {}
+    low = {}
+    component_of = {}
+    stack = []
+    members = []
+    successors = []
+
+    for root in kb_graph:
+
+        if root in index:
+            continue
+
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        work = [(root, iter(kb_graph.successors(root)))]
+
+        while work:
+            node, neighbors = work[-1]
+
+            for neighbor in neighbors:
+
+                if neighbor not in index:
+                    index[neighbor] = low[neighbor] = len(index)
+                    stack.append(neighbor)
+                    work.append((neighbor, iter(kb_graph.successors(neighbor))))
+                    break
+
+                if neighbor not in component_of:
+                    # The neighbor is still in the stack
+                    low[node] = min(low[node], index[neighbor])
+
+            else:
+                work.pop()
+
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] == index[node]:
+                    component = len(members)
+                    component_members = []
+
+                    while True:
+                        member = stack.pop()
+                        component_of[member] = component
+                        component_members.append(member)
+
+                        if member == node:
+                            break
+
+                    # The components reachable from this one were already
+                    # found
+                    component_successors = {
+                        component_of[neighbor]
+                        for member in component_members
+                        for neighbor in kb_graph.successors(member)
+                    }
+                    component_successors.discard(component)
+                    members.append(component_members)
+                    successors.append(component_successors)
+
+    return members, successors
+
+
+def count_descendants(kb_graph):
+    """Count the descendants of every node of the given graph (the nodes
+    reachable from it, as 'nx.descendants') in a single pass over the
+    condensation of the graph (DAG of strongly connected components) in
+    DFS post-order, instead of a search for each node.
+
+    The components reachable from a component with several predecessors,
+    which is reachable from a component with several successors, are shared:
+    they may be reached through several successors of the same component,
+    so they are represented as bitsets (integers) that are the union of the
+    bitsets of the successors. Each bitset is released after all its
+    predecessors are processed. The remaining components are only reached
+    through one successor of each ancestor, so they are counted by adding
+    the counts of the successors. The offsets of the bits follow the DFS
+    post-order, so the bits reachable from a component are close to each
+    other.
+
+    :param kb_graph: the knowledge base graph
+    :type kb_graph: networkx.DiGraph
+    :return: num_descendants with format {node: number of descendants}
+    :rtype: dict
+    """
+
+    members, successors = condense_graph(kb_graph)
+    num_components = len(members)
+    num_predecessors = [0] * num_components
+
+    for component_successors in successors:
+
+        for successor in component_successors:
+            num_predecessors[successor] += 1
+
+    # The components are found after their successors, so the reverse order
+    # is a topological order. The paths from a component through different
+    # successors can only meet in a component with several predecessors
+    # below a component with several successors
+    below_branch = [False] * num_components
+    shared = [False] * num_components
+
+    for component in reversed(range(num_components)):
+
+        if num_predecessors[component] > 1 and below_branch[component]:
+            shared[component] = True
+
+        for successor in successors[component]:
+
+            if len(successors[component]) > 1 or below_branch[component]:
+                below_branch[successor] = True
+
+            if shared[component]:
+                shared[successor] = True
+
+    # Number of reachable nodes that are not shared
+    num_single = [0] * num_components
+    bits = {}
+    pending_predecessors = {}
+    offset = 0
+    num_descendants = {}
+
+    for component in range(num_components):
+        size = len(members[component])
+        component_bits = None
+
+        if shared[component]:
+            # Each node of the component is a bit
+            component_bits = (offset, (1 << size) - 1)
+            offset += size
+
+        else:
+            num_single[component] = size
+
+        for successor in successors[component]:
+            num_single[component] += num_single[successor]
+
+            if successor in bits:
+                successor_bits = bits[successor]
+                pending_predecessors[successor] -= 1
+
+                if pending_predecessors[successor] == 0:
+                    del bits[successor]
+
+                if component_bits is None:
+                    component_bits = successor_bits
+
+                else:
+                    component_bits = union_bits(component_bits, successor_bits)
+
+        num_reachable = num_single[component]
+
+        if component_bits is not None:
+            num_reachable += count_bits(component_bits[1])
+
+            if num_predecessors[component] > 0:
+                bits[component] = component_bits
+                pending_predecessors[component] = num_predecessors[component]
+
+        for node in members[component]:
+            # The node itself is not a descendant
+            num_descendants[node] = num_reachable - 1
+
+    return num_descendants
+
+
 class KnowledgeBase:
     """Represents a knowledge base that is loaded from a given local file."""
 
@@ -236,12 +436,13 @@ class KnowledgeBase:
         kb_graph = nx.DiGraph([edge for edge in edges])
         
         # Build id_to_info (KB-ID: (outdegree, indegree, num_descendants))
+        num_descendants = count_descendants(kb_graph)
+
         for node in kb_graph.nodes:
-            num_descendants = len(nx.descendants(kb_graph, node))
 
             id_to_info[node] = (
                 kb_graph.out_degree(node), kb_graph.in_degree(node),
-                num_descendants)
+                num_descendants[node])
 
         node_to_node = {}
 
@@ -336,12 +537,13 @@ class KnowledgeBase:
         kb_graph = nx.DiGraph([edge for edge in edges])
 
         # Build id_to_info (KB-ID: (outdegree, indegree, num_descendants))
+        num_descendants = count_descendants(kb_graph)
+
         for node in kb_graph.nodes:
-            num_descendants = len(nx.descendants(kb_graph, node))
 
             id_to_info[node] = (
                 kb_graph.out_degree(node), kb_graph.in_degree(node), 
-                num_descendants)
+                num_descendants[node])
 
         node_to_node = {}
 
@@ -421,12 +623,13 @@ class KnowledgeBase:
         kb_graph = nx.DiGraph([edge for edge in edges])
 
         # Build id_to_info (KB-ID: (outdegree, indegree, num_descendants))
+        num_descendants = count_descendants(kb_graph)
+
         for node in kb_graph.nodes:
-            num_descendants = len(nx.descendants(kb_graph, node))
 
             id_to_info[node] = (
                 kb_graph.out_degree(node), kb_graph.in_degree(node), 
-                num_descendants)
+                num_descendants[node])
 
         node_to_node = {}
         
@@ -535,12 +738,13 @@ class KnowledgeBase:
         kb_graph = nx.DiGraph([edge for edge in edges])
 
         # Build id_to_info (KB-ID: (outdegree, indegree, num_descendants))
+        num_descendants = count_descendants(kb_graph)
+
         for node in kb_graph.nodes:
-            num_descendants = len(nx.descendants(kb_graph, node))
 
             id_to_info[node] = (
                 kb_graph.out_degree(node), kb_graph.in_degree(node), 
-                num_descendants)
+                num_descendants[node])
 
         node_to_node = {}
         
@@ -1,19 +1,146 @@
 #!/usr/bin/env python
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 from bent.src.abbreviation_detector.run import run_Ab3P
-from bent.src.REEL.run import run
+from bent.src.REEL.run import load, run
+from bent.src.utils import _update_documents_with_nel_output
+
+# Knowledge base data loaded by each linking worker process (see
+# 'nel.get_executor'), reused in every run of the worker
+_worker_kb_data = {}
+
+
+def _load_worker_kb(kb, ent_type):
+    """Load the dictionaries and models of the given knowledge base in the
+    current worker process, if they were not loaded yet."""
+
+    if (ent_type, kb) not in _worker_kb_data:
+        _worker_kb_data[(ent_type, kb)] = load(kb, ent_type, link_nil=True)
+
+
+def _run_worker(run_id, ner_dir, kb, ent_type, abbreviations, documents, num_workers):
+    """Run REEL for the given knowledge base with the data loaded by the
+    current worker process (see 'run')."""
+
+    _load_worker_kb(kb, ent_type)
+
+    return run(
+        run_id,
+        ner_dir,
+        kb,
+        ent_type,
+        abbreviations,
+        link_nil=True,
+        kb_data=_worker_kb_data[(ent_type, kb)],
+        documents=documents,
+        num_workers=num_workers,
+    )
 
 
 class nel:
     """Represent a Named Entity Linking (NEL) pipeline"""
 
-    __slots__ = ["model", "run_id"]
+    __slots__ = [
+        "model",
+        "run_id",
+        "kb_data",
+        "num_workers",
+        "executors",
+        "kb_executor",
+    ]
 
-    def __init__(self, model, run_id):
+    def __init__(self, model, run_id, num_workers=None):
         self.model = model
         self.run_id = run_id
+        self.kb_data = {}
+        self.num_workers = num_workers
+        # Worker processes, created when needed, and the worker assigned to
+        # each knowledge base
+        self.executors = []
+        self.kb_executor = {}
+
+    def use_workers(self, target_kbs):
+        """Whether the entities are linked to the given knowledge bases by
+        worker processes."""
+
+        return (
+            self.num_workers is not None
+            and self.num_workers > 1
+            and len(target_kbs) > 1
+        )
+
+    def get_executor(self, ent_type, kb):
+        """Get the worker process assigned to the given knowledge base. The
+        knowledge bases are assigned to the workers in turn, so the data of
+        each knowledge base is only loaded by one worker, which keeps it
+        loaded until 'close' is called.
+
+        :return: the executor with the worker
+        :rtype: ProcessPoolExecutor
+        """
+
+        if (ent_type, kb) not in self.kb_executor:
+            pos = len(self.kb_executor) % self.num_workers
+
+            if pos == len(self.executors):
+                self.executors.append(
+                    ProcessPoolExecutor(
+                        max_workers=1,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                )
+
+            self.kb_executor[(ent_type, kb)] = self.executors[pos]
+
+        return self.kb_executor[(ent_type, kb)]
+
+    def close(self):
+        """Stop the worker processes of the pipeline, if any."""
+
+        for executor in self.executors:
+            executor.shutdown()
+
+        self.executors = []
+        self.kb_executor = {}
+
+    def load_kbs(self, target_kbs):
+        """Load into memory the dictionaries and models associated with the
+        target knowledge bases, so that they are reused in every subsequent
+        call of 'apply' instead of being loaded in each run.
 
-    def apply(self, target_kbs, ner_dir=None):
+        :param target_kbs: the entity types and the respective knowledge bases
+            to where the recognized entities will be linked
+        :type target_kbs: dict
+        :raises ValueError: if the selected model is different than
+            'reel_nilinker'
+        """
+
+        if self.model != "reel_nilinker":
+            raise ValueError("Model not implemented!")
+
+        if self.use_workers(target_kbs):
+            # The data is loaded by the worker assigned to each knowledge base
+            futures = [
+                nel.get_executor(self, ent_type, kb).submit(
+                    _load_worker_kb, kb, ent_type
+                )
+                for ent_type, kb in target_kbs.items()
+            ]
+
+            for future in futures:
+                future.result()
+
+            return
+
+        for ent_type in target_kbs.keys():
+            kb = target_kbs[ent_type]
+
+            if (ent_type, kb) not in self.kb_data:
+                self.kb_data[(ent_type, kb)] = load(kb, ent_type, link_nil=True)
+
+    def apply(self, target_kbs, ner_dir=None, documents=None):
         """Link or normalise input entities to target knwoledge bases using
         the previously specified model.
 
@@ -26,6 +153,11 @@ class nel:
         :param target_kbs: the entity types and the respective knowledge bases
             to where the recognized entities will be linked
         :type target_kbs: dict
+        :param documents: Document objects including the recognized entities.
+            If not None, the entities are linked in memory: the knowledge base
+            identifiers are set in the Entity objects of the documents and
+            'ner_dir' is not read. Defaults to None
+        :type documents: list, optional
         :raises ValueError: if the selected model is different than 'reel2'
         :return: nel_runs including the run ids (for each target knowledge base
             is generated a distinct run id) associated with the application of
@@ -45,28 +177,83 @@ class nel:
             # ----------------------------------------------------------------
             # Get abbreviations with AB3P in each document of the dataset
             # ----------------------------------------------------------------
-            abbreviations = run_Ab3P(ner_dir)  # CHeck if runs with NER_DIR specified
+            if documents is not None:
+                abbreviations = run_Ab3P(documents=documents)
+
+            else:
+                abbreviations = run_Ab3P(ner_dir)  # CHeck if runs with NER_DIR specified
+
+            linked_entities = {}
             
-            # ----------------------------------------------------------------
-            # Sequentially link entities to the respective target knowledge base
-            # ----------------------------------------------------------------
-            for ent_type in target_kbs.keys():
-                kb = target_kbs[ent_type]
+            if self.use_workers(target_kbs):
+                # ------------------------------------------------------------
+                # Concurrently link entities to the respective target knowledge
+                # bases: each run has its own directory
+                # '.tmp/<run_id>/<entity_type>/' and the worker assigned to
+                # each knowledge base keeps its dictionaries loaded. The CPUs
+                # are split among the workers, which use them to run PPR
+                # ------------------------------------------------------------
+                ppr_workers = max(
+                    1,
+                    (os.cpu_count() or 1) // min(self.num_workers, len(target_kbs)),
+                )
+                futures = {}
+
+                for ent_type in target_kbs.keys():
+                    future = nel.get_executor(
+                        self, ent_type, target_kbs[ent_type]
+                    ).submit(
+                        _run_worker,
+                        self.run_id,
+                        ner_dir,
+                        target_kbs[ent_type],
+                        ent_type,
+                        abbreviations,
+                        documents,
+                        ppr_workers,
+                    )
+                    futures[future] = ent_type
 
-                # Run REEL
-                nel_run_name = run(
-                    self.run_id,
-                    ner_dir,
-                    kb,
-                    ent_type,
-                    abbreviations,
-                    link_nil=True)
-                nel_runs.append(nel_run_name)
+                nel_run_names = {}
 
-                pbar.update(1)
+                for future in as_completed(futures):
+                    ent_type = futures[future]
+                    nel_run_names[ent_type], linked_entities[ent_type] = (
+                        future.result()
+                    )
+                    pbar.update(1)
+
+                # Keep the order of the target knowledge bases
+                nel_runs = [nel_run_names[ent_type] for ent_type in target_kbs]
+
+            else:
+                # ------------------------------------------------------------
+                # Sequentially link entities to the respective target
+                # knowledge base
+                # ------------------------------------------------------------
+                for ent_type in target_kbs.keys():
+                    kb = target_kbs[ent_type]
+
+                    # Run REEL
+                    nel_run_name, linked_entities[ent_type] = run(
+                        self.run_id,
+                        ner_dir,
+                        kb,
+                        ent_type,
+                        abbreviations,
+                        link_nil=True,
+                        kb_data=self.kb_data.get((ent_type, kb)),
+                        documents=documents,
+                    )
+                    nel_runs.append(nel_run_name)
+
+                    pbar.update(1)
 
             pbar.close()
 
+            if documents is not None:
+                _update_documents_with_nel_output(documents, linked_entities)
+
         else:
             raise ValueError("Model not implemented!")
 
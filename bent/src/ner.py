@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import os
 import orjson as json
+import torch
 from transformers import (
     AutoModelForTokenClassification,
     AutoTokenizer,
@@ -28,9 +29,10 @@ class ner:
         "cell_component_prob",
         "cell_line_prob",
         "variant_prob",
+        "batch_size",
     ]
 
-    def __init__(self, name, types, stopwords):
+    def __init__(self, name, types, stopwords, batch_size=None):
         """_summary_
 
         :param name: the name of the model that will be loaded
@@ -40,10 +42,16 @@ class ner:
         :param stopwords: frequent words ('the', 'and', 'of) that will not be
             considered as an entity
         :type stopwords: str
+        :param batch_size: maximum number of sentences that are padded
+            together and inputted to each model in a single forward pass. If
+            None (default), each sentence is inputted separately to the
+            models
+        :type batch_size: int, optional
         :raises ValueError: if the inputted model name is not 'pubmedbert'
         """
         self.name = name
         self.stopwords = stopwords
+        self.batch_size = batch_size
 
         module_root_path = cfg.root_path
         self.module_root_path = module_root_path
@@ -191,6 +199,161 @@ class ner:
 
         return type_dict
 
+    @staticmethod
+    def group_token_entities(token_entities):
+        """Group consecutive tokens classified with the same entity type
+        into entities, following the 'simple' aggregation strategy of the
+        'TokenClassificationPipeline' (Hugging Face library).
+
+        :param token_entities: the tokens of a given sentence with the
+            format (label, score, start, end)
+        :type token_entities: list
+        :return: raw_annots including the grouped entities with the same
+            format outputted by the 'TokenClassificationPipeline'
+        :rtype: list
+        """
+
+        raw_annots = []
+        group = []
+
+        for token in token_entities:
+            label = token[0]
+            bi, tag = "I", label
+
+            if label.startswith("B-") or label.startswith("I-"):
+                bi, tag = label[0], label[2:]
+
+            if group != [] and (tag != group[-1][1] or bi == "B"):
+                raw_annots.append(group)
+                group = []
+
+            group.append((token, tag))
+
+        if group != []:
+            raw_annots.append(group)
+
+        raw_annots = [
+            {
+                "entity_group": group[0][1],
+                "score": sum(token[1] for token, _ in group) / len(group),
+                "start": group[0][0][2],
+                "end": group[-1][0][3],
+            }
+            for group in raw_annots
+            if group[0][1] != "O"
+        ]
+
+        return raw_annots
+
+    @staticmethod
+    def tokenize_batches(tokenizer, sent_texts, batch_size):
+        """Tokenize the given sentences in padded batches with at most
+        'batch_size' sentences. The sentences are sorted by length so that
+        sentences with similar lengths are grouped in the same batch, which
+        reduces the padding.
+
+        :param tokenizer: the tokenizer associated with the model(s)
+        :type tokenizer: 'PreTrainedTokenizerFast' object
+        :param sent_texts: the texts of the sentences to tokenize
+        :type sent_texts: list
+        :param batch_size: maximum number of sentences in each batch
+        :type batch_size: int
+        :return: for each batch, the positions of its sentences in
+            'sent_texts', the model inputs, the character offsets of each token
+            and the mask of special tokens
+        :rtype: generator of tuples
+        """
+
+        order = sorted(range(len(sent_texts)), key=lambda i: len(sent_texts[i]))
+
+        for batch_start in range(0, len(order), batch_size):
+            batch_ids = order[batch_start : batch_start + batch_size]
+            inputs = tokenizer(
+                [sent_texts[i] for i in batch_ids],
+                padding=True,
+                truncation=True,
+                return_offsets_mapping=True,
+                return_special_tokens_mask=True,
+                return_tensors="pt",
+            )
+            offsets = inputs.pop("offset_mapping").tolist()
+            special_tokens = inputs.pop("special_tokens_mask").tolist()
+
+            yield batch_ids, inputs, offsets, special_tokens
+
+    @staticmethod
+    def logits_to_annots(logits, id2label, batch_ids, offsets, special_tokens, raw_annots):
+        """Convert the logits outputted by a model for a batch of sentences
+        into grouped entities, which are stored in 'raw_annots' in the
+        positions given by 'batch_ids'.
+        """
+
+        scores, labels = torch.softmax(logits, dim=-1).max(dim=-1)
+        scores = scores.tolist()
+        labels = labels.tolist()
+
+        for row, sent_id in enumerate(batch_ids):
+            token_entities = [
+                (id2label[labels[row][j]], scores[row][j], start, end)
+                for j, (start, end) in enumerate(offsets[row])
+                if not special_tokens[row][j]
+            ]
+            raw_annots[sent_id] = ner.group_token_entities(token_entities)
+
+    @staticmethod
+    def predict_batch(loaded_model, sent_texts, batch_size):
+        """Apply given model to several sentences at once. The sentences are
+        tokenized and padded together in batches with at most 'batch_size'
+        sentences, so that each batch requires a single forward pass of the
+        model.
+
+        :param loaded_model: the model that will be applied
+        :type loaded_model: 'TokenClassificationPipeline' object
+        :param sent_texts: the texts of the sentences to annotate
+        :type sent_texts: list
+        :param batch_size: maximum number of sentences in each batch
+        :type batch_size: int
+        :return: raw_annots including the recognized entities in each
+            sentence (same order as 'sent_texts'), with spans relative to the
+            respective sentence
+        :rtype: list
+        """
+
+        model = loaded_model.model
+        id2label = model.config.id2label
+        raw_annots = [[] for _ in sent_texts]
+
+        for batch_ids, inputs, offsets, special_tokens in ner.tokenize_batches(
+            loaded_model.tokenizer, sent_texts, batch_size
+        ):
+
+            with torch.no_grad():
+                logits = model(**inputs).logits
+
+            ner.logits_to_annots(
+                logits, id2label, batch_ids, offsets, special_tokens, raw_annots
+            )
+
+        return raw_annots
+
+    def predict(self, model, sent_texts):
+        """Apply the given NER model to a list of sentences, either sentence
+        by sentence or in batches if a 'batch_size' was defined.
+
+        :param model: the name of the model (entity type) to apply
+        :type model: str
+        :param sent_texts: the texts of the sentences to annotate
+        :type sent_texts: list
+        :return: raw_annots including the recognized entities in each
+            sentence
+        :rtype: list
+        """
+
+        if self.batch_size is None:
+            return [self.models[model](text) for text in sent_texts]
+
+        return ner.predict_batch(self.models[model], sent_texts, self.batch_size)
+
     @staticmethod
     def correct_tokens(sent, raw_annots, entity_type, stopwords):
         """Correct the output of BERT-based models by grouping tokens
@@ -461,36 +624,75 @@ class ner:
         # ---------------------------------------------------------------------
         # Resolve overlapping pairs of entities in each sentence of given doc
         # ---------------------------------------------------------------------
+        doc_entities = doc.entities
 
         # Get frequency of each entity
-        entity_frequency = ner.get_entity_frequency_in_doc(doc.entities)
+        entity_frequency = ner.get_entity_frequency_in_doc(doc_entities)
 
         # ---------------------------------------------------------------------
         # Resolve entities that have the same text, different entity type and
         # that are located in DIFFERENT SENTENCES of the document
         # ---------------------------------------------------------------------
-        doc_entities = doc.entities
 
-        for annot in doc_entities:
+        # Index the positions of the entities by their text: only entities
+        # with the same text are compared
+        text_index = {}
 
-            for annot2 in doc_entities:
+        for pos, annot in enumerate(doc_entities):
+            text_index.setdefault(annot.text, []).append(pos)
 
-                if annot.text == annot2.text and annot.type != annot2.type:
+        # 1st pass: pick the winner type of each text associated with more
+        # than one entity type, according to the same criteria as
+        # 'compare_entities_w_same_text' (probability, then frequency)
+        new_types = {}
 
-                    entity2keep, entity2remove = ner.compare_entities_w_same_text(
-                        self, annot, annot2, entity_frequency
+        for text, positions in text_index.items():
+            ranks = {}
+
+            for pos in positions:
+                ent_type = doc_entities[pos].type
+
+                if ent_type not in ranks:
+                    ranks[ent_type] = (
+                        ner.get_entity_prob(self, text, ent_type),
+                        entity_frequency[f"{text}_{ent_type}"],
                     )
 
-                    if entity2keep != None and entity2remove != None:
-                        sent = doc.get_sentence(entity2remove.sent_num)
-                        sent.remove_entity(entity2remove)
-                        doc.remove_entities([entity2remove])
+            if len(ranks) == 1:
+                continue
+
+            # The types tied with the best rank are kept, the entities with the
+            # other types get the first best type found in the document
+            best_rank = max(ranks.values())
+            winner = next(
+                ent_type for ent_type, rank in ranks.items() if rank == best_rank
+            )
+
+            for pos in positions:
+
+                if ranks[doc_entities[pos].type] != best_rank:
+                    new_types[pos] = winner
+
+        if len(new_types) == 0:
+            return doc
+
+        # 2nd pass: change the type of the losing entities, which are moved to
+        # the end of their sentence (given by 'sent_num', the position of the
+        # sentence in the document), in the document order
+        moved_by_sent = {}
+
+        for pos in sorted(new_types):
+            entity = doc_entities[pos]
+            entity.type = new_types[pos]
+            moved_by_sent.setdefault(entity.sent_num, []).append(entity)
 
-                        # Change the type of the deleted entity and add it again
-                        entity2add = entity2remove
-                        entity2add.type = entity2keep.type
-                        sent.add_entity(entity2add)
-                        doc.update_sentence(sent, sent.num)
+        for sent_num, sent_moved in moved_by_sent.items():
+            sent = doc.get_sentence(sent_num)
+            moved_ids = {id(entity) for entity in sent_moved}
+            sent.entities = [
+                entity for entity in sent.entities if id(entity) not in moved_ids
+            ] + sent_moved
+            doc.update_sentence(sent, sent_num)
 
         return doc
 
@@ -507,33 +709,60 @@ class ner:
         :rtype: Document object
         """
 
+        doc_entities = ner.apply_multi(self, [document])[0]
+
+        return doc_entities
+
+    def apply_multi(self, documents):
+        """Annotate several documents at once with the previously loaded
+        model(s). The sentences of all the given documents are inputted
+        together to each model, which allows the batched inference when a
+        'batch_size' was defined.
+
+        :param documents: doc_objs including all the information about the
+            input texts, such as their identifiers and their sentences
+        :type documents: list
+        :raises ValueError: if the loaded model has different type that 'bert'
+        :return: docs_entities including the inputted documents updated with
+            the recognized entities
+        :rtype: list
+        """
+
         if self.model_type == "bert":
-            doc_sentences = document.sentences
+            sent_texts = [sent.text for doc in documents for sent in doc.sentences]
 
-            for i, sent in enumerate(doc_sentences):
+            # Apply each model to all the sentences of the given documents
+            raw_annots = {
+                model: ner.predict(self, model, sent_texts) for model in self.models
+            }
 
-                for model in self.models:
-                    raw_annots = self.models[model](
-                        sent.text
-                    )  # truncation=True, padding=True)
-                    annots_up = ner.correct_tokens(
-                        sent, raw_annots, model, self.stopwords
-                    )
+            docs_entities = []
+            sent_count = 0
+
+            for document in documents:
+
+                for i, sent in enumerate(document.sentences):
 
-                    annots_obj = utils._objectify_entities(annots_up, i)
+                    for model in self.models:
+                        annots_up = ner.correct_tokens(
+                            sent, raw_annots[model][sent_count], model, self.stopwords
+                        )
 
-                    sent.add_multi_entities(annots_obj)
-                    document.update_sentence(sent, i)
+                        annots_obj = utils._objectify_entities(annots_up, i)
 
-            doc_entities = ner.correct_overlapping_annotations(self, document)
+                        sent.add_multi_entities(annots_obj)
+                        document.update_sentence(sent, i)
 
-            del doc_sentences
+                    sent_count += 1
+
+                doc_entities = ner.correct_overlapping_annotations(self, document)
+                docs_entities.append(doc_entities)
+
+            del sent_texts
             del raw_annots
-            del annots_up
-            del annots_obj
             utils.garbage_collect()
 
         else:
             raise ValueError("Model not implemented!")
 
-        return doc_entities
+        return docs_entities
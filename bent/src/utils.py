@@ -151,7 +151,10 @@ def output_parsed_docs(parsed_data, out_dir, recognize=False):
 
 
 def _convert_input_files(in_dir=None, input_text=None):
-    """Convert input file(s) into brat/standoff format"""
+    """Convert input file(s) into brat/standoff format. Returns the ids of
+    the created documents, in the input order."""
+
+    doc_ids = []
 
     if input_text is not None:
 
@@ -169,6 +172,10 @@ def _convert_input_files(in_dir=None, input_text=None):
                 txt_file.write(text)
                 txt_file.close()
 
+            doc_ids.append(doc_id)
+
+    return doc_ids
+
 
 # ------------------------------------------------------------------------------
 #                       TEXT PARSING AND OBJECTIFICATION
@@ -346,7 +353,7 @@ def _prepare_output_from_objects(doc, only_ner=True):
         annot_id = str(i + 1)
         doc_annots += f"T{annot_id}\t{entity.type} {entity.start} {entity.end}\t{entity.text}\n"
 
-        if not only_ner:
+        if not only_ner and entity.kb_id is not None:
             normalizations += f"N{annot_id}\tReference T{annot_id} {entity.kb_id}\t{entity.text}\n"
 
     if not only_ner:
@@ -443,17 +450,64 @@ def _update_dataset_with_nel_output(dataset, nel_run_ids):
                 key_name = entity.text + "_" + entity.type
 
                 if key_name in linked_entities:
+                    # The entity is updated in place, so the sentence and the
+                    # document already include it
                     kb_id = linked_entities[key_name][0]
                     entity.set_kb_id(kb_id)
-                    sent.update_entity(entity)
 
             doc.update_sentence(sent, i)
 
-    dataset.update_doc(doc, doc.id)
+        dataset.update_doc(doc, doc.id)
 
     return dataset
 
 
+def _update_documents_with_nel_output(documents, linked_entities):
+    """Set the knowledge base identifiers outputted by the Named Entity
+    Linking pipeline in the Entity objects of the given documents.
+
+    :param documents: Document objects including the output of the Named
+        Entity Recognition pipeline
+    :type documents: list
+    :param linked_entities: the results of the Named Entity Linking pipeline
+        for each entity type with format:
+        {'entity_type': {'doc_id': {'entity_text': ('kb_id', 'entity_type')}}}
+    :type linked_entities: dict
+    """
+
+    for doc in documents:
+
+        for sent in doc.sentences:
+
+            for entity in sent.entities:
+                doc_linked = linked_entities.get(entity.type, {}).get(doc.id, {})
+
+                if entity.text in doc_linked:
+                    entity.set_kb_id(doc_linked[entity.text][0])
+
+
+def _write_brat_output(dataset, out_dir):
+    """Output the entities (and the respective knowledge base identifiers, if
+    available) of each document of the given dataset to an annotations file
+    (BRAT format) located in 'out_dir'.
+
+    :param dataset: includes the documents and the respective entities
+    :type dataset: Dataset object
+    :param out_dir: path to the directory where the annotations files will be
+        located
+    :type out_dir: str
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    for doc in dataset.documents:
+        doc_annots = _prepare_output_from_objects(doc, only_ner=False)
+
+        with open(f"{out_dir}{doc.id}.ann", "w", encoding="utf-8") as out_file:
+            out_file.write(doc_annots[:-1])
+            out_file.close()
+
+
 def _update_ner_file_with_nel_output(ner_dir, nel_run_ids, out_dir=None):
     """Update annotations file generated in the Named Entity Recognition step
     with the output of the Named Entity Linking pipeline, i.e. knowledge base
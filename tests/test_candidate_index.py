@@ -0,0 +1,97 @@
+"""Checks of the exact mode of the candidate index against the complete scan
+of 'process.extract' on a small synthetic dictionary."""
+import random
+import pytest
+
+pytest.importorskip("rapidfuzz")
+
+from rapidfuzz import process, fuzz
+from bent.src.REEL.candidate_index import CandidateIndex
+from bent.src.REEL.candidates import get_batch_top_matches, get_top_matches
+
+SYLLABLES = [
+    "ab", "ro", "mel", "tin", "ase", "pro", "chlor", "ide", "ox", "yl",
+    "meth", "eth", "an", "ol", "in", "gen", "cyt", "ic", "acid", "ne",
+]
+LIMITS = [1, 5, 10]
+
+
+def random_name(rng):
+    words = [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+        for _ in range(rng.randint(1, 4))
+    ]
+
+    return " ".join(words) + rng.choice(["", "-1", " (X)", " 2"])
+
+
+@pytest.fixture(scope="module")
+def choices():
+    rng = random.Random(0)
+
+    return list(dict.fromkeys(random_name(rng) for _ in range(3000)))
+
+
+@pytest.fixture(scope="module")
+def index(choices):
+    return CandidateIndex.build(choices)
+
+
+@pytest.fixture(scope="module")
+def queries(choices):
+    rng = random.Random(1)
+    queries = [rng.choice(choices) for _ in range(20)]
+    queries += [random_name(rng) for _ in range(30)]
+    # Misspelled names, strings without trigrams and unrelated strings
+    queries += [query[:-2] + "zz" for query in queries[:20]]
+
+    return queries + ["x", "12", "zzqq", "eth eth eth eth", "---"]
+
+
+def expected_matches(query, choices, limit):
+    """Top matches of the complete scan, with the ties ordered by index."""
+
+    matches = process.extract(query, choices, scorer=fuzz.token_sort_ratio, limit=None)
+
+    return sorted(matches, key=lambda match: (-match[1], match[2]))[:limit]
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_extract_matches_process_extract(choices, index, queries, limit, tmp_path):
+    index.save(str(tmp_path))
+    loaded = CandidateIndex.load(str(tmp_path), choices)
+
+    for query in queries:
+        expected = expected_matches(query, choices, limit)
+
+        assert index.extract(query, limit=limit) == expected, query
+        assert loaded.extract(query, limit=limit) == expected, query
+        # Same scores as 'process.extract' (which may order the ties
+        # differently)
+        assert [match[1] for match in expected] == [
+            match[1]
+            for match in process.extract(
+                query, choices, scorer=fuzz.token_sort_ratio, limit=limit
+            )
+        ], query
+
+
+def test_load_rejects_other_choices(choices, index, tmp_path):
+    index.save(str(tmp_path))
+
+    assert CandidateIndex.load(str(tmp_path), choices[:-1] + ["other"]) is None
+
+
+def test_get_top_matches_with_index(choices, index, queries):
+    for query in queries:
+        assert get_top_matches(query, choices, 5, index) == expected_matches(
+            query, choices, 5
+        ), query
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_batch_top_matches(choices, index, queries, limit):
+    expected = [expected_matches(query, choices, limit) for query in queries]
+
+    assert get_batch_top_matches(queries, choices, limit) == expected
+    assert get_batch_top_matches(queries, choices, limit, index) == expected
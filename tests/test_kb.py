@@ -0,0 +1,44 @@
+"""Checks of 'count_descendants' against 'nx.descendants' on random graphs."""
+import pytest
+
+nx = pytest.importorskip("networkx")
+pytest.importorskip("obonet")
+
+from bent.src.dicts.kb.kb import count_descendants
+
+SEEDS = range(30)
+
+
+def expected_descendants(kb_graph):
+    return {node: len(nx.descendants(kb_graph, node)) for node in kb_graph.nodes()}
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("num_nodes, edge_prob", [(10, 0.2), (40, 0.05), (80, 0.03)])
+def test_count_descendants_dag(seed, num_nodes, edge_prob):
+    # Only the edges between increasing nodes, so there are no cycles but
+    # several paths between the same nodes
+    random_graph = nx.gnp_random_graph(num_nodes, edge_prob, seed=seed, directed=True)
+    kb_graph = nx.DiGraph()
+    kb_graph.add_nodes_from(random_graph.nodes())
+    kb_graph.add_edges_from((u, v) for u, v in random_graph.edges() if u < v)
+
+    assert count_descendants(kb_graph) == expected_descendants(kb_graph)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("num_nodes, edge_prob", [(10, 0.15), (40, 0.04), (80, 0.02)])
+def test_count_descendants_cycles(seed, num_nodes, edge_prob):
+    kb_graph = nx.gnp_random_graph(num_nodes, edge_prob, seed=seed, directed=True)
+    kb_graph.add_edge(0, 0)
+
+    assert count_descendants(kb_graph) == expected_descendants(kb_graph)
+
+
+def test_count_descendants_deep_graph():
+    # Deeper than the recursion limit
+    kb_graph = nx.DiGraph()
+    nx.add_path(kb_graph, range(5000))
+    kb_graph.add_edge(0, 2500)
+
+    assert count_descendants(kb_graph) == {node: 4999 - node for node in range(5000)}
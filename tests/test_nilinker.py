@@ -0,0 +1,68 @@
+"""Checks of the batched and NumPy NILINKER predictions against the eager
+TensorFlow model. They need TensorFlow and the NILINKER files of the partition (see
+'get_data.sh'), otherwise they are skipped."""
+import os
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from bent.src.NILINKER.numpy_nilinker import NumpyNilinker
+from bent.src.NILINKER.predict_nilinker import get_model_dir, load_tf_model
+from bent.src.NILINKER.utils import WordConcept
+
+PARTITION = "medic"
+
+# Words with different numbers of candidates (padding), single-word entities
+# and words outside the embeddings vocabulary
+ENTITY_STRS = [
+    "type 2 diabetes mellitus",
+    "cancer",
+    "breast neoplasms",
+    "acute kidney injury",
+    "xqzvk lymphoma",
+    "hypertension",
+    "chronic obstructive pulmonary disease",
+    "zzqx",
+    "left ventricular hypertrophy",
+    "alzheimer disease",
+]
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(f"{get_model_dir(PARTITION)}best.h5"),
+    reason="the NILINKER files are not available",
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    return load_tf_model(PARTITION, top_k=5)
+
+
+def test_batch_call_matches_eager_call(model):
+    batch_ids = model.get_top_candidate_ids(ENTITY_STRS, batch_size=4)
+
+    for entity_str, entity_batch_ids in zip(ENTITY_STRS, batch_ids):
+        input_entity = tf.constant([model.get_input_entity(entity_str)], tf.int64)
+        eager_ids = model(input_entity)[1][0]
+
+        assert eager_ids == entity_batch_ids, entity_str
+
+
+def test_numpy_model_matches_tf_model(model):
+    wc = WordConcept(PARTITION)
+    wc.build()
+    weights = {
+        "W_a": model.attention_layer.W_a.numpy(),
+        "b_a": model.attention_layer.b_a.numpy(),
+        "W_c": model.phrase_layer.W_c.numpy(),
+        "b_c": model.phrase_layer.b_c.numpy(),
+        "word_embeds": model.word_embeds.numpy(),
+        "candidate_embeds": model.candidate_embeds.numpy(),
+    }
+    numpy_model = NumpyNilinker(
+        weights, wc, model.id_to_name, model.embeds_word2id, top_k=model.top_k
+    )
+
+    assert numpy_model.batch_prediction(
+        ENTITY_STRS, batch_size=4
+    ) == model.batch_prediction(ENTITY_STRS, batch_size=4)
@@ -0,0 +1,248 @@
+"""Checks of the NumPy PPR against the Java implementation
+('ppr_for_ned_all.java'). The Java scoring ('combinePPR' with
+'secondconst') and selection ('findBestCandidate') are transliterated below
+and compared on small random documents with fixed seeds."""
+import random
+import numpy as np
+import pytest
+
+from bent.src.REEL import ppr
+
+SEEDS = range(20)
+
+
+def random_doc_entities(seed, num_entities=6, num_ids=15):
+    """Random document with overlapping candidates between the entities and
+    random links between the candidate ids."""
+
+    rng = random.Random(seed)
+    doc_entities = []
+
+    for entity in range(num_entities):
+        cand_ids = rng.sample(range(num_ids), rng.randint(1, 4))
+        candidates_list = [
+            {
+                "id": str(cand_id),
+                "url": f"ID:{cand_id}",
+                "incount": str(rng.randint(0, 3)),
+                "links": ";".join(
+                    str(link) for link in rng.sample(range(num_ids), rng.randint(0, 3))
+                ),
+            }
+            for cand_id in cand_ids
+        ]
+        doc_entities.append((f"entity {entity}", candidates_list))
+
+    return doc_entities
+
+
+def java_combine_ppr(graph, finished, initial_scores):
+    """Transliteration of 'combinePPR' with 'secondconst': the starts and the
+    endpoints are iterated in ascending order (as the Java HashMaps with small
+    integer keys) and the best contributor of each entity is only replaced by
+    a strictly higher contribution."""
+
+    walks_by_start = {}
+
+    for source, node, walks in zip(*finished):
+        walks_by_start.setdefault(int(source), {})[int(node)] = walks
+
+    contributors = {}
+
+    for start in sorted(walks_by_start):
+        start_entity = graph.node_entity[start]
+
+        for endpoint in sorted(walks_by_start[start]):
+            if endpoint == start or graph.node_entity[endpoint] == start_entity:
+                continue
+
+            walks = walks_by_start[start][endpoint]
+            entity_contributors = contributors.setdefault(endpoint, {})
+            old_walks, old_score = entity_contributors.get(start_entity, (0, 0.0))
+
+            if walks * initial_scores[start] > old_walks * old_score:
+                entity_contributors[start_entity] = (walks, initial_scores[start])
+
+    coherence = np.zeros(len(graph))
+    ppr_averaged = 0.0
+
+    for endpoint, entity_contributors in contributors.items():
+
+        for walks, initial_score in entity_contributors.values():
+            coherence[endpoint] += walks * initial_score
+            ppr_averaged += walks
+
+    ppr_averaged = 1.0 if ppr_averaged < 1.0 else ppr_averaged / len(graph)
+
+    return coherence + ppr_averaged * initial_scores
+
+
+def java_find_best_candidate(scores, incounts):
+    """Transliteration of 'findBestCandidate' with tie breaking."""
+
+    best = 0
+    best_score = 0.0
+    max_incount_best = 0
+    max_incount = 0
+
+    for pos in range(len(scores)):
+
+        if scores[pos] >= best_score:
+            best_score = scores[pos]
+            best = pos
+
+        if incounts[pos] >= max_incount:
+            max_incount = incounts[pos]
+            max_incount_best = pos
+
+    if len(scores) == 1:
+        return best
+
+    sorted_scores = sorted(scores)
+    total_max_scored = 0
+    max_scored_best = 0
+    max_scored_incount = 0
+
+    for pos in range(len(scores)):
+
+        if scores[pos] >= best_score:
+            total_max_scored += 1
+
+            if incounts[pos] >= max_scored_incount:
+                max_scored_incount = incounts[pos]
+                max_scored_best = pos
+
+    gap = 0.0 if total_max_scored > 1 else best_score - sorted_scores[-2]
+
+    if gap < ppr.GAP_LOWER_BOUND:
+        return max_scored_best if total_max_scored > 1 else max_incount_best
+
+    return best
+
+
+def dense_expected_walks(graph, num_steps):
+    """Expected finished walks (see 'personalized_pagerank_exact') with dense
+    matrices."""
+
+    num_nodes = len(graph)
+    transitions = np.zeros((num_nodes, num_nodes))
+
+    for node in range(num_nodes):
+        neighbors = graph.indices[graph.indptr[node] : graph.indptr[node + 1]]
+
+        if len(neighbors) == 0:
+            transitions[node, node] = 1.0
+
+        else:
+            transitions[node, neighbors] = 1.0 / len(neighbors)
+
+    finished = np.zeros((num_nodes, num_nodes))
+    moved = ppr.WALKERS * transitions
+
+    for step in range(num_steps):
+
+        if step > 0:
+            finished += ppr.TELEPORT * moved
+
+        moved = (1 - ppr.TELEPORT) * moved @ transitions
+
+    return finished
+
+
+def candidate(cand_id, incount, links):
+    return {
+        "id": str(cand_id),
+        "url": f"ID:{cand_id}",
+        "incount": str(incount),
+        "links": links,
+    }
+
+
+def to_dense(num_nodes, finished):
+    dense = np.zeros((num_nodes, num_nodes))
+    dense[finished[0], finished[1]] = finished[2]
+
+    return dense
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("use_ic", [False, True])
+def test_score_candidates_matches_java(seed, use_ic):
+    graph = ppr.DisambiguationGraph.from_candidates(random_doc_entities(seed))
+    node_ic = None
+
+    if use_ic:
+        node_ic = np.random.default_rng(seed).integers(1, 5, len(graph)).astype(float)
+
+    initial_scores = ppr.get_initial_scores(graph, node_ic)
+
+    for finished in (
+        ppr.personalized_pagerank(graph, np.random.default_rng(seed)),
+        ppr.personalized_pagerank_exact(graph),
+    ):
+        scores = ppr.score_candidates(graph, finished, initial_scores)
+        expected = java_combine_ppr(graph, finished, initial_scores)
+
+        np.testing.assert_allclose(scores, expected, rtol=1e-12)
+
+
+def test_select_candidate_matches_java():
+    rng = random.Random(0)
+
+    for _ in range(2000):
+        num_candidates = rng.randint(1, 5)
+        # Few distinct values, so there are ties and gaps below the bound
+        scores = [rng.choice([0.0, 1.0, 1.05, 2.0, 3.5]) for _ in range(num_candidates)]
+        incounts = [rng.randint(0, 2) for _ in range(num_candidates)]
+
+        assert ppr.select_candidate(
+            np.array(scores), np.array(incounts)
+        ) == java_find_best_candidate(scores, incounts), (scores, incounts)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_exact_matches_dense_walks(seed):
+    graph = ppr.DisambiguationGraph.from_candidates(random_doc_entities(seed))
+    finished = ppr.personalized_pagerank_exact(graph, tolerance=0.0, max_iterations=30)
+
+    np.testing.assert_allclose(
+        to_dense(len(graph), finished),
+        dense_expected_walks(graph, 30),
+        rtol=1e-9,
+        atol=1e-9,
+    )
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_monte_carlo_approximates_expected_walks(seed):
+    graph = ppr.DisambiguationGraph.from_candidates(random_doc_entities(seed))
+    finished = ppr.personalized_pagerank(graph, np.random.default_rng(seed))
+
+    # Same seed, same walks
+    for array, repeated in zip(
+        finished, ppr.personalized_pagerank(graph, np.random.default_rng(seed))
+    ):
+        np.testing.assert_array_equal(array, repeated)
+
+    walks = to_dense(len(graph), finished)
+    expected = dense_expected_walks(graph, ppr.ITERATIONS)
+
+    np.testing.assert_allclose(walks.sum(axis=1), expected.sum(axis=1), rtol=0.1)
+    assert np.abs(walks - expected).max() < 0.05 * ppr.WALKERS
+
+
+@pytest.mark.parametrize("mode", ["monte_carlo", "exact"])
+def test_disambiguate_prefers_linked_candidates(mode):
+    # The ambiguous entities have a linked candidate and an unlinked one with
+    # a higher inCount
+    doc_entities = [
+        ("diabetes", [candidate(1, 5, ""), candidate(2, 0, "3;4")]),
+        ("insulin", [candidate(3, 0, "2;4"), candidate(5, 5, "")]),
+        ("glucose", [candidate(4, 0, "2;3")]),
+    ]
+
+    assert ppr.disambiguate(doc_entities, mode=mode) == {
+        "diabetes": "ID:2",
+        "insulin": "ID:3",
+        "glucose": "ID:4",
+    }